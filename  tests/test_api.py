@@ -7,8 +7,18 @@ from unittest.mock import patch
 # Ajouter le répertoire src au path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
 
+# Base et journal de l'application dans un répertoire temporaire, sans instantané
+# (avant l'import de app)
+APP_DIR = tempfile.mkdtemp()
+os.environ.setdefault('BLOCKAGE_DB', os.path.join(APP_DIR, 'security.db'))
+os.environ.setdefault('BLOCKAGE_LOG_FILE', os.path.join(APP_DIR, 'security.log'))
+os.environ.setdefault('BLOCKAGE_SNAPSHOT', '')
+
+import app as web
 from app import app
+from credentials import CredentialsOverloaded
 from database import init_database
+from security_system import AntiBruteForceSystem
 
 class TestAPI(unittest.TestCase):
     
@@ -23,12 +33,22 @@ class TestAPI(unittest.TestCase):
         
         self.client = app.test_client()
         init_database(self.db_path)
+        # État neuf à chaque test : les échecs de 127.0.0.1 ne s'accumulent pas
+        self.original_system = web.security_system
+        web.security_system = AntiBruteForceSystem(self.db_path)
     
     def tearDown(self):
         """Nettoyage après chaque test"""
+        web.security_system.close()
+        web.security_system = self.original_system
         os.close(self.db_fd)
         os.unlink(self.db_path)
     
+    def test_demo_users_disabled_by_default(self):
+        """Test de l'absence des comptes de démonstration par défaut"""
+        self.assertFalse(web.demo_users_enabled)
+        self.assertNotIn('admin123', self.client.get('/').get_data(as_text=True))
+    
     def test_login_success(self):
         """Test une connexion réussie"""
         with patch('app.check_credentials') as mock_check:
@@ -75,6 +95,39 @@ class TestAPI(unittest.TestCase):
             self.assertFalse(data['success'])
             self.assertTrue(data['blocked'])
     
+    def test_login_throttled_account(self):
+        """Test du 429 pour un compte visé par une attaque distribuée"""
+        with patch('app.security_system.check_account', return_value=2.5), \
+             patch('app.check_credentials') as mock_check:
+            response = self.client.post('/api/login', json={'username': 'admin', 'password': 'admin123'})
+
+            data = response.get_json()
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response.headers['Retry-After'], '3')
+            self.assertTrue(data['throttled'])
+            mock_check.assert_not_called()
+    
+    def test_login_shed_when_kdf_overloaded(self):
+        """Test du 503 quand le pool de vérification des mots de passe est saturé"""
+        with patch('app.check_credentials', side_effect=CredentialsOverloaded()):
+            response = self.client.post('/api/login', json={'username': 'admin', 'password': 'admin123'})
+
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.headers['Retry-After'], '1')
+            self.assertFalse(response.get_json()['success'])
+    
+    def test_login_tarpit_rejects_early_retry(self):
+        """Test du 429 pour une tentative anticipée en mode tarpit"""
+        with patch('app.security_system.next_attempt_delay', return_value=1.2), \
+             patch('app.check_credentials') as mock_check:
+            response = self.client.post('/api/login', json={'username': 'admin', 'password': 'wrong'})
+
+            data = response.get_json()
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response.headers['Retry-After'], '2')
+            self.assertTrue(data['tarpit'])
+            mock_check.assert_not_called()
+    
     def test_stats_unauthorized(self):
         """Test l'accès non autorisé aux statistiques"""
         response = self.client.get('/api/stats')
@@ -85,5 +138,90 @@ class TestAPI(unittest.TestCase):
         response = self.client.get('/api/blocked-ips')
         self.assertEqual(response.status_code, 401)
 
+    def test_blocked_ips_etag(self):
+        """Test la revalidation de la liste des IPs bloquées par ETag"""
+        with self.client.session_transaction() as session:
+            session['user'] = 'admin'
+        
+        response = self.client.get('/api/blocked-ips?limit=5')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('items', response.get_json())
+        etag = response.headers['ETag']
+        
+        response = self.client.get('/api/blocked-ips?limit=5', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        
+        response = self.client.get('/api/blocked-ips?cursor=invalide')
+        self.assertEqual(response.status_code, 400)
+        
+        response = self.client.get('/blocked-ips')
+        self.assertEqual(response.status_code, 200)
+    
+    def test_bulk_block_unblock_and_export(self):
+        """Test le blocage en masse, l'export nginx et le déblocage en masse"""
+        with self.client.session_transaction() as session:
+            session['user'] = 'admin'
+        
+        feed = "# flux de menaces\n203.0.113.10\n203.0.113.0/28,Scan\ninvalide\n"
+        response = self.client.post('/api/block-ips?reason=Flux', data=feed, content_type='text/plain')
+        data = response.get_json()
+        self.assertEqual(data['applied'], 2)
+        self.assertEqual(data['invalid'], 1)
+        
+        export = self.client.get('/api/blocked-ips/export?format=nginx').get_data(as_text=True)
+        self.assertIn("deny 203.0.113.10;", export)
+        self.assertIn("deny 203.0.113.0/28;", export)
+        
+        # Un export nginx peut être réimporté tel quel
+        response = self.client.post('/api/unblock-ips', data=export, content_type='text/plain')
+        self.assertGreaterEqual(response.get_json()['applied'], 2)
+        response = self.client.post('/api/unblock-ips', json={'ips': ['203.0.113.10']})
+        self.assertTrue(response.get_json()['success'])
+        response = self.client.post('/api/unblock-ips', json=['203.0.113.10'])
+        self.assertTrue(response.get_json()['success'])
+        self.assertEqual(self.client.post('/api/block-ips', json='203.0.113.10').status_code, 400)
+        self.assertEqual(self.client.post('/api/block-ips', json={'ips': '203.0.113.10'}).status_code, 400)
+        
+        export = self.client.get('/api/blocked-ips/export?format=txt').get_data(as_text=True)
+        self.assertNotIn("203.0.113.", export)
+        self.assertEqual(self.client.get('/api/blocked-ips/export?format=xml').status_code, 400)
+    
+    def test_history(self):
+        """Test de l'historique agrégé"""
+        response = self.client.get('/api/history')
+        self.assertEqual(response.status_code, 401)
+        
+        with self.client.session_transaction() as session:
+            session['user'] = 'admin'
+        
+        response = self.client.get('/api/history?from=0&to=7200&granularity=hour')
+        data = response.get_json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([point['time'] for point in data['series']], [0, 3600])
+        
+        response = self.client.get('/api/history?granularity=week')
+        self.assertEqual(response.status_code, 400)
+    
+    def test_metrics_endpoint(self):
+        """Test l'exposition des métriques Prometheus"""
+        with patch('app.check_credentials') as mock_check:
+            mock_check.return_value = False
+            self.client.post('/api/login', json={'username': 'admin', 'password': 'wrong'})
+        
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 401)
+        
+        with patch('app.METRICS_TOKEN', 'jeton'):
+            response = self.client.get('/metrics', headers={'Authorization': 'Bearer autre'})
+            self.assertEqual(response.status_code, 401)
+            response = self.client.get('/metrics', headers={'Authorization': 'Bearer jeton'})
+        body = response.get_data(as_text=True)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('text/plain', response.content_type)
+        self.assertIn('blockage_login_request_seconds_count{outcome="bad_credentials"}', body)
+        self.assertIn('blockage_check_stage_seconds_bucket{stage="blocklist",le="+Inf"}', body)
+        self.assertIn('blockage_blocked_ips ', body)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
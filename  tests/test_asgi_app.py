@@ -0,0 +1,169 @@
+import unittest
+import asyncio
+import json
+import tempfile
+import os
+import sys
+from unittest.mock import patch
+
+# Ajouter le répertoire src au path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Base et journal de l'application dans un répertoire temporaire, sans instantané
+# (avant l'import de app)
+APP_DIR = tempfile.mkdtemp()
+os.environ.setdefault('BLOCKAGE_DB', os.path.join(APP_DIR, 'security.db'))
+os.environ.setdefault('BLOCKAGE_LOG_FILE', os.path.join(APP_DIR, 'security.log'))
+os.environ.setdefault('BLOCKAGE_SNAPSHOT', '')
+
+import app as web
+from asgi_app import AsyncLoginAPI
+from fast_reject import TrustedProxies
+from security_system import AntiBruteForceSystem
+
+def call(asgi, method, path, body=b'', headers=(), client=('203.0.113.7', 40000), sent=None):
+    """Appelle l'application ASGI, renvoie (statut, en-têtes, corps) ; `sent` reçoit les messages émis"""
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'query_string': b'',
+        'headers': list(headers), 'client': client, 'server': ('testserver', 80),
+    }
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = [] if sent is None else sent
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi(scope, receive, send))
+    start = sent[0]
+    return start['status'], dict(start['headers']), b''.join(m.get('body', b'') for m in sent[1:])
+
+def login(asgi, username, password, **kwargs):
+    body = json.dumps({'username': username, 'password': password}).encode()
+    return call(asgi, 'POST', '/api/login', body, [(b'content-type', b'application/json')], **kwargs)
+
+class TestAsgiApp(unittest.TestCase):
+
+    def setUp(self):
+        """Configuration avant chaque test"""
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.original_system = web.security_system
+        web.security_system = AntiBruteForceSystem(self.db_path)
+        web.credential_store.seed_users(web.DEMO_USERS)
+        self.asgi = AsyncLoginAPI(max_workers=2)
+
+    def tearDown(self):
+        """Nettoyage après chaque test"""
+        self.asgi.shutdown()
+        web.security_system.close()
+        web.security_system = self.original_system
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def test_login_and_session_cookie(self):
+        """Test d'une connexion réussie puis de l'accès aux statistiques avec le cookie de session"""
+        status, headers, body = login(self.asgi, 'admin', 'admin123')
+        self.assertEqual(status, 200)
+        self.assertTrue(json.loads(body)['success'])
+
+        cookie = headers[b'set-cookie'].split(b';')[0]
+        status, _, body = call(self.asgi, 'GET', '/api/stats', headers=[(b'cookie', cookie)])
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)['total_attempts'], 1)
+
+        # Le cookie est aussi accepté par l'application Flask
+        client = web.app.test_client()
+        client.set_cookie('session', cookie.split(b'=', 1)[1].decode())
+        self.assertEqual(client.get('/api/blocked-ips').status_code, 200)
+
+    def test_unauthorized_without_session(self):
+        """Test du refus des routes d'administration sans session valide"""
+        self.assertEqual(call(self.asgi, 'GET', '/api/stats')[0], 401)
+        self.assertEqual(call(self.asgi, 'GET', '/api/blocked-ips', headers=[(b'cookie', b'session=forged')])[0], 401)
+
+    def test_blocking_after_failures(self):
+        """Test du blocage partagé avec la logique du mode threadé"""
+        with patch('app.check_credentials', return_value=False):
+            for _ in range(web.security_system.max_attempts):
+                status, _, body = login(self.asgi, 'admin', 'wrong')
+                self.assertEqual(status, 200)
+
+            status, _, body = login(self.asgi, 'admin', 'wrong')
+        self.assertEqual(status, 403)
+        self.assertTrue(json.loads(body)['blocked'])
+        self.assertTrue(web.security_system.is_ip_blocked('203.0.113.7'))
+
+    def test_tarpit_defers_failures_on_the_loop(self):
+        """Test du mode tarpit : échec répondu après le délai, sans 429"""
+        tarpit = web.security_system.tarpit
+        tarpit.enabled, tarpit.base_delay = True, 0.1
+        with patch('app.check_credentials', return_value=False):
+            for _ in range(3):
+                status, _, body = login(self.asgi, 'admin', 'wrong')
+                self.assertEqual(status, 200)
+                self.assertNotIn('next_attempt_in', json.loads(body))
+        self.assertFalse(web.security_system.is_ip_blocked('203.0.113.7'))
+
+        # Capacité d'attente épuisée : 429 immédiat
+        self.asgi.max_tarpitted = 0
+        tarpit.penalize('203.0.113.7', 5)
+        status, headers, body = login(self.asgi, 'admin', 'wrong')
+        self.assertEqual(status, 429)
+        self.assertIn(b'retry-after', headers)
+
+    def test_trusted_proxy_forwarded_for(self):
+        """Test de la résolution de l'adresse du client derrière un proxy de confiance"""
+        asgi = AsyncLoginAPI(max_workers=2, trusted_proxies=TrustedProxies(['127.0.0.1']))
+        proxy = ('127.0.0.1', 50000)
+        forwarded = [(b'x-forwarded-for', b'198.51.100.9')]
+        try:
+            with patch('app.check_credentials', return_value=False):
+                status, _, _ = call(asgi, 'POST', '/api/login',
+                                    json.dumps({'username': 'admin', 'password': 'x'}).encode(),
+                                    [(b'content-type', b'application/json')] + forwarded, client=proxy)
+            self.assertEqual(status, 200)
+            self.assertEqual(web.security_system.get_recent_failed_attempts('198.51.100.9'), 1)
+            self.assertEqual(web.security_system.get_recent_failed_attempts('127.0.0.1'), 0)
+
+            web.security_system.block_ip('198.51.100.9', 'Test')
+            status, _, _ = call(asgi, 'POST', '/api/login', b'{}', forwarded, client=proxy)
+            self.assertEqual(status, 403)
+            # X-Forwarded-For d'un client direct est ignoré
+            status, _, _ = call(asgi, 'POST', '/api/login', b'{}', forwarded)
+            self.assertEqual(status, 400)
+        finally:
+            asgi.shutdown()
+
+    def test_invalid_json(self):
+        """Test d'une requête sans JSON valide"""
+        status, _, body = call(self.asgi, 'POST', '/api/login', b'not json')
+        self.assertEqual(status, 400)
+        self.assertFalse(json.loads(body)['success'])
+
+    def test_forwards_other_routes_to_flask(self):
+        """Test du relais des autres routes vers l'application Flask"""
+        self.assertEqual(call(self.asgi, 'GET', '/metrics')[0], 401)
+        with patch('app.METRICS_TOKEN', 'jeton'):
+            status, headers, body = call(self.asgi, 'GET', '/metrics', headers=[(b'authorization', b'Bearer jeton')])
+        self.assertEqual(status, 200)
+        self.assertIn(b'blockage_login_request_seconds', body)
+
+    def test_forwarded_response_is_streamed(self):
+        """Test de la transmission par morceaux d'une réponse relayée (export de la liste)"""
+        for i in range(50):
+            web.security_system.block_ip(f'192.0.2.{i}', 'test')
+        cookie = login(self.asgi, 'admin', 'admin123')[1][b'set-cookie'].split(b';')[0]
+        self.asgi.forward_chunk = 64
+        sent = []
+        status, _, body = call(self.asgi, 'GET', '/api/blocked-ips/export', headers=[(b'cookie', cookie)], sent=sent)
+        self.assertEqual(status, 200)
+        self.assertEqual(body.count(b'192.0.2.'), 50)
+        chunks = sent[1:]
+        self.assertGreater(len(chunks), 2)
+        self.assertTrue(all(m['more_body'] for m in chunks[:-1]))
+        self.assertFalse(chunks[-1]['more_body'])
+
+if __name__ == '__main__':
+    unittest.main()
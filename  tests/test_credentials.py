@@ -0,0 +1,120 @@
+import unittest
+import tempfile
+import os
+import sys
+from concurrent.futures import Future
+
+# Ajouter le répertoire src au path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from credentials import (CredentialStore, CredentialsOverloaded, hash_password,
+                         needs_rehash, verify_password)
+from database import ConnectionPool, migrate_database
+
+# Paramètres scrypt réduits pour des tests rapides
+FAST_PARAMS = (2 ** 4, 8, 1)
+
+class TestCredentialStore(unittest.TestCase):
+
+    def setUp(self):
+        """Configuration avant chaque test"""
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        migrate_database(self.db_path)
+        self.pool = ConnectionPool(self.db_path)
+        self.store = CredentialStore(self.pool, params=FAST_PARAMS, max_workers=0)
+
+    def tearDown(self):
+        """Nettoyage après chaque test"""
+        self.store.close()
+        self.pool.close()
+        os.close(self.db_fd)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_path + suffix):
+                os.unlink(self.db_path + suffix)
+
+    def stored_hash(self, username):
+        with self.pool.connection() as conn:
+            return conn.execute('SELECT password_hash FROM users WHERE username = ?', (username,)).fetchone()[0]
+
+    def test_hash_format(self):
+        """Test du format de hachage, paramètres inclus et sel aléatoire"""
+        encoded = hash_password('secret', FAST_PARAMS)
+        self.assertTrue(encoded.startswith('scrypt$16$8$1$'))
+        self.assertNotEqual(encoded, hash_password('secret', FAST_PARAMS))
+        self.assertTrue(verify_password('secret', encoded))
+        self.assertFalse(verify_password('Secret', encoded))
+        self.assertTrue(needs_rehash(encoded, (2 ** 5, 8, 1)))
+
+    def test_verify(self):
+        """Test de la vérification : mot de passe, mot de passe faux, utilisateur inconnu"""
+        self.store.seed_users({'admin': 'admin123'})
+        self.assertNotIn('admin123', self.stored_hash('admin'))
+
+        self.assertTrue(self.store.verify('admin', 'admin123'))
+        self.assertFalse(self.store.verify('admin', 'wrong'))
+        self.assertFalse(self.store.verify('nobody', 'admin123'))
+        self.assertFalse(self.store.verify('', ''))
+
+        # Les reconnexions réussies passent par le cache, les échecs jamais
+        self.assertEqual(self.store.get_stats()['cached'], 1)
+
+        self.store.set_password('admin', 'changed')
+        self.assertFalse(self.store.verify('admin', 'admin123'))
+        self.assertTrue(self.store.verify('admin', 'changed'))
+
+    def test_rehash_on_login(self):
+        """Test du rehachage quand les paramètres changent"""
+        self.store.set_password('alice', 'pw')
+        old_hash = self.stored_hash('alice')
+
+        upgraded = CredentialStore(self.pool, params=(2 ** 5, 8, 1), max_workers=0)
+        self.assertFalse(upgraded.verify('alice', 'wrong'))
+        self.assertEqual(self.stored_hash('alice'), old_hash)
+
+        self.assertTrue(upgraded.verify('alice', 'pw'))
+        self.assertTrue(self.stored_hash('alice').startswith('scrypt$32$8$1$'))
+        self.assertTrue(upgraded.verify('alice', 'pw'))
+
+    def test_shedding(self):
+        """Test du délestage quand les vérifications en file atteignent le plafond"""
+        store = CredentialStore(self.pool, params=FAST_PARAMS, max_workers=0, max_pending=1)
+        store.set_password('bob', 'pw')
+        store._slots.acquire()
+        try:
+            with self.assertRaises(CredentialsOverloaded):
+                store.verify('bob', 'pw')
+        finally:
+            store._slots.release()
+        self.assertEqual(store.get_stats()['shed'], 1)
+        self.assertTrue(store.verify('bob', 'pw'))
+
+    def test_stalled_pool(self):
+        """Test du délestage quand le pool de hachage ne répond pas dans le délai"""
+        class StalledExecutor:
+            def submit(self, *args):
+                return Future()
+
+            def shutdown(self, **kwargs):
+                pass
+
+        store = CredentialStore(self.pool, params=FAST_PARAMS, max_workers=1, timeout=0.01)
+        store.set_password('dave', 'pw')
+        store._executor = StalledExecutor()
+        with self.assertRaises(CredentialsOverloaded):
+            store.verify('dave', 'pw')
+        self.assertEqual(store.get_stats()['shed'], 1)
+        self.assertEqual(store.get_stats()['pending'], 0)
+        store.close()
+
+    def test_process_pool(self):
+        """Test de la vérification dans le pool de processus"""
+        store = CredentialStore(self.pool, params=FAST_PARAMS, max_workers=1)
+        try:
+            store.set_password('carol', 'pw')
+            self.assertTrue(store.verify('carol', 'pw'))
+            self.assertFalse(store.verify('carol', 'nope'))
+        finally:
+            store.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import unittest
+import tempfile
+import os
+import sys
+import sqlite3
+import threading
+from datetime import datetime
+
+# Ajouter le répertoire src au path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from database import init_database, migrate_database, ConnectionPool, SCHEMA_VERSION
+
+class TestDatabase(unittest.TestCase):
+    
+    def setUp(self):
+        """Configuration avant chaque test"""
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        init_database(self.db_path)
+        self.pool = ConnectionPool(self.db_path)
+    
+    def tearDown(self):
+        """Nettoyage après chaque test"""
+        self.pool.close()
+        os.close(self.db_fd)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_path + suffix):
+                os.unlink(self.db_path + suffix)
+    
+    def test_pool_pragmas(self):
+        """Test la configuration WAL des connexions du pool"""
+        with self.pool.connection() as conn:
+            self.assertEqual(conn.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+            self.assertEqual(conn.execute('PRAGMA synchronous').fetchone()[0], 1)
+            self.assertEqual(conn.execute('PRAGMA busy_timeout').fetchone()[0], 5000)
+            # Base créée par les migrations : auto_vacuum incrémental
+            self.assertEqual(conn.execute('PRAGMA auto_vacuum').fetchone()[0], 2)
+    
+    def test_pool_reuses_connections(self):
+        """Test la réutilisation des connexions entre threads"""
+        with self.pool.connection() as conn:
+            first = conn
+        
+        seen = []
+        def worker():
+            with self.pool.connection() as conn:
+                seen.append(conn)
+        
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+        self.assertIs(seen[0], first)
+    
+    def test_pool_rollback_on_error(self):
+        """Test l'annulation de la transaction en cas d'erreur"""
+        with self.assertRaises(RuntimeError):
+            with self.pool.connection() as conn:
+                conn.execute("INSERT INTO login_attempts (ip_address) VALUES ('10.0.0.1')")
+                raise RuntimeError("échec")
+        
+        with self.pool.connection() as conn:
+            count = conn.execute('SELECT COUNT(*) FROM login_attempts').fetchone()[0]
+        self.assertEqual(count, 0)
+
+    def test_migrations_idempotent(self):
+        """Test la version du schéma et la création des index"""
+        self.assertEqual(migrate_database(self.db_path), [])
+        
+        with self.pool.connection() as conn:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            indexes = {row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'"
+            )}
+            plan = conn.execute(
+                'EXPLAIN QUERY PLAN SELECT COUNT(*) FROM login_attempts '
+                'WHERE ip_address = ? AND success = 0 AND attempt_time > ?',
+                ('10.0.0.1', 0)
+            ).fetchall()
+        
+        self.assertEqual(version, SCHEMA_VERSION)
+        self.assertIn('idx_login_attempts_ip_success_time', indexes)
+        self.assertIn('idx_blocked_ips_unblock_time', indexes)
+        self.assertIn('idx_login_attempts_ip_success_time', str(plan))
+    
+    def test_legacy_timestamps_converted(self):
+        """Test la conversion des horodatages ISO d'une ancienne base"""
+        fd, legacy_path = tempfile.mkstemp()
+        try:
+            attempt_time = datetime(2024, 5, 1, 12, 30, 0)
+            with sqlite3.connect(legacy_path) as conn:
+                conn.execute('''CREATE TABLE login_attempts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, ip_address TEXT NOT NULL,
+                    username TEXT, success INTEGER DEFAULT 0,
+                    attempt_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+                conn.execute('''CREATE TABLE blocked_ips (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, ip_address TEXT NOT NULL UNIQUE,
+                    block_reason TEXT, block_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    unblock_time TIMESTAMP)''')
+                conn.execute(
+                    'INSERT INTO login_attempts (ip_address, username, success, attempt_time) VALUES (?, ?, ?, ?)',
+                    ('10.0.0.1', 'admin', 0, attempt_time.isoformat(' '))
+                )
+            
+            migrate_database(legacy_path)
+            
+            with sqlite3.connect(legacy_path) as conn:
+                stored = conn.execute('SELECT attempt_time FROM login_attempts').fetchone()[0]
+            self.assertEqual(stored, int(attempt_time.timestamp()))
+        finally:
+            os.close(fd)
+            os.unlink(legacy_path)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import unittest
+import asyncio
+import json
+import tempfile
+import os
+import sys
+import threading
+
+# Ajouter le répertoire src au path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Base et journal de l'application dans un répertoire temporaire, sans instantané
+# (avant l'import de app)
+APP_DIR = tempfile.mkdtemp()
+os.environ.setdefault('BLOCKAGE_DB', os.path.join(APP_DIR, 'security.db'))
+os.environ.setdefault('BLOCKAGE_LOG_FILE', os.path.join(APP_DIR, 'security.log'))
+os.environ.setdefault('BLOCKAGE_SNAPSHOT', '')
+
+from event_broker import EventBroker, StatsPublisher, format_sse
+from security_system import AntiBruteForceSystem
+
+class TestEventBroker(unittest.TestCase):
+
+    def test_publish_to_all_subscribers(self):
+        """Test de la diffusion d'un événement à tous les abonnés"""
+        broker = EventBroker()
+        first, second = broker.subscribe(), broker.subscribe()
+
+        broker.publish('block', {'ip_address': '10.0.0.1'})
+
+        for subscription in (first, second):
+            event_id, event_type, data = subscription.get(timeout=1)
+            self.assertEqual(event_type, 'block')
+            self.assertEqual(data['ip_address'], '10.0.0.1')
+        self.assertIsNone(first.get(timeout=0.01))
+
+        first.close()
+        self.assertEqual(broker.subscriber_count(), 1)
+
+    def test_slow_subscriber_gets_resync(self):
+        """Test de la file bornée : un abonné en retard reçoit 'resync'"""
+        broker = EventBroker(max_pending=3)
+        subscription = broker.subscribe()
+        for n in range(5):
+            broker.publish('block', {'n': n})
+
+        self.assertEqual(subscription.get(timeout=1)[1], 'resync')
+        self.assertIsNone(subscription.get(timeout=0.01))
+
+    def test_stats_publisher_sends_deltas(self):
+        """Test des deltas de statistiques et de l'état complet pour les nouveaux abonnés"""
+        stats = {'blocked_ips': 0, 'total_attempts': 1}
+        publisher = StatsPublisher(EventBroker(), lambda: dict(stats), interval=3600)
+
+        early = publisher.subscribe()
+        self.assertEqual(early.get(timeout=1)[2], {'blocked_ips': 0, 'total_attempts': 1})
+
+        stats['total_attempts'] = 2
+        self.assertEqual(publisher.publish_changes(), {'total_attempts': 2})
+        self.assertEqual(early.get(timeout=1)[2], {'total_attempts': 2})
+        self.assertEqual(publisher.publish_changes(), {})
+
+        late = publisher.subscribe()
+        self.assertEqual(late.get(timeout=1)[2], {'blocked_ips': 0, 'total_attempts': 2})
+
+    def test_async_subscriber(self):
+        """Test de la réception depuis une boucle asyncio d'un événement publié par un thread"""
+        broker = EventBroker()
+        subscription = broker.subscribe()
+
+        async def receive():
+            waiting = asyncio.ensure_future(subscription.aget(timeout=5))
+            await asyncio.sleep(0)
+            threading.Thread(target=broker.publish, args=('unblock', {'ip_address': '10.0.0.2'})).start()
+            return await waiting
+
+        self.assertEqual(asyncio.run(receive())[1], 'unblock')
+
+    def test_publish_survives_closed_subscriber_loop(self):
+        """Test d'une publication vers un abonné dont la boucle asyncio est fermée"""
+        broker = EventBroker()
+        subscription = broker.subscribe()
+        self.assertIsNone(asyncio.run(subscription.aget(timeout=0)))
+
+        broker.publish('block', {'ip_address': '10.0.0.3'})
+        self.assertEqual(subscription.get(timeout=0)[1], 'block')
+
+    def test_security_system_publishes_blocks(self):
+        """Test des événements de blocage et de déblocage émis par le système"""
+        db_fd, db_path = tempfile.mkstemp()
+        system = AntiBruteForceSystem(db_path)
+        try:
+            subscription = system.events.subscribe()
+            system.block_ip('192.0.2.5', 'Test')
+            system.unblock_ip('192.0.2.5')
+
+            _, event_type, data = subscription.get(timeout=1)
+            self.assertEqual(event_type, 'block')
+            self.assertEqual(data['ip_address'], '192.0.2.5')
+            self.assertEqual(data['reason'], 'Test')
+            self.assertEqual(subscription.get(timeout=1)[1], 'unblock')
+        finally:
+            system.close()
+            os.close(db_fd)
+            os.unlink(db_path)
+
+    def test_sse_format(self):
+        """Test du format text/event-stream"""
+        text = format_sse((7, 'stats', {'total_attempts': 3})).decode()
+        self.assertEqual(text, 'id: 7\nevent: stats\ndata: {"total_attempts":3}\n\n')
+
+class TestEventsEndpoint(unittest.TestCase):
+
+    def test_events_stream(self):
+        """Test du flux SSE du tableau de bord"""
+        from app import app
+        client = app.test_client()
+        self.assertEqual(client.get('/api/events').status_code, 401)
+
+        with client.session_transaction() as session:
+            session['user'] = 'admin'
+        response = client.get('/api/events', buffered=False)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+
+        chunks = iter(response.response)
+        self.assertTrue(next(chunks).startswith(b'retry:'))
+        stats_event = next(chunks).decode()
+        self.assertIn('event: stats', stats_event)
+        self.assertIn('total_attempts', json.loads(stats_event.split('data: ', 1)[1]))
+        response.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import json
+import os
+import sys
+import time
+
+# Ajouter le répertoire src au path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from fast_reject import FastRejectMiddleware, TrustedProxies
+
+class TestFastReject(unittest.TestCase):
+
+    def setUp(self):
+        """Configuration avant chaque test"""
+        self.blocked = {'203.0.113.9': time.time() + 120}
+        self.seen = []
+
+        def application(environ, start_response):
+            self.seen.append(environ['REMOTE_ADDR'])
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return [b'ok']
+
+        self.middleware = FastRejectMiddleware(
+            application, self.blocked.get, TrustedProxies(['127.0.0.1', '10.0.0.0/8'])
+        )
+
+    def call(self, path='/api/login', **environ):
+        environ.setdefault('REMOTE_ADDR', '198.51.100.1')
+        environ['PATH_INFO'] = path
+        response = {}
+
+        def start_response(status, headers):
+            response['status'] = status
+            response['headers'] = dict(headers)
+
+        body = b''.join(self.middleware(environ, start_response))
+        return response['status'], response['headers'], body
+
+    def test_blocked_ip_rejected_before_app(self):
+        """Test du rejet d'une IP bloquée sans appel à l'application"""
+        status, headers, body = self.call(REMOTE_ADDR='203.0.113.9')
+
+        self.assertTrue(status.startswith('403'))
+        self.assertTrue(json.loads(body)['blocked'])
+        self.assertIn(int(headers['Retry-After']), (119, 120))
+        self.assertEqual(self.seen, [])
+
+    def test_allowed_ip_and_other_paths_pass_through(self):
+        """Test du passage des IPs non bloquées et des routes non protégées"""
+        self.assertTrue(self.call()[0].startswith('200'))
+        self.assertTrue(self.call('/dashboard', REMOTE_ADDR='203.0.113.9')[0].startswith('200'))
+        self.assertEqual(len(self.seen), 2)
+
+    def test_trusted_forwarded_for(self):
+        """Test de la prise en compte de X-Forwarded-For des seuls proxies de confiance"""
+        status, _, _ = self.call(REMOTE_ADDR='127.0.0.1', HTTP_X_FORWARDED_FOR='203.0.113.9, 10.1.2.3')
+        self.assertTrue(status.startswith('403'))
+
+        # Un client direct ne peut pas usurper une autre adresse
+        status, _, _ = self.call(REMOTE_ADDR='198.51.100.1', HTTP_X_FORWARDED_FOR='192.0.2.1')
+        self.assertTrue(status.startswith('200'))
+        self.assertEqual(self.seen, ['198.51.100.1'])
+
+        # L'adresse résolue est transmise à l'application
+        self.call(REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='192.0.2.1, 198.51.100.7')
+        self.assertEqual(self.seen[-1], '198.51.100.7')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -22,6 +22,7 @@ class TestIntegration(unittest.TestCase):
     
     def tearDown(self):
         """Nettoyage après chaque test"""
+        self.security_system.close()
         os.close(self.db_fd)
         os.unlink(self.db_path)
     
@@ -0,0 +1,61 @@
+import unittest
+import json
+import logging
+import os
+import queue
+import sys
+
+# Ajouter le répertoire src au path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from logging_setup import JsonLinesFormatter, PerIPRateLimitFilter, NonBlockingQueueHandler
+
+def make_record(msg, args=(), level=logging.WARNING, **extra):
+    record = logging.LogRecord('security', level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+class TestLoggingSetup(unittest.TestCase):
+
+    def test_json_lines_format(self):
+        """Test du format JSON compact avec les champs structurés"""
+        record = make_record("Échec connexion: %s depuis %s", ('admin', '10.0.0.1'), ip='10.0.0.1', username='admin')
+        entry = json.loads(JsonLinesFormatter().format(record))
+
+        self.assertEqual(entry['msg'], "Échec connexion: admin depuis 10.0.0.1")
+        self.assertEqual(entry['level'], 'WARNING')
+        self.assertEqual(entry['ip'], '10.0.0.1')
+        self.assertEqual(entry['username'], 'admin')
+        self.assertNotIn('args', entry)
+
+    def test_rate_limit_per_ip(self):
+        """Test de la limitation des messages répétitifs par IP"""
+        rate_limit = PerIPRateLimitFilter(burst=3, interval=60.0)
+
+        passed = [rate_limit.filter(make_record("Échec %s", ('x',), ip='10.0.0.1')) for _ in range(10)]
+        self.assertEqual(passed.count(True), 3)
+
+        # Une autre IP, les messages sans IP et les erreurs ne sont pas limités
+        self.assertTrue(rate_limit.filter(make_record("Échec %s", ('x',), ip='10.0.0.2')))
+        self.assertTrue(rate_limit.filter(make_record("Démarrage")))
+        self.assertTrue(rate_limit.filter(make_record("Erreur", level=logging.ERROR, ip='10.0.0.1')))
+
+        # À l'intervalle suivant, le nombre de messages supprimés est reporté
+        rate_limit.interval = 0
+        record = make_record("Échec %s", ('x',), ip='10.0.0.1')
+        self.assertTrue(rate_limit.filter(record))
+        self.assertEqual(record.suppressed, 7)
+
+    def test_queue_handler_never_blocks(self):
+        """Test de l'abandon des enregistrements quand la file est pleine"""
+        handler = NonBlockingQueueHandler(queue.Queue(maxsize=2))
+        for _ in range(5):
+            handler.emit(make_record("Échec %s", ('x',)))
+
+        self.assertEqual(handler.queue.qsize(), 2)
+        self.assertEqual(handler.dropped, 3)
+        # Le formatage est laissé au thread du listener
+        self.assertEqual(handler.queue.get_nowait().args, ('x',))
+
+if __name__ == '__main__':
+    unittest.main()
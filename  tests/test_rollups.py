@@ -0,0 +1,84 @@
+import unittest
+import tempfile
+import os
+import sys
+
+# Ajouter le répertoire src au path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from database import ConnectionPool, migrate_database
+from rollups import RollupPipeline
+
+DAY = 24 * 3600
+
+class TestRollups(unittest.TestCase):
+
+    def setUp(self):
+        """Configuration avant chaque test"""
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        migrate_database(self.db_path)
+        self.db = ConnectionPool(self.db_path)
+        self.now = 1_700_000_000 - 1_700_000_000 % DAY + 12 * 3600
+        self.pipeline = RollupPipeline(self.db, batch_size=4)
+
+    def tearDown(self):
+        """Nettoyage après chaque test"""
+        self.db.close()
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def insert_attempts(self, rows):
+        with self.db.connection() as conn:
+            conn.executemany(
+                'INSERT INTO login_attempts (ip_address, username, success, attempt_time) VALUES (?, ?, ?, ?)',
+                rows
+            )
+
+    def test_incremental_rollup(self):
+        """Test de l'agrégation par lots, reprise au filigrane sans double comptage"""
+        self.insert_attempts(
+            [('192.0.2.%d' % i, 'Alice', 0, self.now - 7200 + i) for i in range(5)]
+            + [('192.0.2.50', 'bob', 1, self.now - 60)]
+        )
+        self.assertEqual(self.pipeline.run(now=self.now), 6)
+        self.assertEqual(self.pipeline.run(now=self.now), 0)
+
+        self.insert_attempts([('198.51.100.7', 'alice', 0, self.now - 30)])
+        self.assertEqual(self.pipeline.run(now=self.now), 1)
+
+        # Un nouveau pipeline reprend au filigrane stocké en base
+        self.assertEqual(RollupPipeline(self.db).last_attempt_id, 7)
+
+        history = self.pipeline.query(self.now - 3 * 3600, self.now, granularity='hour')
+        self.assertEqual(len(history['series']), 3)
+        self.assertEqual(sum(point['attempts'] for point in history['series']), 7)
+        self.assertEqual(history['series'][1]['failures'], 5)
+
+        alice = self.pipeline.query(self.now - DAY, self.now + DAY, granularity='day',
+                                    dimension='username', item='ALICE ')
+        self.assertEqual([point['failures'] for point in alice['series']], [0, 6, 0])
+
+        top = self.pipeline.query(self.now - DAY, self.now, granularity='hour', dimension='prefix')
+        self.assertEqual(top['top'][0], {'key': '192.0.2.0/24', 'attempts': 6, 'failures': 5})
+
+    def test_retention_and_validation(self):
+        """Test de la rétention par granularité et du rejet des plages invalides"""
+        self.insert_attempts([('192.0.2.1', 'alice', 0, self.now - 10 * DAY)])
+        self.pipeline.run(now=self.now)
+
+        with self.db.connection() as conn:
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM rollup_minute').fetchone()[0], 0)
+            self.assertGreater(conn.execute('SELECT COUNT(*) FROM rollup_hour').fetchone()[0], 0)
+
+        self.assertEqual(RollupPipeline.choose_granularity(self.now - 3600, self.now, now=self.now), 'minute')
+        self.assertEqual(RollupPipeline.choose_granularity(self.now - 30 * DAY, self.now, now=self.now), 'hour')
+        self.assertEqual(RollupPipeline.choose_granularity(self.now - 365 * DAY, self.now, now=self.now), 'day')
+        with self.assertRaises(ValueError):
+            self.pipeline.query(self.now - 30 * DAY, self.now, granularity='minute')
+        with self.assertRaises(ValueError):
+            self.pipeline.query(self.now - 3600, self.now, granularity='minute', dimension='ip')
+        with self.assertRaises(ValueError):
+            self.pipeline.query(self.now, self.now - 3600)
+
+if __name__ == '__main__':
+    unittest.main()
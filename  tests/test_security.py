@@ -2,12 +2,21 @@ import unittest
 import tempfile
 import os
 import sys
+import time
+import threading
 from datetime import datetime, timedelta
+from unittest.mock import patch
 
 # Ajouter le répertoire src au path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
 
 from security_system import AntiBruteForceSystem
+from sliding_window import SlidingWindowCounter
+from ip_state import IPStateTable, ip_key
+from blocklist import BlocklistIndex
+from offense_history import OffenseHistory
+from account_guard import AccountGuard
+from tarpit import Tarpit
 from database import init_database
 
 class TestAntiBruteForce(unittest.TestCase):
@@ -23,6 +32,7 @@ class TestAntiBruteForce(unittest.TestCase):
     
     def tearDown(self):
         """Nettoyage après chaque test"""
+        self.security_system.close()
         os.close(self.db_fd)
         os.unlink(self.db_path)
     
@@ -90,6 +100,393 @@ class TestAntiBruteForce(unittest.TestCase):
         # Vérifier qu'elle n'est plus bloquée
         self.assertFalse(self.security_system.is_ip_blocked(ip))
     
+    def test_failed_attempts_window(self):
+        """Test l'expiration des échecs hors de la fenêtre glissante"""
+        ip = "192.168.1.106"
+        now = time.time()
+        counter = SlidingWindowCounter()
+        
+        counter.hit(ip, 60, now - 120)
+        counter.hit(ip, 60, now - 30)
+        counter.hit(ip, 60, now - 10)
+        
+        self.assertEqual(counter.count(ip, 60, now), 2)
+        self.assertEqual(counter.count(ip, 20, now), 1)
+        self.assertEqual(counter.count(ip, 5, now), 0)
+        self.assertEqual(len(counter), 0)
+    
+    def test_failed_attempts_rebuilt_at_startup(self):
+        """Test la reconstruction du compteur en mémoire depuis la base"""
+        ip = "192.168.1.107"
+        
+        for i in range(2):
+            self.security_system.record_login_attempt(ip, "testuser", False)
+        self.security_system.attempt_writer.flush()
+        
+        restarted = AntiBruteForceSystem(self.db_path)
+        self.assertEqual(restarted.get_recent_failed_attempts(ip), 2)
+        restarted.close()
+    
+    def test_blocklist_rebuilt_at_startup(self):
+        """Test le rechargement de la liste de blocage résidente"""
+        ip = "192.168.1.108"
+        self.security_system.block_ip(ip, "Test")
+        
+        restarted = AntiBruteForceSystem(self.db_path)
+        self.assertTrue(restarted.is_ip_blocked(ip))
+        self.assertFalse(restarted.is_ip_blocked("192.168.1.109"))
+        restarted.close()
+    
+    def test_repeat_offenders_escalate(self):
+        """Test des blocages progressifs pour les récidivistes"""
+        ip = "192.168.1.120"
+        system = self.security_system
+
+        self.assertTrue(system.block_ip(ip, "Test"))
+        first = system.get_blocked_ips()[0]
+        self.assertEqual(first['offense_level'], 1)
+
+        # Nouveau blocage : niveau 2 (6 heures), l'historique survit au redémarrage
+        system.block_ip(ip, "Test")
+        page = system.get_blocked_ips_page()
+        self.assertEqual(page['items'][0]['offense_level'], 2)
+        self.assertEqual(page['items'][0]['unblock_time'] - page['items'][0]['block_time'], 6 * 3600)
+
+        restarted = AntiBruteForceSystem(self.db_path)
+        self.assertEqual(restarted.offenses.level(ip), 2)
+        allowed, message = restarted.check_and_block(ip, "user")
+        self.assertFalse(allowed)
+        self.assertIn("6 heures", message)
+        restarted.close()
+
+        # Un déblocage manuel efface les antécédents
+        system.unblock_ip(ip)
+        self.assertEqual(system.offenses.level(ip), 0)
+        system.block_ip(ip, "Test")
+        self.assertEqual(system.get_blocked_ips()[0]['offense_level'], 1)
+
+    def test_distributed_attack_on_account(self):
+        """Test du ralentissement d'un compte visé depuis de nombreuses IPs"""
+        system = self.security_system
+        system.accounts.threshold = 5
+
+        # Une seule tentative par IP : aucune IP n'atteint le seuil de blocage
+        for n in range(5):
+            system.record_login_attempt(f"198.51.100.{n}", "Alice", False)
+            self.assertTrue(system.check_and_block(f"198.51.100.{n}", "alice")[0])
+
+        self.assertGreater(system.check_account("alice"), 0)
+        self.assertEqual(system.check_account("bob"), 0)
+        self.assertEqual(system.get_security_stats()['blocked_ips'], 0)
+
+    def test_account_guard_attack_mode_and_bound(self):
+        """Test du détecteur global et de la borne mémoire par compte"""
+        guard = AccountGuard(threshold=10, attack_threshold=2, slowdown=5,
+                             max_accounts=100, global_window=60, global_threshold=50)
+        for n in range(50):
+            guard.record_failure(f"user{n}", now=1000)
+        self.assertTrue(guard.attack_mode(now=1000))
+        self.assertEqual(guard.retry_after("user1", now=1001), 0)  # un seul échec
+
+        guard.record_failure("user1", now=1001)
+        self.assertEqual(guard.retry_after("user1", now=1002), 4)
+        self.assertEqual(guard.retry_after("user1", now=1006), 0)
+        self.assertFalse(guard.attack_mode(now=1100))
+
+        for n in range(1000):
+            guard.record_failure(f"spray{n}", now=1200)
+        self.assertEqual(len(guard.failures), 100)
+        self.assertEqual(guard.failures.evictions, 950)
+
+    def test_tarpit_replaces_early_block(self):
+        """Test des délais progressifs à la place du blocage au seuil"""
+        system = self.security_system
+        system.tarpit.enabled = True
+        ip = "192.168.1.130"
+
+        system.record_login_attempt(ip, "carol", False)
+        self.assertEqual(system.next_attempt_delay(ip, "carol"), 0)  # faute de frappe gratuite
+
+        for _ in range(system.max_attempts):
+            system.record_login_attempt(ip, "carol", False)
+        self.assertFalse(system.is_ip_blocked(ip))
+        self.assertGreater(system.next_attempt_delay(ip, "carol"), 1)
+        # Le délai suit aussi le compte, depuis une autre IP
+        self.assertGreater(system.next_attempt_delay("192.168.1.131", "Carol"), 1)
+
+        for _ in range(system.tarpit.block_attempts):
+            system.record_login_attempt(ip, "carol", False)
+        self.assertTrue(system.is_ip_blocked(ip))
+
+    def test_tarpit_delays(self):
+        """Test de la progression et de la purge des délais"""
+        tarpit = Tarpit(enabled=True, base_delay=0.5, max_delay=4, max_keys=2)
+        self.assertEqual([tarpit.delay_for(n) for n in range(1, 7)], [0, 0.5, 1, 2, 4, 4])
+
+        self.assertEqual(tarpit.penalize('a', 3, now=100), 1)
+        self.assertEqual(tarpit.wait('a', now=100.25), 0.75)
+        tarpit.penalize('b', 2, now=100)
+        tarpit.penalize('c', 2, now=100)
+        self.assertEqual(tarpit.wait('a', now=100), 0)  # évincée
+        self.assertEqual(tarpit.purge(now=101), 2)
+
+    def test_ip_state_table(self):
+        """Test des fenêtres d'échecs à clés entières"""
+        table = IPStateTable(capacity=8)
+        self.assertEqual(ip_key("192.0.2.1"), ip_key("::ffff:192.0.2.1"))
+        self.assertIsInstance(ip_key("2001:db8::1"), int)
+        self.assertEqual(ip_key("testclient"), "testclient")
+
+        self.assertEqual(table.hit("2001:db8::1", 60, 100), 1)
+        self.assertEqual(table.hit("2001:db8::1", 60, 130), 2)
+        self.assertEqual(table.count("2001:DB8:0::1", 60, 150), 2)
+        self.assertEqual(table.count("2001:db8::1", 60, 170), 1)
+        for n in range(20):
+            table.hit("2001:db8::1", 60, 171 + n)
+        self.assertEqual(table.count("2001:db8::1", 60, 200), 8)  # saturé à la capacité
+        self.assertEqual(table.purge(60, now=300), 1)
+        self.assertEqual(len(table), 0)
+
+    def test_ip_state_eviction_prefers_clean_ips(self):
+        """Test de l'éviction sous un balayage d'adresses : les IPs en échec sont gardées"""
+        table = IPStateTable(capacity=8, max_bytes=100 * (300 + 64))
+        self.assertEqual(table.max_entries, 100)
+
+        for _ in range(5):
+            table.hit("203.0.113.66", 60, 1000)
+        # Adresses à un seul échec, déjà sorties de la fenêtre pour la moitié
+        for n in range(50):
+            table.hit(f"2001:db8::{n:x}", 60, 900)
+        for n in range(50, 5000):
+            table.hit(f"2001:db8::{n:x}", 60, 1000)
+
+        self.assertEqual(len(table), 100)
+        self.assertEqual(table.count("203.0.113.66", 60, 1000), 5)
+        stats = table.get_stats()
+        self.assertEqual(stats['evictions'], 5001 - 100)
+        self.assertLessEqual(stats['memory_estimate'], table.max_bytes)
+
+    def test_offense_decay(self):
+        """Test de la décroissance du niveau de récidive"""
+        history = OffenseHistory(durations=(60, 600, 3600), decay=100)
+        self.assertEqual(history.escalate('10.0.0.1', now=0), (1, 60))
+        self.assertEqual(history.escalate('10.0.0.1', now=70), (2, 600))
+        self.assertEqual(history.escalate('10.0.0.1', now=700), (3, 3600))
+        self.assertEqual(history.escalate('10.0.0.1', now=4400), (3, 3600))  # plafonné
+
+        # Un niveau oublié par période de 100 s après la fin du blocage (8000)
+        self.assertEqual(history.level('10.0.0.1', now=8150), 2)
+        self.assertEqual(history.escalate('10.0.0.1', now=8150), (3, 3600))
+        self.assertEqual(history.purge(now=11750 + 299), 0)
+        self.assertEqual(history.purge(now=11750 + 300), 1)
+        self.assertEqual(len(history), 0)
+
+    def test_blocklist_lazy_expiry(self):
+        """Test l'expiration paresseuse des blocages"""
+        blocklist = BlocklistIndex()
+        now = time.time()
+        
+        blocklist.add("10.0.0.1", now + 60)
+        blocklist.add("10.0.0.2", now - 1)
+        
+        self.assertTrue(blocklist.is_blocked("10.0.0.1", now))
+        self.assertFalse(blocklist.is_blocked("10.0.0.2", now))
+        self.assertEqual(len(blocklist), 1)
+        self.assertEqual(blocklist.expire(now + 120), 1)
+    
+    def test_attempt_writer_batches(self):
+        """Test l'écriture groupée des tentatives en arrière-plan"""
+        for i in range(10):
+            self.security_system.record_login_attempt("192.168.1.110", "user%d" % i, True)
+        
+        self.assertTrue(self.security_system.attempt_writer.flush(timeout=5))
+        
+        stats = self.security_system.attempt_writer.get_stats()
+        self.assertEqual(stats['written'], 10)
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertLessEqual(stats['batches'], 10)
+        with self.security_system.db.connection() as conn:
+            count = conn.execute('SELECT COUNT(*) FROM login_attempts').fetchone()[0]
+        self.assertEqual(count, 10)
+    
+    def test_concurrent_failures_same_ip(self):
+        """Test l'atomicité vérification/blocage pour une IP sous concurrence"""
+        ip = "192.168.1.113"
+        
+        with patch.object(self.security_system, 'block_ip', wraps=self.security_system.block_ip) as block_ip:
+            threads = [
+                threading.Thread(target=self.security_system.record_login_attempt, args=(ip, "user", False))
+                for _ in range(20)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        
+        self.assertEqual(block_ip.call_count, 1)
+        self.assertTrue(self.security_system.is_ip_blocked(ip))
+    
+    def test_prefix_blocking(self):
+        """Test le blocage d'un préfixe IPv4 et IPv6"""
+        self.assertTrue(self.security_system.block_ip("203.0.113.0/24", "Test"))
+        self.assertTrue(self.security_system.block_ip("2001:db8:1::/48", "Test"))
+        
+        self.assertTrue(self.security_system.is_ip_blocked("203.0.113.42"))
+        self.assertFalse(self.security_system.is_ip_blocked("203.0.114.42"))
+        self.assertTrue(self.security_system.is_ip_blocked("2001:db8:1:ffff::1"))
+        self.assertFalse(self.security_system.is_ip_blocked("2001:db8:2::1"))
+        
+        self.security_system.unblock_ip("203.0.113.0/24")
+        self.assertFalse(self.security_system.is_ip_blocked("203.0.113.42"))
+        self.assertFalse(self.security_system.block_ip("not-an-ip"))
+    
+    def test_prefix_escalation(self):
+        """Test l'escalade vers le /24 quand de nombreuses adresses échouent"""
+        self.security_system.prefix_escalation_threshold = 5
+        
+        for i in range(5):
+            self.security_system.record_login_attempt(f"198.51.100.{i}", "user", False)
+        
+        self.assertTrue(self.security_system.is_ip_blocked("198.51.100.200"))
+        blocked = [entry['ip_address'] for entry in self.security_system.get_blocked_ips()]
+        self.assertEqual(blocked, ["198.51.100.0/24"])
+    
+    def test_non_canonical_addresses(self):
+        """Test des écritures non canoniques : majuscules, zéros explicites, IPv4 mappée"""
+        for _ in range(3):
+            self.security_system.record_login_attempt("2001:DB8::1", "user", False)
+        self.assertTrue(self.security_system.is_ip_blocked("2001:db8:0:0::1"))
+        allowed, _ = self.security_system.check_and_block("2001:0db8::0001", "user")
+        self.assertFalse(allowed)
+        
+        for _ in range(3):
+            self.security_system.record_login_attempt("::ffff:10.0.0.5", "user", False)
+        self.assertTrue(self.security_system.is_ip_blocked("10.0.0.5"))
+        self.assertIsNotNone(self.security_system.state.get_unblock_time("::FFFF:10.0.0.5"))
+        
+        # Un blocage de plus sur une adresse déjà bloquée n'escalade pas
+        levels = {entry['ip_address']: entry['offense_level'] for entry in self.security_system.get_blocked_ips()}
+        self.assertEqual(levels, {"2001:db8::1": 1, "10.0.0.5": 1})
+    
+    def test_prefix_escalation_ipv4_mapped(self):
+        """Test de l'escalade d'adresses IPv4 mappées vers leur /24, jamais ::/64"""
+        self.security_system.prefix_escalation_threshold = 5
+        
+        for i in range(5):
+            self.security_system.record_login_attempt(f"::ffff:198.51.{i}.1", "user", False)
+        self.assertFalse(self.security_system.is_ip_blocked("::ffff:8.8.8.8"))
+        
+        for i in range(5):
+            self.security_system.record_login_attempt(f"::ffff:192.0.2.{i}", "user", False)
+        self.assertTrue(self.security_system.is_ip_blocked("192.0.2.200"))
+        self.assertTrue(self.security_system.is_ip_blocked("::ffff:192.0.2.200"))
+    
+    def test_blocked_ips_pagination(self):
+        """Test la pagination par curseur et les filtres de la liste des blocages"""
+        now = int(time.time())
+        with self.security_system.db.connection() as conn:
+            conn.executemany(
+                'INSERT INTO blocked_ips (ip_address, block_reason, block_time, unblock_time) VALUES (?, ?, ?, ?)',
+                [(f"10.2.0.{i}", "Scan" if i % 2 else "Tentatives", now - i // 2, now + 3600) for i in range(25)]
+                + [("10.3.0.1", "Expiré", now - 7200, now - 3600)]
+            )
+        
+        seen = []
+        cursor = None
+        while True:
+            page = self.security_system.get_blocked_ips_page(limit=10, cursor=cursor)
+            seen.extend(entry['ip_address'] for entry in page['items'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+        self.assertEqual(seen[0], "10.2.0.1")  # plus récent, puis id décroissant
+        
+        filtered = self.security_system.get_blocked_ips_page(prefix="10.2.0.1", reason="scan")
+        self.assertEqual(sorted(e['ip_address'] for e in filtered['items']),
+                         ["10.2.0.1", "10.2.0.11", "10.2.0.13", "10.2.0.15", "10.2.0.17", "10.2.0.19"])
+        self.assertEqual(self.security_system.get_blocked_ips_page(prefix="10._")['items'], [])
+        with self.assertRaises(ValueError):
+            self.security_system.get_blocked_ips_page(cursor="invalide")
+    
+    def test_blocked_ips_etag(self):
+        """Test l'ETag de la liste des blocages : change au blocage et au déblocage"""
+        etag = self.security_system.blocked_ips_etag()
+        self.assertEqual(self.security_system.blocked_ips_etag(), etag)
+        
+        self.security_system.block_ip("192.0.2.44")
+        blocked_etag = self.security_system.blocked_ips_etag()
+        self.assertNotEqual(blocked_etag, etag)
+        
+        self.security_system.unblock_ip("192.0.2.44")
+        self.assertNotIn(self.security_system.blocked_ips_etag(), (etag, blocked_etag))
+    
+    def test_block_many(self):
+        """Test le blocage et le déblocage en masse dans une seule transaction"""
+        entries = [(f"10.4.{i // 256}.{i % 256}", None) for i in range(1200)] + [("pas-une-ip", None)]
+        version = self.security_system.state.blocklist_version()
+        
+        result = self.security_system.block_many(iter(entries), reason="Flux", chunk_size=500)
+        self.assertEqual(result['applied'], 1200)
+        self.assertEqual(result['invalid'], 1)
+        self.assertTrue(self.security_system.is_ip_blocked("10.4.4.175"))
+        self.assertEqual(len(list(self.security_system.iter_blocked_ips(batch_size=100))), 1200)
+        # Le backend local n'est mis à jour qu'une fois par morceau
+        self.assertEqual(self.security_system.state.blocklist_version().split('.')[1],
+                         str(int(version.split('.')[1]) + 3))
+        
+        result = self.security_system.unblock_many(iter(entries[:600]))
+        self.assertEqual(result['applied'], 600)
+        self.assertFalse(self.security_system.is_ip_blocked("10.4.0.1"))
+        self.assertEqual(self.security_system.get_security_stats()['blocked_ips'], 600)
+    
+    def test_block_many_keeps_longer_blocks(self):
+        """Test qu'un blocage en masse ne raccourcit pas un blocage escaladé"""
+        system = self.security_system
+        ip = "192.0.2.77"
+        system.block_ip(ip, "Test")
+        system.block_ip(ip, "Test")
+        escalated = system.get_blocked_ips_page()['items'][0]
+        self.assertEqual(escalated['offense_level'], 2)
+
+        system.block_many([(ip, None), ("192.0.2.78", None)], reason="Flux", duration=60)
+        entries = {entry['ip_address']: entry for entry in system.get_blocked_ips_page()['items']}
+        self.assertEqual(entries[ip]['unblock_time'], escalated['unblock_time'])
+        self.assertEqual(entries[ip]['offense_level'], 2)
+        self.assertEqual(entries[ip]['reason'], "Test")
+        self.assertEqual(system.state.get_unblock_time(ip), escalated['unblock_time'])
+
+        # Un blocage plus long que l'existant le prolonge
+        system.block_many([(ip, None)], reason="Flux", duration=30 * 24 * 3600)
+        entry = {entry['ip_address']: entry for entry in system.get_blocked_ips_page()['items']}[ip]
+        self.assertGreater(entry['unblock_time'], escalated['unblock_time'])
+        self.assertEqual(entry['offense_level'], 2)
+        self.assertEqual(system.state.get_unblock_time(ip), entry['unblock_time'])
+    
+    def test_cleanup_in_batches(self):
+        """Test la purge par lots des tentatives expirées"""
+        old_time = int(time.time()) - 8 * 24 * 3600
+        with self.security_system.db.connection() as conn:
+            conn.executemany(
+                'INSERT INTO login_attempts (ip_address, username, success, attempt_time) VALUES (?, ?, ?, ?)',
+                [("10.1.0.%d" % (i % 256), "user", 0, old_time + i) for i in range(25)]
+            )
+        self.security_system.record_login_attempt("10.1.1.1", "user", True)
+        self.security_system.attempt_writer.flush()
+        
+        self.security_system.cleanup_batch_size = 10
+        self.security_system.cleanup_pause = 0
+        self.security_system.cleanup_old_records()
+        
+        with self.security_system.db.connection() as conn:
+            remaining = conn.execute('SELECT COUNT(*) FROM login_attempts').fetchone()[0]
+        self.assertEqual(remaining, 1)
+        self.assertEqual(self.security_system.cleanup_stats['last_rows_removed'], 25)
+        self.assertEqual(self.security_system.cleanup_stats['last_batches'], 3)
+        # Les tentatives purgées restent comptées dans les agrégats
+        self.assertEqual(self.security_system.rollups.last_attempt_id, 26)
+    
     def test_statistics(self):
         """Test la génération des statistiques"""
         ip1 = "192.168.1.104"
@@ -110,6 +507,38 @@ class TestAntiBruteForce(unittest.TestCase):
         self.assertIn('failed_attempts_24h', stats)
         self.assertIn('total_attempts', stats)
         self.assertIn('top_suspicious', stats)
+        
+        self.assertEqual(stats['blocked_ips'], 1)
+        self.assertEqual(stats['failed_attempts_24h'], 3)
+        self.assertEqual(stats['total_attempts'], 6)
+        self.assertEqual(stats['top_suspicious'], [{'ip': ip1, 'attempts': 3}])
+    
+    def test_statistics_rebuilt_at_startup(self):
+        """Test la reconstruction des agrégats depuis la base"""
+        for i in range(2):
+            self.security_system.record_login_attempt("192.168.1.111", "user", False)
+        self.security_system.record_login_attempt("192.168.1.112", "user", True)
+        self.security_system.attempt_writer.flush()
+        
+        restarted = AntiBruteForceSystem(self.db_path)
+        stats = restarted.get_security_stats()
+        restarted.close()
+        
+        self.assertEqual(stats['total_attempts'], 3)
+        self.assertEqual(stats['failed_attempts_24h'], 2)
+        self.assertEqual(stats['top_suspicious'][0]['ip'], "192.168.1.111")
+    
+    def test_failures_24h_expiry(self):
+        """Test la sortie des échecs de la fenêtre de 24h"""
+        aggregator = self.security_system.stats
+        now = time.time()
+        
+        aggregator.record("10.0.0.1", False, now - 3600)
+        aggregator.record("10.0.0.2", False, now)
+        
+        self.assertEqual(aggregator.failures_24h(now), 2)
+        self.assertEqual(aggregator.failures_24h(now + 23 * 3600 + 60), 1)
+        self.assertEqual(aggregator.failures_24h(now + 25 * 3600), 0)
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
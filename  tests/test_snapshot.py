@@ -0,0 +1,105 @@
+import unittest
+import tempfile
+import os
+import shutil
+import sys
+import time
+
+# Ajouter le répertoire src au path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from ip_state import ip_key
+from security_system import AntiBruteForceSystem
+from snapshot import Snapshot, SnapshotError, read_snapshot, write_snapshot
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        """Configuration avant chaque test"""
+        self.directory = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.directory, 'security.db')
+        self.snapshot_path = os.path.join(self.directory, 'security.snapshot')
+
+    def tearDown(self):
+        """Nettoyage après chaque test"""
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        """Test de l'écriture atomique et de la relecture d'un instantané"""
+        snapshot = Snapshot(
+            last_attempt_id=42,
+            created_at=1000.5,
+            ip_windows=[(ip_key('2001:db8::1'), (990.0, 995.5)), ('testclient', (999.0,))],
+            account_windows=[('alice', (998.0,))],
+            stats={'total_attempts': 7, 'expired_before': 12,
+                   'minutes': [(16, 3)], 'hours': [(0, {'192.0.2.1': 3})]},
+        )
+        size = write_snapshot(self.snapshot_path, snapshot)
+        self.assertEqual(os.path.getsize(self.snapshot_path), size)
+        self.assertFalse(os.path.exists(self.snapshot_path + '.tmp'))
+
+        loaded = read_snapshot(self.snapshot_path)
+        self.assertEqual(loaded.last_attempt_id, 42)
+        self.assertEqual(loaded.ip_windows, snapshot.ip_windows)
+        self.assertEqual(loaded.account_windows, snapshot.account_windows)
+        self.assertEqual(loaded.stats, snapshot.stats)
+
+    def test_oversized_username(self):
+        """Test d'un instantané contenant un nom d'utilisateur de plus de 64 Kio"""
+        system = AntiBruteForceSystem(self.db_path, snapshot_path=self.snapshot_path)
+        try:
+            username = 'a' * 70000
+            system.record_login_attempt('192.0.2.20', username, False)
+            self.assertGreater(system.save_snapshot(), 70000)
+            loaded = read_snapshot(self.snapshot_path)
+            self.assertIn(username, [key for key, _ in loaded.account_windows])
+        finally:
+            system.close()
+
+    def test_corrupted_snapshot_rejected(self):
+        """Test du rejet d'un instantané corrompu"""
+        write_snapshot(self.snapshot_path, Snapshot(last_attempt_id=1))
+        with open(self.snapshot_path, 'r+b') as target:
+            target.seek(10)
+            target.write(b'\xff')
+        with self.assertRaises(SnapshotError):
+            read_snapshot(self.snapshot_path)
+
+    def test_warm_restart_replays_newer_attempts(self):
+        """Test du redémarrage : instantané plus tentatives postérieures seulement"""
+        system = AntiBruteForceSystem(self.db_path, snapshot_path=self.snapshot_path)
+        for _ in range(2):
+            system.record_login_attempt('192.0.2.10', 'alice', False)
+        system.record_login_attempt('192.0.2.11', 'bob', True)
+        self.assertGreater(system.save_snapshot(), 0)
+        saved = self.snapshot_path + '.saved'
+        shutil.copy(self.snapshot_path, saved)
+
+        # Tentatives postérieures à l'instantané, puis arrêt brutal (instantané non réécrit)
+        system.record_login_attempt('192.0.2.10', 'alice', False)
+        system.close()
+        os.replace(saved, self.snapshot_path)
+
+        restarted = AntiBruteForceSystem(self.db_path, snapshot_path=self.snapshot_path)
+        try:
+            self.assertTrue(restarted.snapshot_stats['loaded'])
+            self.assertEqual(restarted.snapshot_stats['replayed_attempts'], 1)
+            self.assertEqual(restarted.get_recent_failed_attempts('192.0.2.10'), 3)
+            self.assertEqual(restarted.accounts.failures.count('alice', restarted.accounts.window), 3)
+            stats = restarted.get_security_stats()
+            self.assertEqual(stats['total_attempts'], 4)
+            self.assertEqual(stats['failed_attempts_24h'], 3)
+        finally:
+            restarted.close()
+
+    def test_stale_snapshot_ignored(self):
+        """Test de la reconstruction complète quand l'instantané ne correspond pas à la base"""
+        write_snapshot(self.snapshot_path, Snapshot(last_attempt_id=500, created_at=time.time()))
+        system = AntiBruteForceSystem(self.db_path, snapshot_path=self.snapshot_path)
+        try:
+            self.assertFalse(system.snapshot_stats['loaded'])
+        finally:
+            system.close()
+
+if __name__ == '__main__':
+    unittest.main()
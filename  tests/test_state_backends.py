@@ -0,0 +1,225 @@
+import unittest
+import tempfile
+import os
+import sys
+import time
+
+# Ajouter le répertoire src au path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from security_system import AntiBruteForceSystem
+from state_backends import RedisStateBackend, LocalStateBackend, create_state_backend
+
+class FakeRedis:
+    """Client Redis minimal en mémoire, limité aux commandes du backend"""
+    
+    def __init__(self):
+        self.data = {}
+        self.expiry = {}
+    
+    def _alive(self, key):
+        if key in self.expiry and self.expiry[key] <= time.time():
+            self.data.pop(key, None)
+            self.expiry.pop(key, None)
+        return key in self.data
+    
+    def _zset(self, key):
+        if not self._alive(key):
+            self.data[key] = {}
+        return self.data[key]
+    
+    @staticmethod
+    def _bound(value):
+        if value == '-inf':
+            return float('-inf'), False
+        if value == '+inf':
+            return float('inf'), False
+        if isinstance(value, str) and value.startswith('('):
+            return float(value[1:]), True
+        return float(value), False
+    
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+    
+    def get(self, key):
+        return str(self.data[key]).encode() if self._alive(key) else None
+    
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+        if ex:
+            self.expiry[key] = time.time() + ex
+        return True
+    
+    def delete(self, *keys):
+        removed = 0
+        for key in keys:
+            self.expiry.pop(key, None)
+            removed += self.data.pop(key, None) is not None
+        return removed
+    
+    def expire(self, key, seconds):
+        self.expiry[key] = time.time() + seconds
+        return True
+    
+    def incr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) + 1
+        return self.data[key]
+    
+    def hset(self, key, field, value):
+        self.data.setdefault(key, {})[field] = value
+        return 1
+    
+    def hdel(self, key, field):
+        return 1 if self.data.get(key, {}).pop(field, None) is not None else 0
+    
+    def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+    
+    def zadd(self, key, mapping):
+        self._zset(key).update(mapping)
+        return len(mapping)
+    
+    def zrem(self, key, member):
+        return 1 if self._zset(key).pop(member, None) is not None else 0
+    
+    def zcard(self, key):
+        return len(self._zset(key))
+    
+    def zcount(self, key, low, high):
+        (low, low_open), (high, _) = self._bound(low), self._bound(high)
+        return sum(1 for score in self._zset(key).values()
+                   if (score > low if low_open else score >= low) and score <= high)
+    
+    def zremrangebyscore(self, key, low, high):
+        zset = self._zset(key)
+        (low, _), (high, _) = self._bound(low), self._bound(high)
+        removed = [member for member, score in zset.items() if low <= score <= high]
+        for member in removed:
+            del zset[member]
+        return len(removed)
+    
+    def zremrangebyrank(self, key, start, stop):
+        zset = self._zset(key)
+        ordered = sorted(zset, key=zset.get)
+        stop = len(ordered) + stop if stop < 0 else stop
+        for member in ordered[start:stop + 1]:
+            del zset[member]
+        return max(0, stop + 1 - start)
+
+class FakePipeline:
+    """Pipeline transactionnel : les commandes sont exécutées en bloc"""
+    
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+    
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+        return queue
+    
+    def execute(self):
+        return [getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+
+class TestStateBackends(unittest.TestCase):
+    
+    def setUp(self):
+        """Configuration avant chaque test"""
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.redis = FakeRedis()
+        # Deux "workers" partageant le même serveur Redis
+        self.workers = [
+            AntiBruteForceSystem(self.db_path, state_backend=RedisStateBackend(self.redis))
+            for _ in range(2)
+        ]
+        for worker in self.workers:
+            worker.max_attempts = 3
+            worker.time_window = 60
+    
+    def tearDown(self):
+        """Nettoyage après chaque test"""
+        for worker in self.workers:
+            worker.close()
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+    
+    def test_failures_shared_between_workers(self):
+        """Test le partage des compteurs : le seuil est global, pas par worker"""
+        ip = "192.168.2.1"
+        first, second = self.workers
+        
+        first.record_login_attempt(ip, "victim", False)
+        second.record_login_attempt(ip, "victim", False)
+        self.assertEqual(first.get_recent_failed_attempts(ip), 2)
+        
+        first.record_login_attempt(ip, "victim", False)
+        allowed, message = second.check_and_block(ip, "victim")
+        self.assertFalse(allowed)
+        self.assertEqual(second.get_security_stats()['blocked_ips'], 1)
+    
+    def test_unblock_visible_to_all_workers(self):
+        """Test la propagation d'un déblocage manuel"""
+        ip = "192.168.2.2"
+        first, second = self.workers
+        
+        first.block_ip(ip, "Test")
+        self.assertTrue(second.is_ip_blocked(ip))
+        
+        second.unblock_ip(ip)
+        self.assertFalse(first.is_ip_blocked(ip))
+        self.assertEqual(first.get_security_stats()['blocked_ips'], 0)
+    
+    def test_blocked_ips_etag_shared_between_workers(self):
+        """Test l'ETag de la liste des blocages : identique sur tous les workers"""
+        first, second = self.workers
+        
+        first.block_ip("192.168.2.3", "Test")
+        etag = first.blocked_ips_etag()
+        self.assertEqual(second.blocked_ips_etag(), etag)
+        
+        second.unblock_ip("192.168.2.3")
+        self.assertNotEqual(first.blocked_ips_etag(), etag)
+    
+    def test_prefix_block_shared_between_workers(self):
+        """Test la propagation d'un blocage de préfixe aux autres workers"""
+        first, second = self.workers
+        
+        self.assertFalse(second.is_ip_blocked("198.51.100.7"))
+        first.block_ip("198.51.100.0/24", "Test")
+        self.assertTrue(second.is_ip_blocked("198.51.100.7"))
+        self.assertFalse(second.is_ip_blocked("198.51.101.7"))
+        
+        second.unblock_ip("198.51.100.0/24")
+        self.assertFalse(first.is_ip_blocked("198.51.100.7"))
+    
+    def test_bulk_block_shared_between_workers(self):
+        """Test le blocage et le déblocage en masse, visibles de tous les workers"""
+        first, second = self.workers
+        
+        first.block_many([("192.168.3.1", None), ("198.51.102.0/24", "Flux")])
+        self.assertTrue(second.is_ip_blocked("192.168.3.1"))
+        self.assertTrue(second.is_ip_blocked("198.51.102.9"))
+        
+        second.unblock_many([("192.168.3.1", None), ("198.51.102.0/24", None)])
+        self.assertFalse(first.is_ip_blocked("192.168.3.1"))
+        self.assertFalse(first.is_ip_blocked("198.51.102.9"))
+    
+    def test_bulk_block_keeps_longer_blocks(self):
+        """Test qu'un blocage en masse ne raccourcit pas un blocage en cours"""
+        first, second = self.workers
+        first.state.block("192.168.3.2", time.time() + 3600)
+        
+        second.block_many([("192.168.3.2", None), ("192.168.3.3", None)], duration=60)
+        self.assertGreater(first.state.get_unblock_time("192.168.3.2"), time.time() + 3000)
+        self.assertLess(first.state.get_unblock_time("192.168.3.3"), time.time() + 120)
+    
+    def test_create_state_backend(self):
+        """Test la sélection du backend par URL"""
+        self.assertIsInstance(create_state_backend(None), LocalStateBackend)
+        self.assertIsInstance(create_state_backend('memory://'), LocalStateBackend)
+        with self.assertRaises(ValueError):
+            create_state_backend('ftp://localhost')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""Montée en charge du nombre de connexions : mode threadé contre mode asynchrone
+
+Démarre le serveur (run.py, puis run.py --async) dans un répertoire temporaire
+et, pour chaque palier de connexions :
+- ouvre N connexions lentes qui n'envoient que le début de leurs en-têtes
+  (clients lents ou attaquants gardant la connexion ouverte) ;
+- mesure pendant ce temps la latence de requêtes /api/login de sonde ;
+- envoie N connexions simultanées /api/login et mesure le débit ;
+- relève la mémoire (VmRSS) et le nombre de threads du serveur.
+
+    python benchmarks/bench_connection_scaling.py --connections 100,1000,5000 --output connexions.json
+
+Le mode asynchrone nécessite uvicorn ; il est ignoré s'il n'est pas installé.
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import summarize, write_results
+
+RUN_PY = os.path.join(os.path.dirname(__file__), '..', 'run.py')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, port, workdir):
+    """Démarre run.py dans `workdir` et attend que le port accepte les connexions"""
+    command = [sys.executable, os.path.abspath(RUN_PY), '--host', '127.0.0.1', '--port', str(port)]
+    if mode == 'async':
+        command.append('--async')
+    env = dict(os.environ, BLOCKAGE_LOG_LEVEL='ERROR')
+    process = subprocess.Popen(command, cwd=workdir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 20
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return process
+        except OSError:
+            if process.poll() is not None:
+                raise RuntimeError(f"Le serveur {mode} s'est arrêté au démarrage")
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"Le serveur {mode} ne répond pas")
+
+
+def process_usage(pid):
+    """Mémoire résidente (Mo) et nombre de threads du processus (Linux)"""
+    usage = {}
+    try:
+        with open(f"/proc/{pid}/status") as handle:
+            for line in handle:
+                if line.startswith('VmRSS:'):
+                    usage['rss_mb'] = round(int(line.split()[1]) / 1024, 1)
+                elif line.startswith('Threads:'):
+                    usage['threads'] = int(line.split()[1])
+    except OSError:
+        pass
+    return usage
+
+
+async def login_request(port, index, timeout):
+    """Envoie une requête /api/login sur une nouvelle connexion, renvoie (statut, latence)"""
+    body = json.dumps({'username': 'admin', 'password': f"guess{index}"}).encode()
+    request = (
+        b"POST /api/login HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/json\r\n"
+        b"Connection: close\r\nContent-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body
+    )
+    started = time.perf_counter()
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+        writer.write(request)
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        await asyncio.wait_for(reader.read(), timeout)
+        writer.close()
+        status = int(status_line.split()[1]) if status_line else 0
+    except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+        status = 0
+    return status, time.perf_counter() - started
+
+
+async def open_slow_connections(port, count):
+    """Ouvre `count` connexions qui n'envoient qu'une partie de leurs en-têtes"""
+    writers = []
+    for _ in range(count):
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b"POST /api/login HTTP/1.1\r\nHost: 127.0.0.1\r\n")
+            writers.append(writer)
+        except OSError:
+            break
+    return writers
+
+
+async def measure_level(port, connections, probes, timeout):
+    """Mesures d'un palier : sondes sous connexions lentes, puis rafale simultanée"""
+    slow = await open_slow_connections(port, connections)
+    await asyncio.sleep(0.5)
+
+    probe_results = [await login_request(port, n, timeout) for n in range(probes)]
+
+    for writer in slow:
+        writer.close()
+    await asyncio.sleep(0.5)
+
+    started = time.perf_counter()
+    burst = await asyncio.gather(*(login_request(port, n, timeout) for n in range(connections)))
+    elapsed = time.perf_counter() - started
+
+    def describe(results, duration):
+        ok = [latency for status, latency in results if status]
+        summary = summarize(ok, duration)
+        summary['errors'] = len(results) - len(ok)
+        return summary
+
+    probe_elapsed = sum(latency for _, latency in probe_results)
+    return {
+        'slow_connections_opened': len(slow),
+        'probe_under_slow_connections': describe(probe_results, probe_elapsed),
+        'burst': describe(burst, elapsed),
+    }
+
+
+def run_mode(mode, levels, probes, timeout):
+    workdir = tempfile.mkdtemp(prefix=f"bench_{mode}_")
+    port = free_port()
+    process = start_server(mode, port, workdir)
+    try:
+        results = []
+        for connections in levels:
+            result = asyncio.run(measure_level(port, connections, probes, timeout))
+            result['connections'] = connections
+            result['server'] = process_usage(process.pid)
+            results.append(result)
+            burst = result['burst']
+            print(f"{mode:>8} {connections:>6} connexions - sonde p99 "
+                  f"{result['probe_under_slow_connections']['p99_ms']:.1f}ms - rafale "
+                  f"{burst['ops_per_second']:.0f} req/s, {burst['errors']} erreurs - "
+                  f"{result['server'].get('threads', '?')} threads", file=sys.stderr)
+        return results
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Montée en charge du nombre de connexions')
+    parser.add_argument('--connections', default='50,500,2000', help='Paliers de connexions (ex. 100,1000)')
+    parser.add_argument('--probes', type=int, default=50, help='Requêtes de sonde par palier')
+    parser.add_argument('--timeout', type=float, default=10.0, help='Délai maximal par requête (s)')
+    parser.add_argument('--modes', default='threaded,async', help='Modes à comparer')
+    parser.add_argument('--output', help='Fichier JSON de résultats (sinon sortie standard)')
+    args = parser.parse_args()
+
+    levels = [int(n) for n in args.connections.split(',')]
+    # Chaque connexion consomme un descripteur côté client
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, max(soft, 2 * max(levels) + 256)), hard))
+
+    results = {}
+    for mode in args.modes.split(','):
+        if mode == 'async' and importlib.util.find_spec('uvicorn') is None:
+            print("uvicorn absent : mode asynchrone ignoré", file=sys.stderr)
+            results[mode] = {'skipped': 'uvicorn non installé'}
+            continue
+        results[mode] = run_mode(mode, levels, args.probes, args.timeout)
+
+    write_results('connection_scaling', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""Micro-benchmarks du chemin de décision de connexion
+
+Mesure, pour plusieurs tailles de la table login_attempts, le temps de
+démarrage (reconstruction de l'état en mémoire) et les latences p50/p99 de
+check_and_block, record_login_attempt et get_security_stats.
+
+    python benchmarks/bench_decision_path.py --sizes 10000,1000000,10000000 --output resultats.json
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+from common import seed_login_attempts, summarize, timed_calls, write_results
+
+from database import migrate_database
+from security_system import AntiBruteForceSystem
+
+
+def bench_size(rows, operations):
+    """Exécute les mesures sur une base de `rows` tentatives"""
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    try:
+        migrate_database(db_path)
+        started = time.perf_counter()
+        seed_login_attempts(db_path, rows)
+        seed_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        system = AntiBruteForceSystem(db_path)
+        startup_seconds = time.perf_counter() - started
+
+        rng = random.Random(42)
+        # Mélange d'IPs déjà présentes en base et d'IPs nouvelles
+        ips = [f"10.0.{rng.randrange(4)}.{rng.randrange(256)}" if rng.random() < 0.5
+               else f"172.16.{rng.randrange(256)}.{rng.randrange(256)}"
+               for _ in range(operations)]
+
+        results = {'rows': rows, 'seed_seconds': round(seed_seconds, 3),
+                   'startup_seconds': round(startup_seconds, 4)}
+
+        latencies, elapsed = timed_calls(system.check_and_block, [(ip, 'bench') for ip in ips])
+        results['check_and_block'] = summarize(latencies, elapsed)
+
+        latencies, elapsed = timed_calls(
+            system.record_login_attempt,
+            [(ip, 'bench', rng.random() < 0.2) for ip in ips]
+        )
+        results['record_login_attempt'] = summarize(latencies, elapsed)
+
+        started = time.perf_counter()
+        system.attempt_writer.flush()
+        results['writer_flush_seconds'] = round(time.perf_counter() - started, 4)
+
+        latencies, elapsed = timed_calls(system.get_security_stats, [()] * max(1, operations // 10))
+        results['get_security_stats'] = summarize(latencies, elapsed)
+
+        system.close()
+        return results
+    finally:
+        os.close(db_fd)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.unlink(db_path + suffix)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmarks du chemin de décision')
+    parser.add_argument('--sizes', default='10000', help='Tailles de login_attempts (ex. 10000,1000000,10000000)')
+    parser.add_argument('--operations', type=int, default=5000, help='Appels mesurés par opération')
+    parser.add_argument('--output', help='Fichier JSON de résultats (sinon sortie standard)')
+    args = parser.parse_args()
+
+    # Les journaux de blocage fausseraient la mesure
+    logging.disable(logging.CRITICAL)
+
+    results = []
+    for rows in [int(size) for size in args.sizes.split(',')]:
+        result = bench_size(rows, args.operations)
+        results.append(result)
+        print(f"{rows:>10} lignes - démarrage {result['startup_seconds']:.3f}s - "
+              f"check_and_block p99 {result['check_and_block']['p99_ms']:.3f}ms - "
+              f"record p99 {result['record_login_attempt']['p99_ms']:.3f}ms - "
+              f"stats p99 {result['get_security_stats']['p99_ms']:.3f}ms", file=sys.stderr)
+
+    write_results('decision_path', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Benchmark de contention : débit de check_and_block selon le nombre de threads
+
+Compare un verrou unique (--stripes 1, comportement historique) au verrouillage
+réparti par IP. Chaque thread attaque ses propres IPs : vérification, échec
+enregistré, jusqu'au blocage (écriture SQLite sous le verrou de l'IP).
+--latency-ms simule la latence réseau d'un backend d'état distant (Redis).
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from common import write_results
+
+from security_system import AntiBruteForceSystem
+from state_backends import LocalStateBackend
+
+
+class LatencyStateBackend(LocalStateBackend):
+    """Backend local ajoutant une latence fixe à chaque opération"""
+
+    def __init__(self, latency):
+        super().__init__()
+        self.latency = latency
+
+    def record_failure(self, *args, **kwargs):
+        time.sleep(self.latency)
+        return super().record_failure(*args, **kwargs)
+
+    def get_unblock_time(self, *args, **kwargs):
+        time.sleep(self.latency)
+        return super().get_unblock_time(*args, **kwargs)
+
+
+def run(threads, stripes, operations, latency):
+    """Exécute `operations` vérifications par thread, renvoie le débit en opérations/s"""
+    db_fd, db_path = tempfile.mkstemp()
+    backend = LatencyStateBackend(latency) if latency else LocalStateBackend()
+    system = AntiBruteForceSystem(db_path, state_backend=backend, lock_stripes=stripes)
+    system.max_attempts = 3
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(worker_id):
+        barrier.wait()
+        for i in range(operations):
+            ip_address = f"10.{worker_id}.{(i // 4) // 256 % 256}.{(i // 4) % 256}"
+            allowed, _ = system.check_and_block(ip_address, "bench")
+            if allowed:
+                system.record_login_attempt(ip_address, "bench", False)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    system.close()
+    os.close(db_fd)
+    os.unlink(db_path)
+    return threads * operations / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de contention du verrouillage')
+    parser.add_argument('--threads', default='1,2,4,8,16', help='Nombres de threads (séparés par des virgules)')
+    parser.add_argument('--operations', type=int, default=2000, help='Vérifications par thread')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Latence simulée du backend d\'état')
+    parser.add_argument('--output', help='Fichier JSON de résultats (sinon sortie standard)')
+    args = parser.parse_args()
+
+    # Les journaux de blocage fausseraient la mesure
+    logging.disable(logging.CRITICAL)
+    latency = args.latency_ms / 1000
+    results = []
+    for threads in [int(n) for n in args.threads.split(',')]:
+        for label, stripes in (('verrou global', 1), ('verrous par IP', 64)):
+            ops = run(threads, stripes, args.operations, latency)
+            results.append({'threads': threads, 'stripes': stripes, 'ops_per_second': round(ops, 1)})
+            print(f"{threads:>3} threads - {label:<15}: {ops:>10.0f} op/s", file=sys.stderr)
+
+    write_results('lock_contention', {'latency_ms': args.latency_ms, 'runs': results}, args.output)
+
+
+if __name__ == '__main__':
+    main()
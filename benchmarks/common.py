@@ -0,0 +1,83 @@
+"""Outils partagés par les benchmarks : mesures, percentiles, résultats JSON"""
+import json
+import os
+import platform
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+# Ajouter le répertoire src au path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+
+def percentile(samples, fraction):
+    """Percentile par rang le plus proche d'une liste de mesures"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(latencies, elapsed):
+    """Résume des latences (en secondes) : p50/p99/max en ms et débit"""
+    return {
+        'count': len(latencies),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 4),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 4),
+        'max_ms': round(max(latencies) * 1000, 4) if latencies else 0.0,
+        'ops_per_second': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def timed_calls(func, arguments):
+    """Appelle `func` pour chaque jeu d'arguments, renvoie (latences, durée totale)"""
+    latencies = []
+    started = time.perf_counter()
+    for args in arguments:
+        call_started = time.perf_counter()
+        func(*args)
+        latencies.append(time.perf_counter() - call_started)
+    return latencies, time.perf_counter() - started
+
+
+def seed_login_attempts(db_path, rows, attacker_ips=1000, span_seconds=7 * 24 * 3600, chunk=100000):
+    """Remplit login_attempts avec `rows` tentatives réparties sur `span_seconds`"""
+    now = int(time.time())
+    conn = sqlite3.connect(db_path)
+    try:
+        for start in range(0, rows, chunk):
+            batch = []
+            for n in range(start, min(rows, start + chunk)):
+                attacker = n % attacker_ips
+                ip_address = f"10.{attacker // 65536 % 256}.{attacker // 256 % 256}.{attacker % 256}"
+                success = 1 if n % 10 == 0 else 0
+                attempt_time = now - span_seconds + (n * span_seconds) // max(rows, 1)
+                batch.append((ip_address, f"user{n % 500}", success, attempt_time))
+            conn.executemany(
+                'INSERT INTO login_attempts (ip_address, username, success, attempt_time) VALUES (?, ?, ?, ?)',
+                batch
+            )
+            conn.commit()
+    finally:
+        conn.close()
+
+
+def write_results(name, results, output=None):
+    """Affiche ou écrit les résultats au format JSON (comparables d'une exécution à l'autre)"""
+    document = {
+        'benchmark': name,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'results': results,
+    }
+    text = json.dumps(document, indent=2, ensure_ascii=False)
+    if output:
+        with open(output, 'w', encoding='utf-8') as handle:
+            handle.write(text + '\n')
+    else:
+        print(text)
+    return document
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""Générateur de charge de bout en bout sur /api/login
+
+Simule un trafic mixte : des utilisateurs légitimes (bons identifiants, rares
+fautes de frappe) et des attaquants répartis sur de nombreuses IPs. Par défaut
+l'application Flask est appelée en processus (client de test WSGI, une base
+temporaire), ce qui permet de fixer l'IP source de chaque requête ; avec --url
+la charge est envoyée en HTTP et l'IP simulée passe par X-Forwarded-For. Le
+serveur doit alors être lancé avec --demo-users (comptes légitimes) et avec
+BLOCKAGE_TRUSTED_PROXIES couvrant l'adresse du générateur de charge (ex.
+127.0.0.1) : sinon l'en-tête est ignoré, tout le trafic vient d'une seule IP,
+bloquée en quelques requêtes, et les mesures n'ont pas de sens.
+
+    python benchmarks/load_login.py --requests 20000 --threads 16 --output charge.json
+"""
+import argparse
+import atexit
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+
+from common import summarize, write_results
+
+LEGITIMATE_USERS = [('admin', 'admin123'), ('user', 'user123'), ('test', 'test123')]
+
+
+def build_plan(requests, attack_ratio, attacker_ips, legit_ips, seed=42):
+    """Prépare la liste des requêtes : (type, ip, identifiant, mot de passe)"""
+    rng = random.Random(seed)
+    plan = []
+    for _ in range(requests):
+        if rng.random() < attack_ratio:
+            attacker = rng.randrange(attacker_ips)
+            ip_address = f"10.{attacker // 65536 % 256}.{attacker // 256 % 256}.{attacker % 256}"
+            plan.append(('attack', ip_address, 'admin', f"guess{rng.randrange(10 ** 6)}"))
+        else:
+            username, password = rng.choice(LEGITIMATE_USERS)
+            if rng.random() < 0.05:
+                password += 'x'  # faute de frappe
+            plan.append(('legit', f"192.168.{rng.randrange(legit_ips) // 256}.{rng.randrange(legit_ips) % 256}",
+                         username, password))
+    return plan
+
+
+def _import_app():
+    """Importe l'application une seule fois (comptes de démonstration, sans instantané)"""
+    if 'app' not in sys.modules:
+        app_dir = tempfile.mkdtemp()
+        os.environ['BLOCKAGE_DB'] = os.path.join(app_dir, 'security.db')
+        os.environ['BLOCKAGE_DEMO_USERS'] = '1'
+        os.environ['BLOCKAGE_SNAPSHOT'] = ''
+        # Enregistré avant la fermeture de l'application : exécuté après elle
+        atexit.register(shutil.rmtree, app_dir, True)
+    import app
+    return app
+
+
+def in_process_sender():
+    """Envoie les requêtes à l'application Flask en processus, sur une base temporaire par exécution"""
+    from security_system import AntiBruteForceSystem
+
+    app_module = _import_app()
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    original_system = app_module.security_system
+    app_module.security_system = AntiBruteForceSystem(db_path)
+    app_module.app.config['TESTING'] = True
+    local = threading.local()
+
+    def send(ip_address, username, password):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app_module.app.test_client()
+        response = client.post('/api/login', json={'username': username, 'password': password},
+                               environ_overrides={'REMOTE_ADDR': ip_address})
+        return response.status_code
+
+    def cleanup():
+        app_module.security_system.close()
+        app_module.security_system = original_system
+        os.close(db_fd)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.unlink(db_path + suffix)
+
+    return send, cleanup
+
+
+def http_sender(url):
+    """Envoie les requêtes en HTTP à un serveur déjà démarré"""
+    endpoint = url.rstrip('/') + '/api/login'
+
+    def send(ip_address, username, password):
+        request = urllib.request.Request(
+            endpoint,
+            data=json.dumps({'username': username, 'password': password}).encode(),
+            headers={'Content-Type': 'application/json', 'X-Forwarded-For': ip_address},
+            method='POST'
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+        except OSError:
+            return 0
+
+    return send, lambda: None
+
+
+def run(plan, threads, send):
+    """Rejoue le plan sur `threads` threads, renvoie les mesures par type de trafic"""
+    latencies = {'attack': [], 'legit': []}
+    statuses = {'attack': Counter(), 'legit': Counter()}
+    lock = threading.Lock()
+    position = iter(range(len(plan)))
+
+    def worker():
+        local_latencies = {'attack': [], 'legit': []}
+        local_statuses = {'attack': Counter(), 'legit': Counter()}
+        while True:
+            with lock:
+                index = next(position, None)
+            if index is None:
+                break
+            kind, ip_address, username, password = plan[index]
+            started = time.perf_counter()
+            status = send(ip_address, username, password)
+            local_latencies[kind].append(time.perf_counter() - started)
+            local_statuses[kind][status] += 1
+        with lock:
+            for kind in latencies:
+                latencies[kind].extend(local_latencies[kind])
+                statuses[kind].update(local_statuses[kind])
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    all_latencies = latencies['attack'] + latencies['legit']
+    result = {'threads': threads, 'elapsed_seconds': round(elapsed, 3), 'overall': summarize(all_latencies, elapsed)}
+    for kind in latencies:
+        result[kind] = summarize(latencies[kind], elapsed)
+        result[kind]['status_codes'] = {str(code): count for code, count in sorted(statuses[kind].items())}
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Charge de bout en bout sur /api/login')
+    parser.add_argument('--url', help='URL du serveur (sinon application en processus)')
+    parser.add_argument('--requests', type=int, default=5000, help='Nombre total de requêtes')
+    parser.add_argument('--threads', default='8', help='Nombres de threads clients (ex. 1,8,32)')
+    parser.add_argument('--attack-ratio', type=float, default=0.9, help='Part du trafic d\'attaque')
+    parser.add_argument('--attacker-ips', type=int, default=2000, help='Nombre d\'IPs attaquantes')
+    parser.add_argument('--legit-ips', type=int, default=200, help='Nombre d\'IPs légitimes')
+    parser.add_argument('--output', help='Fichier JSON de résultats (sinon sortie standard)')
+    args = parser.parse_args()
+
+    results = []
+    for threads in [int(n) for n in args.threads.split(',')]:
+        # Les journaux par requête fausseraient la mesure en processus
+        logging.disable(logging.CRITICAL)
+        send, cleanup = http_sender(args.url) if args.url else in_process_sender()
+        try:
+            plan = build_plan(args.requests, args.attack_ratio, args.attacker_ips, args.legit_ips)
+            result = run(plan, threads, send)
+        finally:
+            cleanup()
+        results.append(result)
+        print(f"{threads:>3} threads - {result['overall']['ops_per_second']:.0f} req/s - "
+              f"p50 {result['overall']['p50_ms']:.2f}ms - p99 {result['overall']['p99_ms']:.2f}ms",
+              file=sys.stderr)
+
+    write_results('login_load', {'mode': 'http' if args.url else 'in_process', 'runs': results}, args.output)
+
+
+if __name__ == '__main__':
+    main()
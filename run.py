@@ -6,31 +6,109 @@ import os
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
 from database import init_database
-from app import app
+from blocklist_io import EXPORT_FORMATS, export_blocklist, iter_blocklist_entries
 import argparse
+import getpass
 
 def main():
+    # Import différé : les processus du pool de hachage réimportent ce script
+    # et ne doivent pas recréer l'application
+    from app import app, credential_store, enable_demo_users, security_monitor, security_system
+
     parser = argparse.ArgumentParser(description='Système Anti-Brute Force')
     parser.add_argument('--init-db', action='store_true', help='Initialiser la base de données')
     parser.add_argument('--host', default='0.0.0.0', help='Adresse IP du serveur')
     parser.add_argument('--port', type=int, default=5000, help='Port du serveur')
     parser.add_argument('--debug', action='store_true', help='Mode debug')
+    parser.add_argument('--async', dest='async_mode', action='store_true',
+                        help='Servir l\'API sur une boucle asyncio (ASGI, nécessite uvicorn)')
+    parser.add_argument('--workers', type=int, default=16,
+                        help='Threads du pool de traitement en mode --async')
+    parser.add_argument('--import-blocklist', metavar='FICHIER',
+                        help='Bloquer les IPs/CIDR d\'une liste (texte, CSV ou nginx ; - pour stdin)')
+    parser.add_argument('--unblock-list', metavar='FICHIER',
+                        help='Débloquer les IPs/CIDR d\'une liste (- pour stdin)')
+    parser.add_argument('--export-blocklist', metavar='FICHIER',
+                        help='Exporter les blocages actifs (- pour stdout)')
+    parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='nginx',
+                        help='Format d\'export (défaut: nginx)')
+    parser.add_argument('--reason', help='Raison des blocages importés')
+    parser.add_argument('--duration', type=int, help='Durée des blocages importés (secondes)')
+    parser.add_argument('--set-password', metavar='UTILISATEUR',
+                        help='Créer un utilisateur ou changer son mot de passe (saisi au clavier)')
+    parser.add_argument('--delete-user', metavar='UTILISATEUR', help='Supprimer un utilisateur')
+    parser.add_argument('--demo-users', action='store_true',
+                        help='Créer les comptes de démonstration (développement uniquement)')
     
     args = parser.parse_args()
     
     if args.init_db:
         print("🗃️ Initialisation de la base de données...")
-        init_database()
+        init_database(security_system.db_path)
         print("✅ Base de données initialisée avec succès!")
         return
     
+    if args.import_blocklist or args.unblock_list:
+        path = args.import_blocklist or args.unblock_list
+        # Seul un fichier ouvert ici est refermé (jamais sys.stdin)
+        source = sys.stdin if path == '-' else open(path, encoding='utf-8')
+        try:
+            entries = iter_blocklist_entries(source)
+            if args.import_blocklist:
+                result = security_system.block_many(entries, reason=args.reason or "Import de liste de blocage",
+                                                    duration=args.duration)
+            else:
+                result = security_system.unblock_many(entries)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+        print(f"✅ {result['applied']} entrée(s) appliquée(s), {result['invalid']} invalide(s)", file=sys.stderr)
+        for sample in result['invalid_samples']:
+            print(f"   ⚠️ invalide: {sample}", file=sys.stderr)
+        return
+    
+    if args.export_blocklist:
+        if args.export_blocklist == '-':
+            sys.stdout.writelines(export_blocklist(security_system.iter_blocked_ips(), args.format))
+        else:
+            with open(args.export_blocklist, 'w', encoding='utf-8') as target:
+                target.writelines(export_blocklist(security_system.iter_blocked_ips(), args.format))
+        return
+    
+    if args.set_password:
+        password = getpass.getpass(f"Mot de passe pour {args.set_password}: ")
+        if not password or password != getpass.getpass("Confirmation: "):
+            print("❌ Mots de passe vides ou différents", file=sys.stderr)
+            sys.exit(1)
+        credential_store.set_password(args.set_password, password)
+        print(f"✅ Mot de passe enregistré pour {args.set_password}")
+        return
+    
+    if args.delete_user:
+        if credential_store.delete_user(args.delete_user):
+            print(f"✅ Utilisateur supprimé: {args.delete_user}")
+        else:
+            print(f"⚠️ Utilisateur inconnu: {args.delete_user}", file=sys.stderr)
+        return
+    
     # Démarrer l'application
     print(f"🚀 Démarrage du serveur sur {args.host}:{args.port}")
     print("📊 Interface web: http://localhost:5000")
     print("🔐 Tableau de bord: http://localhost:5000/dashboard")
-    print("🔑 Comptes de test: admin/admin123, user/user123, test/test123")
+    if args.demo_users:
+        enable_demo_users()
+        print("🔑 Comptes de test: admin/admin123, user/user123, test/test123")
+    else:
+        print("🔑 Comptes: python run.py --set-password UTILISATEUR (ou --demo-users en développement)")
     print("⏹️  Appuyez sur Ctrl+C pour arrêter le serveur")
     
+    security_monitor.start_monitoring()
+    if args.async_mode:
+        from asgi_app import serve
+        print(f"⚡ Mode asynchrone (ASGI) - {args.workers} threads de traitement")
+        serve(host=args.host, port=args.port, workers=args.workers)
+        return
+
     app.run(
         host=args.host,
         port=args.port,
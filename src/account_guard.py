@@ -0,0 +1,140 @@
+import logging
+import threading
+import time
+
+from metrics import REGISTRY
+from sliding_window import SlidingWindowCounter
+
+logger = logging.getLogger(__name__)
+
+ACCOUNT_THROTTLED = REGISTRY.counter(
+    'blockage_account_throttled_total',
+    'Tentatives refusées (429) sur des comptes ciblés'
+)
+
+
+class FailureRateDetector:
+    """Taux global d'échecs de connexion sur une fenêtre glissante approchée
+
+    La fenêtre est découpée en `buckets` tranches : la mémoire est constante
+    quel que soit le volume, et un pic réparti sur des milliers d'IPs reste
+    visible alors qu'aucune d'elles n'atteint le seuil par IP.
+    """
+
+    def __init__(self, window=60, buckets=12, threshold=300):
+        self.window = window
+        self.threshold = threshold
+        self.bucket_seconds = window / buckets
+        self._counts = [0] * buckets
+        self._slots = [-1] * buckets
+        self._lock = threading.Lock()
+
+    def hit(self, now=None):
+        """Compte un échec"""
+        now = time.time() if now is None else now
+        slot = int(now // self.bucket_seconds)
+        index = slot % len(self._counts)
+        with self._lock:
+            if self._slots[index] != slot:
+                self._slots[index] = slot
+                self._counts[index] = 0
+            self._counts[index] += 1
+
+    def count(self, now=None):
+        """Nombre d'échecs sur la fenêtre"""
+        now = time.time() if now is None else now
+        oldest = int(now // self.bucket_seconds) - len(self._counts)
+        with self._lock:
+            return sum(count for slot, count in zip(self._slots, self._counts) if slot > oldest)
+
+    def under_attack(self, now=None):
+        """Vrai si le taux d'échecs dépasse le seuil (attaque distribuée probable)"""
+        return self.count(now) >= self.threshold
+
+
+class AccountGuard:
+    """Protection des comptes ciblés par des attaques distribuées
+
+    Compte les échecs par nom d'utilisateur, toutes IPs confondues. Au-delà de
+    `threshold` échecs dans la fenêtre (`attack_threshold` quand le détecteur
+    global signale une attaque), le compte passe en mode protégé : une seule
+    tentative par `slowdown` secondes, les autres reçoivent 429 et Retry-After
+    sans vérification des identifiants. Le compte n'est jamais verrouillé pour
+    son propriétaire, seulement ralenti. La mémoire est bornée à `max_accounts`
+    noms (les moins récemment visés sont oubliés).
+    """
+
+    def __init__(self, window=900, threshold=20, attack_threshold=5, slowdown=5,
+                 max_accounts=50000, global_window=60, global_threshold=300):
+        self.window = window
+        self.threshold = threshold
+        self.attack_threshold = attack_threshold
+        self.slowdown = slowdown
+        # La capacité des fenêtres doit rester supérieure aux seuils
+        self.failures = SlidingWindowCounter(capacity=max(threshold, attack_threshold) + 1,
+                                             max_keys=max_accounts)
+        self.global_failures = FailureRateDetector(global_window, threshold=global_threshold)
+        self._attack_mode = False
+
+    @staticmethod
+    def key(username):
+        """Clé normalisée d'un nom d'utilisateur (None si vide)"""
+        return username.strip().lower() if username else None
+
+    def record_failure(self, username, now=None):
+        """Compte un échec pour ce compte et pour le taux global, renvoie les échecs du compte"""
+        now = time.time() if now is None else now
+        self.global_failures.hit(now)
+        key = self.key(username)
+        if not key:
+            return 0
+        return self.failures.hit(key, self.window, now)
+
+    def attack_mode(self, now=None):
+        """Vrai quand le taux global d'échecs signale une attaque distribuée"""
+        attack = self.global_failures.under_attack(now)
+        if attack != self._attack_mode:
+            self._attack_mode = attack
+            if attack:
+                logger.warning("Attaque distribuée détectée: %d échecs en %ds, seuil de protection des comptes abaissé à %d",
+                               self.global_failures.count(now), self.global_failures.window, self.attack_threshold)
+            else:
+                logger.info("Fin de l'attaque distribuée: seuil de protection des comptes rétabli à %d", self.threshold)
+        return attack
+
+    def retry_after(self, username, now=None):
+        """Secondes à attendre avant la prochaine tentative sur ce compte (0 : autorisée)"""
+        key = self.key(username)
+        if not key:
+            return 0
+        now = time.time() if now is None else now
+        failures = self.failures.count(key, self.window, now)
+        if not failures:
+            return 0
+        threshold = self.attack_threshold if self.attack_mode(now) else self.threshold
+        if failures < threshold:
+            return 0
+        wait = self.failures.last(key) + self.slowdown - now
+        if wait <= 0:
+            return 0
+        ACCOUNT_THROTTLED.inc()
+        return wait
+
+    def reset(self, username):
+        """Sort un compte du mode protégé"""
+        key = self.key(username)
+        if key:
+            self.failures.reset(key)
+
+    def purge(self, now=None):
+        """Supprime les comptes sans échec récent"""
+        return self.failures.purge(self.window, now)
+
+    def get_stats(self):
+        """État du détecteur pour la surveillance"""
+        return {
+            'tracked_accounts': len(self.failures),
+            'evicted_accounts': self.failures.evictions,
+            'global_failures': self.global_failures.count(),
+            'attack_mode': self._attack_mode,
+        }
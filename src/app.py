@@ -1,84 +1,237 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, Response, render_template, request, jsonify, session, redirect, url_for
+from credentials import CredentialStore, CredentialsOverloaded
+from blocklist import canonical_ip
+from blocklist_io import EXPORT_FORMATS, export_blocklist, iter_blocklist_entries
+from event_broker import SSE_HEARTBEAT, StatsPublisher, format_sse
+from fast_reject import FastRejectMiddleware, TrustedProxies
+from logging_setup import setup_logging
+from metrics import REGISTRY, LOGIN_SECONDS
+from monitoring import SecurityMonitor
 from security_system import AntiBruteForceSystem
+from state_backends import create_state_backend
+from tarpit import TARPIT_DELAYS
+import atexit
+import hmac
 import logging
+import math
+import os
+import time
 from datetime import datetime
 
 app = Flask(__name__)
 app.secret_key = 'votre_cle_secrete_tres_longue_ici_changez_moi'
 
-# Configuration du logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('security.log'),
-        logging.StreamHandler()
-    ]
+# Configuration du logging : JSON lines écrits hors des threads de requête
+setup_logging(
+    log_file=os.environ.get('BLOCKAGE_LOG_FILE', 'security.log'),
+    level=os.environ.get('BLOCKAGE_LOG_LEVEL', 'INFO').upper()
 )
 
 logger = logging.getLogger(__name__)
 
 # Initialisation des composants
-security_system = AntiBruteForceSystem()
+# BLOCKAGE_DB est le fichier SQLite (défaut: security.db dans le répertoire courant) ;
+# BLOCKAGE_STATE_BACKEND=redis://... partage compteurs et blocages entre workers gunicorn ;
+# BLOCKAGE_STATE_MEMORY_MB borne l'état local par IP ; BLOCKAGE_SNAPSHOT est l'instantané
+# rechargé au démarrage et réécrit par la surveillance (vide pour le désactiver)
+security_system = AntiBruteForceSystem(
+    os.environ.get('BLOCKAGE_DB', 'security.db'),
+    state_backend=create_state_backend(
+        os.environ.get('BLOCKAGE_STATE_BACKEND'),
+        max_memory=int(os.environ.get('BLOCKAGE_STATE_MEMORY_MB', '64')) * 1024 * 1024
+    ),
+    snapshot_path=os.environ.get('BLOCKAGE_SNAPSHOT', 'security.snapshot') or None
+)
+# BLOCKAGE_TARPIT=1 : délais progressifs entre les tentatives au lieu du blocage au 5e échec
+security_system.tarpit.enabled = os.environ.get('BLOCKAGE_TARPIT', '0') == '1'
+# Identifiants hachés (table users), vérifiés dans un pool de processus borné ;
+# BLOCKAGE_KDF_WORKERS=0 vérifie dans le thread de la requête
+credential_store = CredentialStore(
+    security_system.db,
+    max_workers=int(os.environ['BLOCKAGE_KDF_WORKERS']) if os.environ.get('BLOCKAGE_KDF_WORKERS') else None
+)
+# Comptes de démonstration aux mots de passe connus : jamais créés par défaut,
+# seulement avec BLOCKAGE_DEMO_USERS=1 ou `run.py --demo-users`
+DEMO_USERS = {
+    'admin': 'admin123',
+    'user': 'user123',
+    'test': 'test123'
+}
+demo_users_enabled = False
+
+def enable_demo_users():
+    """Crée les comptes de démonstration absents et les affiche sur la page de connexion"""
+    global demo_users_enabled
+    credential_store.seed_users(DEMO_USERS)
+    demo_users_enabled = True
+
+if os.environ.get('BLOCKAGE_DEMO_USERS', '0') == '1':
+    enable_demo_users()
+# Garantit l'écriture des tentatives en attente à l'arrêt du processus
+atexit.register(security_system.close)
+atexit.register(credential_store.close)
+# Rejet des IPs bloquées avant le routage Flask ; BLOCKAGE_TRUSTED_PROXIES
+# (ex. "127.0.0.1,10.0.0.0/8") liste les proxies dont X-Forwarded-For fait foi
+# (partagés avec le mode asynchrone, qui résout l'adresse du client de la même façon)
+trusted_proxies = TrustedProxies.from_string(os.environ.get('BLOCKAGE_TRUSTED_PROXIES'))
+app.wsgi_app = FastRejectMiddleware(
+    app.wsgi_app,
+    lambda ip_address: security_system.state.get_unblock_time(canonical_ip(ip_address)),
+    trusted_proxies
+)
+# Producteur unique des statistiques poussées aux tableaux de bord (/api/events)
+stats_publisher = StatsPublisher(security_system.events, lambda: security_system.get_security_stats())
+# Intervalle des commentaires de maintien de connexion du flux SSE
+SSE_HEARTBEAT_SECONDS = 15
+# Surveillance en arrière-plan (démarrée par run.py)
+security_monitor = SecurityMonitor(security_system)
+
+# Jauges lues à chaque collecte de /metrics
+REGISTRY.gauge('blockage_blocked_ips', 'IPs et préfixes actuellement bloqués',
+               lambda: security_system.state.blocked_count())
+REGISTRY.gauge('blockage_writer_queue_depth', 'Tentatives en attente d\'écriture',
+               lambda: security_system.attempt_writer.get_stats()['queue_depth'])
+REGISTRY.gauge('blockage_writer_dropped_total', 'Tentatives abandonnées par le writer',
+               lambda: security_system.attempt_writer.get_stats()['dropped'])
+REGISTRY.gauge('blockage_writer_last_flush_ms', 'Durée du dernier lot écrit (ms)',
+               lambda: security_system.attempt_writer.get_stats()['last_flush_ms'])
+REGISTRY.gauge('blockage_cleanup_last_duration_ms', 'Durée du dernier nettoyage (ms)',
+               lambda: security_system.cleanup_stats['last_duration_ms'])
+REGISTRY.gauge('blockage_cleanup_rows_removed_total', 'Tentatives purgées depuis le démarrage',
+               lambda: security_system.cleanup_stats['total_rows_removed'])
+REGISTRY.gauge('blockage_rollup_last_attempt_id', 'Dernière tentative comptée dans les agrégats historiques',
+               lambda: security_system.rollups.last_attempt_id)
+REGISTRY.gauge('blockage_ip_state_entries', 'Adresses suivies par l\'état local par IP',
+               lambda: security_system.state.get_stats().get('entries', 0))
+REGISTRY.gauge('blockage_ip_state_memory_bytes', 'Empreinte estimée de l\'état local par IP',
+               lambda: security_system.state.get_stats().get('memory_estimate', 0))
+REGISTRY.gauge('blockage_ip_state_evictions_total', 'Adresses évincées de l\'état local (plafond mémoire)',
+               lambda: security_system.state.get_stats().get('evictions', 0))
+REGISTRY.gauge('blockage_tracked_accounts', 'Noms d\'utilisateur suivis par la protection des comptes',
+               lambda: security_system.accounts.get_stats()['tracked_accounts'])
+REGISTRY.gauge('blockage_attack_mode', 'Attaque distribuée détectée (seuil des comptes abaissé)',
+               lambda: int(security_system.accounts.get_stats()['attack_mode']))
+REGISTRY.gauge('blockage_kdf_pending', 'Vérifications de mot de passe en cours ou en file',
+               lambda: credential_store.pending)
+REGISTRY.gauge('blockage_monitor_running', 'Surveillance en arrière-plan active',
+               lambda: int(security_monitor.running))
 
 # Page de connexion
 @app.route('/')
 def login_page():
-    return render_template('login.html')
+    return render_template('login.html', demo_users=DEMO_USERS if demo_users_enabled else None)
+
+def process_login(ip_address, username, password):
+    """Décision de connexion commune aux modes threadé (Flask) et asynchrone (ASGI)
+
+    Renvoie (code HTTP, corps JSON, issue) ; l'ouverture de session reste à la
+    charge de l'appelant quand l'issue est 'allowed'.
+    """
+    logger.debug("Tentative de connexion depuis %s - Utilisateur: %s", ip_address, username,
+                 extra={'ip': ip_address, 'username': username})
+
+    # Vérification préalable de blocage
+    allowed, message = security_system.check_and_block(ip_address, username)
+    if not allowed:
+        logger.warning("Connexion refusée - IP bloquée: %s - Raison: %s", ip_address, message,
+                       extra={'ip': ip_address, 'username': username})
+        return 403, {
+            'success': False, 
+            'message': message,
+            'blocked': True
+        }, 'blocked'
+
+    # Compte visé par une attaque répartie : tentative ralentie, identifiants non vérifiés
+    wait = security_system.check_account(username)
+    if wait:
+        retry_after = math.ceil(wait)
+        logger.warning("Connexion ralentie - compte ciblé: %s depuis %s (%ss)", username, ip_address, retry_after,
+                       extra={'ip': ip_address, 'username': username})
+        return 429, {
+            'success': False,
+            'message': f"Ce compte fait l'objet de nombreuses tentatives. Veuillez réessayer dans {retry_after} secondes.",
+            'throttled': True,
+            'retry_after': retry_after
+        }, 'throttled'
+
+    # Mode tarpit : tentative arrivée avant la fin du délai imposé par les échecs précédents
+    wait = security_system.next_attempt_delay(ip_address, username)
+    if wait:
+        retry_after = math.ceil(wait)
+        TARPIT_DELAYS.labels('rejected').inc()
+        return 429, {
+            'success': False,
+            'message': f"Trop de tentatives rapprochées. Veuillez patienter {retry_after} seconde(s).",
+            'throttled': True,
+            'tarpit': True,
+            'retry_after': retry_after
+        }, 'delayed'
+
+    # Vérification des identifiants
+    try:
+        is_valid = check_credentials(username, password)
+    except CredentialsOverloaded:
+        logger.warning("Vérification des identifiants délestée: %s depuis %s", username, ip_address,
+                       extra={'ip': ip_address, 'username': username})
+        return 503, {
+            'success': False,
+            'message': 'Serveur surchargé, réessayez',
+            'retry_after': 1
+        }, 'overloaded'
+    
+    if is_valid:
+        security_system.record_login_attempt(ip_address, username, True)
+        logger.info("Connexion réussie: %s depuis %s", username, ip_address,
+                    extra={'ip': ip_address, 'username': username})
+        return 200, {
+            'success': True, 
+            'message': 'Connexion réussie',
+            'redirect': '/dashboard'
+        }, 'allowed'
+
+    security_system.record_login_attempt(ip_address, username, False)
+    failed_attempts = security_system.get_recent_failed_attempts(ip_address)
+    
+    logger.warning("Échec connexion: %s depuis %s - Tentatives: %s", username, ip_address, failed_attempts,
+                   extra={'ip': ip_address, 'username': username})
+    payload = {
+        'success': False, 
+        'message': 'Identifiants incorrects',
+        'attempts_remaining': security_system.block_threshold() - failed_attempts
+    }
+    delay = security_system.next_attempt_delay(ip_address, username)
+    if delay:
+        payload['next_attempt_in'] = round(delay, 1)
+    return 200, payload, 'bad_credentials'
 
 # API de connexion
 @app.route('/api/login', methods=['POST'])
 def login():
+    started = time.perf_counter()
+    outcome = 'error'
     try:
         data = request.get_json()
         if not data:
+            outcome = 'invalid'
             return jsonify({'success': False, 'message': 'Données JSON requises'}), 400
         
         username = data.get('username', '').strip()
         password = data.get('password', '').strip()
         ip_address = request.remote_addr
 
-        logger.info(f"Tentative de connexion depuis {ip_address} - Utilisateur: {username}")
-
-        # Vérification préalable de blocage
-        allowed, message = security_system.check_and_block(ip_address, username)
-        if not allowed:
-            logger.warning(f"Connexion refusée - IP bloquée: {ip_address} - Raison: {message}")
-            return jsonify({
-                'success': False, 
-                'message': message,
-                'blocked': True
-            }), 403
-
-        # Vérification des identifiants
-        is_valid = check_credentials(username, password)
-        
-        if is_valid:
-            security_system.record_login_attempt(ip_address, username, True)
+        status, payload, outcome = process_login(ip_address, username, password)
+        if outcome == 'allowed':
             session['user'] = username
             session['ip'] = ip_address
             session['login_time'] = datetime.now().isoformat()
-            
-            logger.info(f"Connexion réussie: {username} depuis {ip_address}")
-            return jsonify({
-                'success': True, 
-                'message': 'Connexion réussie',
-                'redirect': '/dashboard'
-            })
-        else:
-            security_system.record_login_attempt(ip_address, username, False)
-            failed_attempts = security_system.get_recent_failed_attempts(ip_address)
-            
-            logger.warning(f"Échec connexion: {username} depuis {ip_address} - Tentatives: {failed_attempts}")
-            return jsonify({
-                'success': False, 
-                'message': 'Identifiants incorrects',
-                'attempts_remaining': security_system.max_attempts - failed_attempts
-            })
+        headers = {'Retry-After': str(payload['retry_after'])} if 'retry_after' in payload else {}
+        return jsonify(payload), status, headers
 
     except Exception as e:
-        logger.error(f"Erreur lors de la connexion: {str(e)}")
+        logger.error("Erreur lors de la connexion: %s", e)
         return jsonify({'success': False, 'message': 'Erreur interne du serveur'}), 500
+    finally:
+        LOGIN_SECONDS.labels(outcome).observe(time.perf_counter() - started)
 
 # Tableau de bord administrateur
 @app.route('/dashboard')
@@ -88,6 +241,14 @@ def dashboard():
     
     return render_template('dashboard.html')
 
+# Gestion des IPs bloquées
+@app.route('/blocked-ips')
+def blocked_ips_page():
+    if 'user' not in session:
+        return redirect('/')
+    
+    return render_template(' blocked_ips.html')
+
 # API pour les statistiques
 @app.route('/api/stats')
 def get_stats():
@@ -97,48 +258,189 @@ def get_stats():
     stats = security_system.get_security_stats()
     return jsonify(stats)
 
-# API pour les IPs bloquées
+# API pour les IPs bloquées (paginée, filtrable, revalidée par ETag)
 @app.route('/api/blocked-ips')
 def get_blocked_ips():
     if 'user' not in session:
         return jsonify({'error': 'Non autorisé'}), 401
     
-    blocked_ips = security_system.get_blocked_ips()
-    return jsonify(blocked_ips)
+    etag = security_system.blocked_ips_etag()
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        return Response(status=304, headers=headers)
+    
+    try:
+        page = security_system.get_blocked_ips_page(
+            limit=request.args.get('limit', 100, type=int),
+            cursor=request.args.get('cursor'),
+            prefix=request.args.get('prefix'),
+            reason=request.args.get('reason')
+        )
+    except ValueError:
+        return jsonify({'error': 'Curseur invalide'}), 400
+    return jsonify(page), 200, headers
+
+def etag_matches(if_none_match, etag):
+    """Vérifie si l'en-tête If-None-Match désigne l'ETag courant"""
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == '*' or etag in (tag.strip() for tag in if_none_match.split(','))
+
+# Flux d'événements du tableau de bord (Server-Sent Events)
+@app.route('/api/events')
+def events():
+    if 'user' not in session:
+        return jsonify({'error': 'Non autorisé'}), 401
+    
+    subscription = stats_publisher.subscribe()
+    
+    def stream():
+        with subscription:
+            yield b"retry: 5000\n\n"
+            while True:
+                event = subscription.get(timeout=SSE_HEARTBEAT_SECONDS)
+                yield SSE_HEARTBEAT if event is None else format_sse(event)
+    
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
 # API pour débloquer une IP
-@app.route('/api/unblock-ip/<ip_address>', methods=['POST'])
+@app.route('/api/unblock-ip/<path:ip_address>', methods=['POST'])
 def unblock_ip(ip_address):
     if 'user' not in session:
         return jsonify({'error': 'Non autorisé'}), 401
     
     success = security_system.unblock_ip(ip_address)
     if success:
-        logger.info(f"IP débloquée manuellement: {ip_address} par {session['user']}")
+        logger.info("IP débloquée manuellement: %s par %s", ip_address, session['user'])
         return jsonify({'success': True, 'message': f'IP {ip_address} débloquée'})
     else:
         return jsonify({'success': False, 'message': 'IP non trouvée'})
 
+# Blocage et déblocage en masse (liste texte/CSV/nginx en flux, JSON {"ips": [...]} ou [...])
+def _bulk_entries():
+    """Renvoie (entrées, raison) de la requête, sans charger un corps texte en entier
+
+    Lève ValueError si le corps JSON n'est ni une liste ni un objet {"ips": [...]}.
+    """
+    if request.is_json:
+        data = request.get_json(silent=True)
+        if isinstance(data, list):
+            data = {'ips': data}
+        if not isinstance(data, dict) or not isinstance(data.get('ips', []), list):
+            raise ValueError('Corps JSON attendu: liste d\'adresses ou {"ips": [...]}')
+        return ((str(ip), None) for ip in data.get('ips', [])), data.get('reason')
+    return iter_blocklist_entries(request.stream), request.args.get('reason')
+
+@app.route('/api/block-ips', methods=['POST'])
+def block_ips():
+    if 'user' not in session:
+        return jsonify({'error': 'Non autorisé'}), 401
+    
+    try:
+        entries, reason = _bulk_entries()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    result = security_system.block_many(
+        entries,
+        reason=reason or f"Blocage en masse par {session['user']}",
+        duration=request.args.get('duration', type=int)
+    )
+    logger.info("Blocage en masse par %s: %d clés", session['user'], result['applied'])
+    return jsonify({'success': True, **result})
+
+@app.route('/api/unblock-ips', methods=['POST'])
+def unblock_ips():
+    if 'user' not in session:
+        return jsonify({'error': 'Non autorisé'}), 401
+    
+    try:
+        entries, _ = _bulk_entries()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    result = security_system.unblock_many(entries)
+    logger.info("Déblocage en masse par %s: %d clés", session['user'], result['applied'])
+    return jsonify({'success': True, **result})
+
+# Export de la liste de blocage active (nginx deny, CSV ou texte), en flux
+@app.route('/api/blocked-ips/export')
+def export_blocked_ips():
+    if 'user' not in session:
+        return jsonify({'error': 'Non autorisé'}), 401
+    
+    fmt = request.args.get('format', 'nginx')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f"Format inconnu, attendu: {', '.join(EXPORT_FORMATS)}"}), 400
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    return Response(
+        export_blocklist(security_system.iter_blocked_ips(), fmt),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="blocklist.{extension}"'}
+    )
+
+# Historique agrégé : série d'une valeur ou classement sur une plage
+# (?from=&to= en secondes epoch, granularity=minute|hour|day, dimension=all|prefix|ip|username, key=)
+@app.route('/api/history')
+def get_history():
+    if 'user' not in session:
+        return jsonify({'error': 'Non autorisé'}), 401
+    
+    end = request.args.get('to', int(time.time()), type=int)
+    start = request.args.get('from', end - 24 * 3600, type=int)
+    try:
+        history = security_system.rollups.query(
+            start, end,
+            granularity=request.args.get('granularity'),
+            dimension=request.args.get('dimension', 'all'),
+            item=request.args.get('key'),
+            limit=request.args.get('limit', 20, type=int)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(history)
+
+# API de surveillance
+@app.route('/api/monitoring')
+def get_monitoring_stats():
+    if 'user' not in session:
+        return jsonify({'error': 'Non autorisé'}), 401
+    
+    return jsonify(security_monitor.get_monitoring_stats())
+
+# Métriques au format Prometheus : session administrateur, ou jeton du collecteur
+# (BLOCKAGE_METRICS_TOKEN, envoyé en "Authorization: Bearer <jeton>")
+METRICS_TOKEN = os.environ.get('BLOCKAGE_METRICS_TOKEN')
+
+def metrics_authorized():
+    if 'user' in session:
+        return True
+    if not METRICS_TOKEN:
+        return False
+    return hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {METRICS_TOKEN}")
+
+@app.route('/metrics')
+def metrics():
+    if not metrics_authorized():
+        return jsonify({'error': 'Non autorisé'}), 401
+    
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 # Déconnexion
 @app.route('/logout')
 def logout():
     username = session.get('user')
     session.clear()
-    logger.info(f"Déconnexion: {username}")
+    logger.info("Déconnexion: %s", username)
     return redirect('/')
 
 def check_credentials(username, password):
     """
     Fonction de vérification des identifiants
-    À remplacer par votre propre logique d'authentification
+    Délègue au magasin d'identifiants hachés (lève CredentialsOverloaded si saturé)
     """
-    # Exemple simple - À ADAPTER pour la production
-    valid_users = {
-        'admin': 'admin123',
-        'user': 'user123',
-        'test': 'test123'
-    }
-    return valid_users.get(username) == password
+    return credential_store.verify(username, password)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,441 @@
+import asyncio
+import io
+import itertools
+import json
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+
+import app as web
+from blocklist import canonical_ip
+from event_broker import SSE_HEARTBEAT, format_sse
+from fast_reject import BLOCKED_BODY, FAST_REJECTS, retry_after
+from metrics import LOGIN_SECONDS
+from tarpit import TARPIT_DELAYS
+
+logger = logging.getLogger(__name__)
+
+JSON_HEADERS = [(b'content-type', b'application/json')]
+
+
+class AsyncLoginAPI:
+    """Application ASGI servant l'API de connexion sur une boucle asyncio
+
+    /api/login, /api/stats et /api/blocked-ips sont traités directement : une
+    connexion lente ne coûte qu'une coroutine, plus un thread. Le travail
+    bloquant (état partagé, SQLite) passe par un pool de threads borné ; au-delà
+    de `max_pending` traitements en attente, la requête reçoit un 503 plutôt
+    que d'allonger la file. Les autres routes (pages, déblocage, exports,
+    /metrics) sont relayées à l'application Flask via le même pool : le corps
+    de la requête est lu en entier, la réponse est transmise par morceaux au
+    fil de l'itérateur WSGI. Le flux /api/events est servi ici, jamais relayé.
+
+    L'adresse du client est résolue comme par FastRejectMiddleware :
+    X-Forwarded-For n'est lu que derrière un proxy de confiance
+    (`trusted_proxies`, par défaut ceux de BLOCKAGE_TRUSTED_PROXIES).
+
+    La session est le cookie signé de Flask : une connexion ouverte ici est
+    valide pour le tableau de bord, et inversement.
+
+    En mode tarpit, les délais entre tentatives sont tenus sur la boucle :
+    une tentative anticipée attend son tour et un échec est répondu après le
+    délai imposé, sans thread immobilisé. Au-delà de `max_tarpitted`
+    connexions en attente (ou d'un délai supérieur à `max_tarpit_delay`), la
+    réponse est un 429 immédiat comme en mode threadé.
+    """
+
+    def __init__(self, flask_app=None, max_workers=16, max_pending=256, max_body=64 * 1024,
+                 max_forward_body=16 * 1024 * 1024, max_tarpitted=10000, max_tarpit_delay=30.0,
+                 trusted_proxies=None):
+        self.flask_app = flask_app or web.app
+        self.trusted_proxies = web.trusted_proxies if trusted_proxies is None else trusted_proxies
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_body = max_body
+        # Les routes relayées incluent les imports de listes de blocage
+        self.max_forward_body = max_forward_body
+        self.forward_chunk = 64 * 1024
+        self.max_tarpitted = max_tarpitted
+        self.max_tarpit_delay = max_tarpit_delay
+        self.tarpitted = 0
+        self._executor = None
+        self._pending = None
+        self._routes = {
+            ('POST', '/api/login'): self.login,
+            ('GET', '/api/stats'): self.get_stats,
+            ('GET', '/api/blocked-ips'): self.get_blocked_ips,
+            ('GET', '/api/events'): self.events,
+        }
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='asgi-worker')
+        return self._executor
+
+    def shutdown(self):
+        """Arrête le pool de threads"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def run_blocking(self, func, *args):
+        """Exécute `func` dans le pool borné, ou lève OverflowError si la file est pleine"""
+        if self._pending is None:
+            self._pending = asyncio.Semaphore(self.max_pending)
+        if self._pending.locked():
+            raise OverflowError("File de traitement pleine")
+        async with self._pending:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        handler = self._routes.get((scope['method'], scope['path']))
+        try:
+            if handler is None:
+                await self.forward_to_flask(scope, receive, send)
+            else:
+                await handler(scope, receive, send)
+        except OverflowError:
+            await self.send_json(send, 503, {'success': False, 'message': 'Serveur surchargé, réessayez'},
+                                 [(b'retry-after', b'1')])
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def read_body(self, receive, max_body=None):
+        """Lit le corps de la requête, None s'il dépasse `max_body`"""
+        max_body = self.max_body if max_body is None else max_body
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > max_body:
+                return None
+            chunks.append(chunk)
+            if not message.get('more_body', False):
+                return b''.join(chunks)
+
+    @staticmethod
+    async def send_json(send, status, payload, headers=()):
+        body = json.dumps(payload).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': JSON_HEADERS + [(b'content-length', str(len(body)).encode())] + list(headers),
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    # Session Flask (cookie signé)
+
+    def _session_cookie_name(self):
+        return self.flask_app.config['SESSION_COOKIE_NAME']
+
+    def load_session(self, scope):
+        """Décode la session Flask du cookie de la requête, {} si absente ou invalide"""
+        cookie = SimpleCookie()
+        for name, value in scope['headers']:
+            if name == b'cookie':
+                cookie.load(value.decode('latin-1'))
+        morsel = cookie.get(self._session_cookie_name())
+        if morsel is None:
+            return {}
+        serializer = self.flask_app.session_interface.get_signing_serializer(self.flask_app)
+        max_age = int(self.flask_app.permanent_session_lifetime.total_seconds())
+        try:
+            return serializer.loads(morsel.value, max_age=max_age)
+        except Exception:
+            return {}
+
+    def session_cookie_header(self, data):
+        serializer = self.flask_app.session_interface.get_signing_serializer(self.flask_app)
+        value = serializer.dumps(data)
+        return (b'set-cookie', f"{self._session_cookie_name()}={value}; HttpOnly; Path=/".encode())
+
+    # Routes servies sur la boucle
+
+    async def login(self, scope, receive, send):
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            ip_address = self.client_address(scope)
+            if await self.fast_reject(ip_address, send):
+                outcome = 'blocked'
+                return
+
+            body = await self.read_body(receive)
+            try:
+                data = json.loads(body) if body else None
+            except ValueError:
+                data = None
+            if not isinstance(data, dict) or not data:
+                outcome = 'invalid'
+                await self.send_json(send, 400, {'success': False, 'message': 'Données JSON requises'})
+                return
+
+            username = str(data.get('username', '')).strip()
+            password = str(data.get('password', '')).strip()
+
+            wait = web.security_system.next_attempt_delay(ip_address, username)
+            if wait:
+                await self.tarpit(wait)
+
+            status, payload, outcome = await self.run_blocking(web.process_login, ip_address, username, password)
+            if 'next_attempt_in' in payload and await self.tarpit(payload['next_attempt_in']):
+                # Réponse différée : le client peut retenter dès qu'il la reçoit
+                del payload['next_attempt_in']
+
+            headers = []
+            if 'retry_after' in payload:
+                headers.append((b'retry-after', str(payload['retry_after']).encode()))
+            if outcome == 'allowed':
+                headers.append(self.session_cookie_header({
+                    'user': username,
+                    'ip': ip_address,
+                    'login_time': datetime.now().isoformat(),
+                }))
+            await self.send_json(send, status, payload, headers)
+        except OverflowError:
+            outcome = 'overloaded'
+            raise
+        except Exception as e:
+            logger.error("Erreur lors de la connexion: %s", e)
+            await self.send_json(send, 500, {'success': False, 'message': 'Erreur interne du serveur'})
+        finally:
+            LOGIN_SECONDS.labels(outcome).observe(time.perf_counter() - started)
+
+    async def tarpit(self, delay):
+        """Attend `delay` secondes sur la boucle, renvoie False si la capacité d'attente est épuisée"""
+        if delay > self.max_tarpit_delay or self.tarpitted >= self.max_tarpitted:
+            return False
+        TARPIT_DELAYS.labels('deferred').inc()
+        self.tarpitted += 1
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self.tarpitted -= 1
+        return True
+
+    async def fast_reject(self, ip_address, send):
+        """Rejette une IP bloquée avant la lecture du corps (état local uniquement)
+
+        Avec un état partagé, la consultation est un appel réseau : elle est
+        laissée à process_login, dans le pool de threads.
+        """
+        state = web.security_system.state
+        if ip_address is None or state.shared:
+            return False
+        unblock_time = state.get_unblock_time(canonical_ip(ip_address))
+        if unblock_time is None:
+            return False
+        FAST_REJECTS.inc()
+        await send({
+            'type': 'http.response.start',
+            'status': 403,
+            'headers': JSON_HEADERS + [
+                (b'content-length', str(len(BLOCKED_BODY)).encode()),
+                (b'retry-after', retry_after(unblock_time).encode()),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': BLOCKED_BODY})
+        return True
+
+    async def get_stats(self, scope, receive, send):
+        if 'user' not in self.load_session(scope):
+            await self.send_json(send, 401, {'error': 'Non autorisé'})
+            return
+        stats = await self.run_blocking(web.security_system.get_security_stats)
+        await self.send_json(send, 200, stats)
+
+    async def get_blocked_ips(self, scope, receive, send):
+        if 'user' not in self.load_session(scope):
+            await self.send_json(send, 401, {'error': 'Non autorisé'})
+            return
+        etag = await self.run_blocking(web.security_system.blocked_ips_etag)
+        headers = [(b'etag', etag.encode()), (b'cache-control', b'private, no-cache')]
+        if web.etag_matches(self._header(scope, b'if-none-match'), etag):
+            await send({'type': 'http.response.start', 'status': 304, 'headers': headers})
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+
+        query = {key: values[0] for key, values in parse_qs(scope.get('query_string', b'').decode()).items()}
+        try:
+            limit = int(query.get('limit', 100))
+        except ValueError:
+            limit = 100
+        try:
+            page = await self.run_blocking(
+                partial(web.security_system.get_blocked_ips_page, limit=limit, cursor=query.get('cursor'),
+                        prefix=query.get('prefix'), reason=query.get('reason'))
+            )
+        except ValueError:
+            await self.send_json(send, 400, {'error': 'Curseur invalide'})
+            return
+        await self.send_json(send, 200, page, headers)
+
+    def client_address(self, scope):
+        """Adresse du client, via X-Forwarded-For si la connexion vient d'un proxy de confiance"""
+        remote_addr = scope['client'][0] if scope.get('client') else None
+        if remote_addr is None or not self.trusted_proxies:
+            return remote_addr
+        return self.trusted_proxies.resolve(remote_addr, self._header(scope, b'x-forwarded-for'))
+
+    @staticmethod
+    def _header(scope, name):
+        for key, value in scope['headers']:
+            if key == name:
+                return value.decode('latin-1')
+        return None
+
+    async def events(self, scope, receive, send):
+        """Flux SSE du tableau de bord : une coroutine par abonné, aucun thread tenu"""
+        if 'user' not in self.load_session(scope):
+            await self.send_json(send, 401, {'error': 'Non autorisé'})
+            return
+        subscription = await self.run_blocking(web.stats_publisher.subscribe)
+        disconnected = asyncio.ensure_future(self._wait_disconnect(receive))
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [
+                    (b'content-type', b'text/event-stream'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no'),
+                ],
+            })
+            await send({'type': 'http.response.body', 'body': b"retry: 5000\n\n", 'more_body': True})
+            while True:
+                next_event = asyncio.ensure_future(subscription.aget(web.SSE_HEARTBEAT_SECONDS))
+                await asyncio.wait({next_event, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                if disconnected.done():
+                    next_event.cancel()
+                    break
+                event = next_event.result()
+                body = SSE_HEARTBEAT if event is None else format_sse(event)
+                await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+        finally:
+            disconnected.cancel()
+            subscription.close()
+
+    @staticmethod
+    async def _wait_disconnect(receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    # Relais WSGI pour les autres routes
+
+    def _wsgi_environ(self, scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', ''),
+            'PATH_INFO': scope['path'],
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope['headers']:
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+            elif name != 'CONTENT_LENGTH':
+                key = f"HTTP_{name}"
+                environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+    def _start_wsgi(self, environ):
+        """Appelle l'application Flask, renvoie (statut, en-têtes, résultat WSGI, itérateur du corps)"""
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+        result = self.flask_app.wsgi_app(environ, start_response)
+        chunks = iter(result)
+        if 'status' not in response:
+            # start_response peut n'être appelé qu'au premier morceau
+            chunks = itertools.chain([next(chunks, b'')], chunks)
+        return response['status'], response['headers'], result, chunks
+
+    def _read_chunks(self, chunks):
+        """Lit les morceaux suivants du corps jusqu'à `forward_chunk` octets, renvoie (données, terminé)"""
+        parts = []
+        size = 0
+        for chunk in chunks:
+            if chunk:
+                parts.append(chunk)
+                size += len(chunk)
+                if size >= self.forward_chunk:
+                    return b''.join(parts), False
+        return b''.join(parts), True
+
+    async def forward_to_flask(self, scope, receive, send):
+        """Relaie la requête à Flask ; la réponse est transmise en flux, par morceaux
+
+        Le corps de la requête est lu en entier (au plus `max_forward_body`).
+        Les petits morceaux de la réponse (lignes d'un export) sont regroupés
+        jusqu'à `forward_chunk` octets par passage dans le pool de threads.
+        """
+        body = await self.read_body(receive, self.max_forward_body)
+        if body is None:
+            await self.send_json(send, 413, {'error': 'Requête trop volumineuse'})
+            return
+        status, headers, result, chunks = await self.run_blocking(self._start_wsgi, self._wsgi_environ(scope, body))
+        loop = asyncio.get_running_loop()
+        try:
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            done = False
+            while not done:
+                # La réponse est commencée : la suite ne passe plus par la file bornée
+                data, done = await loop.run_in_executor(self.executor, self._read_chunks, chunks)
+                await send({'type': 'http.response.body', 'body': data, 'more_body': not done})
+        finally:
+            if hasattr(result, 'close'):
+                await loop.run_in_executor(self.executor, result.close)
+
+asgi_app = AsyncLoginAPI()
+
+
+def serve(host='0.0.0.0', port=5000, workers=16):
+    """Démarre le serveur ASGI (nécessite le paquet 'uvicorn')"""
+    try:
+        import uvicorn
+    except ImportError as e:
+        raise ImportError("Le mode asynchrone nécessite le paquet 'uvicorn' (pip install uvicorn)") from e
+    asgi_app.max_workers = workers
+    uvicorn.run(asgi_app, host=host, port=port, log_level='warning', lifespan='on')
@@ -0,0 +1,169 @@
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Marqueur d'arrêt du thread d'écriture
+_STOP = object()
+
+
+class AttemptWriter:
+    """Écriture en arrière-plan des tentatives de connexion dans SQLite
+
+    Les requêtes déposent leurs lignes dans une file bornée ; un thread dédié
+    les regroupe et les insère par lots (`executemany`, un seul commit) dès que
+    `batch_size` lignes sont en attente ou que `flush_interval` secondes se sont
+    écoulées depuis la première. Les décisions de blocage ne lisent jamais ces
+    lignes : elles reposent sur l'état en mémoire, mis à jour avant la soumission.
+
+    Politique de saturation (`overflow_policy`) :
+    - 'block' : attend jusqu'à `put_timeout` secondes une place dans la file,
+      puis écrit la ligne directement pour ne rien perdre du journal d'audit ;
+    - 'drop' : abandonne la ligne et incrémente le compteur `dropped`.
+    """
+
+    INSERT_SQL = '''INSERT INTO login_attempts
+        (ip_address, username, success, attempt_time)
+        VALUES (?, ?, ?, ?)'''
+
+    def __init__(self, db, max_queue=10000, batch_size=500, flush_interval=0.5,
+                 overflow_policy='block', put_timeout=0.05):
+        if overflow_policy not in ('block', 'drop'):
+            raise ValueError(f"Politique de saturation inconnue: {overflow_policy}")
+
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'submitted': 0,
+            'written': 0,
+            'batches': 0,
+            'dropped': 0,
+            'inline_writes': 0,
+            'errors': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+        }
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='attempt-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, row):
+        """Soumet une ligne (ip_address, username, success, attempt_time), renvoie False si abandonnée"""
+        if not self._running:
+            self._write([row])
+            return True
+
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            if self.overflow_policy == 'drop':
+                self._increment('dropped')
+                return False
+            try:
+                self._queue.put(row, timeout=self.put_timeout)
+            except queue.Full:
+                # Dernier recours : écriture directe dans le thread appelant
+                self._increment('inline_writes')
+                self._write([row])
+                return True
+
+        self._increment('submitted')
+        return True
+
+    def flush(self, timeout=None):
+        """Attend que toutes les lignes déjà soumises soient écrites"""
+        if not self._running:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def stop(self, timeout=None):
+        """Écrit les lignes en attente puis arrête le thread (idempotent)"""
+        if not self._running:
+            return
+        self._running = False
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def get_stats(self):
+        """Retourne les métriques du writer (profondeur de file, latence des flushs...)"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['queue_depth'] = self._queue.qsize()
+        stats['queue_capacity'] = self._queue.maxsize
+        stats['avg_flush_ms'] = stats['total_flush_ms'] / stats['batches'] if stats['batches'] else 0.0
+        return stats
+
+    def _increment(self, key, value=1):
+        with self._stats_lock:
+            self._stats[key] += value
+
+    def _run(self):
+        """Boucle du thread d'écriture"""
+        batch = []
+        deadline = None
+
+        while True:
+            timeout = None if not batch else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, tuple):
+                batch.append(item)
+                if len(batch) == 1:
+                    deadline = time.monotonic() + self.flush_interval
+                if len(batch) < self.batch_size:
+                    continue
+
+            if batch:
+                self._write(batch)
+                batch = []
+
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is _STOP:
+                break
+
+        # Lignes soumises pendant l'arrêt
+        leftovers = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, tuple):
+                leftovers.append(item)
+            elif isinstance(item, threading.Event):
+                item.set()
+        if leftovers:
+            self._write(leftovers)
+
+    def _write(self, batch):
+        """Insère un lot de lignes dans une seule transaction"""
+        started = time.perf_counter()
+        try:
+            with self.db.connection() as conn:
+                conn.executemany(self.INSERT_SQL, batch)
+        except Exception as e:
+            self._increment('errors', len(batch))
+            logger.error("Erreur écriture lot de tentatives (%d): %s", len(batch), e)
+            return
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._stats_lock:
+            self._stats['written'] += len(batch)
+            self._stats['batches'] += 1
+            self._stats['last_flush_ms'] = elapsed_ms
+            self._stats['total_flush_ms'] += elapsed_ms
+            self._stats['max_flush_ms'] = max(self._stats['max_flush_ms'], elapsed_ms)
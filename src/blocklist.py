@@ -0,0 +1,150 @@
+import heapq
+import ipaddress
+import threading
+import time
+from functools import lru_cache
+
+from prefix_trie import PrefixTrie
+
+
+def _unmapped(address):
+    """Ramène une adresse IPv4 mappée (::ffff:a.b.c.d) à l'adresse IPv4"""
+    if address.version == 6 and address.ipv4_mapped is not None:
+        return address.ipv4_mapped
+    return address
+
+
+@lru_cache(maxsize=65536)
+def canonical_ip(ip_address):
+    """Forme canonique d'une adresse de client ('2001:DB8:0::1' -> '2001:db8::1',
+    '::ffff:10.0.0.5' -> '10.0.0.5'), clé unique de l'état, des blocages et des recherches
+
+    Une valeur qui n'est pas une adresse est renvoyée telle quelle.
+    """
+    try:
+        return str(_unmapped(ipaddress.ip_address(ip_address)))
+    except ValueError:
+        return ip_address
+
+
+def normalize_block_key(value):
+    """Normalise une IP ou un préfixe CIDR ('10.0.0.7', '10.0.0.0/24', '2001:db8::/64')
+
+    Un préfixe de longueur maximale (/32, /128) est ramené à l'adresse seule,
+    un préfixe IPv4 mappé (::ffff:10.0.0.0/120) au préfixe IPv4 (10.0.0.0/24).
+    Lève ValueError si la valeur n'est ni une adresse ni un réseau valide.
+    """
+    network = ipaddress.ip_network(value.strip(), strict=False)
+    mapped = _unmapped(network.network_address)
+    if mapped is not network.network_address and network.prefixlen >= 96:
+        network = ipaddress.ip_network(f"{mapped}/{network.prefixlen - 96}")
+    if network.prefixlen == network.max_prefixlen:
+        return str(network.network_address)
+    return str(network)
+
+
+def is_prefix(key):
+    """Indique si une clé normalisée désigne un préfixe plutôt qu'une adresse"""
+    return '/' in key
+
+
+class BlocklistIndex:
+    """Index résident des IPs et préfixes bloqués : dictionnaire + tas d'expiration
+
+    Le dictionnaire associe chaque clé (adresse ou préfixe CIDR) à son heure de
+    déblocage (epoch) et répond en O(1) pour les adresses exactes ; les
+    préfixes sont en plus rangés dans un arbre de Patricia par famille (IPv4,
+    IPv6) pour une recherche du plus long préfixe en O(bits d'adresse).
+    Le tas min ordonné sur l'heure de déblocage permet d'expirer les entrées
+    paresseusement, sans balayage. Les entrées du tas devenues obsolètes
+    (clé débloquée ou rebloquée entre-temps) sont ignorées au moment du dépilement.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._expiry_heap = []
+        self._tries = {4: PrefixTrie(32), 6: PrefixTrie(128)}
+        self._lock = threading.Lock()
+
+    def _trie_add(self, key, unblock_time):
+        network = ipaddress.ip_network(key)
+        self._tries[network.version].insert(int(network.network_address), network.prefixlen, unblock_time)
+
+    def _trie_remove(self, key):
+        network = ipaddress.ip_network(key)
+        self._tries[network.version].remove(int(network.network_address), network.prefixlen)
+
+    def add(self, key, unblock_time, keep_longer=False):
+        """Ajoute ou remplace le blocage d'une clé normalisée jusqu'à `unblock_time`
+
+        Avec `keep_longer`, un blocage existant qui se termine plus tard est conservé.
+        """
+        with self._lock:
+            current = self._entries.get(key)
+            if keep_longer and current is not None and current >= unblock_time:
+                return
+            self._entries[key] = unblock_time
+            if is_prefix(key):
+                self._trie_add(key, unblock_time)
+            heapq.heappush(self._expiry_heap, (unblock_time, key))
+
+    def remove(self, key):
+        """Retire une clé de l'index, renvoie True si elle y figurait"""
+        with self._lock:
+            if self._entries.pop(key, None) is None:
+                return False
+            if is_prefix(key):
+                self._trie_remove(key)
+            return True
+
+    def get_unblock_time(self, ip_address, now=None):
+        """Renvoie l'heure de déblocage d'une IP bloquée (directement ou par préfixe), ou None"""
+        now = time.time() if now is None else now
+        if self._expiry_heap and self._expiry_heap[0][0] <= now:
+            self.expire(now)
+
+        unblock_time = self._entries.get(ip_address)
+        if unblock_time is not None:
+            return unblock_time
+        # Adresse sous une autre écriture (majuscules, zéros, IPv4 mappée)
+        key = canonical_ip(ip_address)
+        if key != ip_address:
+            unblock_time = self._entries.get(key)
+            if unblock_time is not None:
+                return unblock_time
+
+        if self.prefix_count():
+            try:
+                address = ipaddress.ip_address(key)
+            except ValueError:
+                return None
+            match = self._tries[address.version].longest_match(int(address))
+            if match is not None:
+                return match[1]
+        return None
+
+    def is_blocked(self, ip_address, now=None):
+        """Vérifie si une IP est bloquée, sans accès disque"""
+        return self.get_unblock_time(ip_address, now) is not None
+
+    def expire(self, now=None):
+        """Retire les blocages arrivés à échéance, renvoie le nombre de clés débloquées"""
+        now = time.time() if now is None else now
+        expired = 0
+        with self._lock:
+            while self._expiry_heap and self._expiry_heap[0][0] <= now:
+                unblock_time, key = heapq.heappop(self._expiry_heap)
+                if self._entries.get(key) == unblock_time:
+                    del self._entries[key]
+                    if is_prefix(key):
+                        self._trie_remove(key)
+                    expired += 1
+        return expired
+
+    def prefix_count(self):
+        """Nombre de préfixes bloqués"""
+        return len(self._tries[4]) + len(self._tries[6])
+
+    def __len__(self):
+        self.expire()
+        return len(self._entries)
@@ -0,0 +1,65 @@
+import csv
+import io
+
+# Formats d'export : (type MIME, extension)
+EXPORT_FORMATS = {
+    'nginx': ('text/plain', 'conf'),
+    'csv': ('text/csv', 'csv'),
+    'txt': ('text/plain', 'txt'),
+}
+
+
+def iter_blocklist_entries(lines):
+    """Lit une liste d'IPs/CIDR ligne à ligne, renvoie des couples (clé brute, raison ou None)
+
+    Formats acceptés, mélangeables : une adresse par ligne, CSV (adresse en
+    première colonne, raison optionnelle en deuxième) et directives nginx
+    `deny 10.0.0.0/8;` (un export peut être réimporté tel quel). Les lignes
+    vides et les commentaires (#) sont ignorés. Rien n'est chargé en entier.
+    """
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', 'replace')
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        if line.startswith('deny '):
+            yield line[5:].rstrip(';').strip(), None
+            continue
+        if ',' in line:
+            fields = next(csv.reader([line]))
+            if fields[0].strip() == 'ip_address':
+                continue  # en-tête d'un export CSV
+            reason = fields[1].strip() if len(fields) > 1 and fields[1].strip() else None
+            yield fields[0].strip(), reason
+            continue
+        yield line, None
+
+
+def _csv_line(values):
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerow(values)
+    return buffer.getvalue()
+
+
+def export_blocklist(entries, fmt='nginx'):
+    """Sérialise des blocages (dicts compacts) ligne à ligne au format demandé
+
+    - nginx : une directive `deny` par adresse, à inclure dans un bloc server ;
+    - csv : ip_address,reason,block_time,unblock_time (epoch) ;
+    - txt : une adresse ou un préfixe par ligne.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Format d'export inconnu: {fmt}")
+    if fmt == 'nginx':
+        yield "# Liste de blocage générée par le système anti-brute force\n"
+    elif fmt == 'csv':
+        yield _csv_line(['ip_address', 'reason', 'block_time', 'unblock_time'])
+
+    for entry in entries:
+        if fmt == 'nginx':
+            yield f"deny {entry['ip_address']};\n"
+        elif fmt == 'csv':
+            yield _csv_line([entry['ip_address'], entry['reason'] or '', entry['block_time'], entry['unblock_time']])
+        else:
+            yield f"{entry['ip_address']}\n"
@@ -0,0 +1,255 @@
+import base64
+import hashlib
+import hmac
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Paramètres scrypt des nouveaux hachages (n=2^14, r=8 : 16 Mo et ~50 ms par vérification)
+SCRYPT_PARAMS = (2 ** 14, 8, 1)
+SCRYPT_DKLEN = 32
+SALT_BYTES = 16
+
+KDF_SECONDS = REGISTRY.histogram('blockage_kdf_seconds', 'Durée des vérifications de mot de passe (file comprise)')
+KDF_SHED = REGISTRY.counter('blockage_kdf_shed_total', 'Vérifications refusées, pool de hachage saturé')
+
+
+class CredentialsOverloaded(OverflowError):
+    """Trop de vérifications de mot de passe en attente : la requête est délestée"""
+
+
+def _b64encode(data):
+    return base64.b64encode(data).decode('ascii').rstrip('=')
+
+
+def _b64decode(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+def hash_password(password, params=SCRYPT_PARAMS):
+    """Hache un mot de passe : "scrypt$n$r$p$sel$empreinte" (paramètres inclus)"""
+    n, r, p = params
+    salt = os.urandom(SALT_BYTES)
+    digest = hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+                            maxmem=256 * n * r + 1024 * 1024, dklen=SCRYPT_DKLEN)
+    return f"scrypt${n}${r}${p}${_b64encode(salt)}${_b64encode(digest)}"
+
+
+def _parse_hash(encoded):
+    algorithm, n, r, p, salt, digest = encoded.split('$')
+    if algorithm != 'scrypt':
+        raise ValueError(f"Algorithme de hachage inconnu: {algorithm}")
+    return (int(n), int(r), int(p)), _b64decode(salt), _b64decode(digest)
+
+
+def verify_password(password, encoded):
+    """Vérifie un mot de passe contre un hachage (comparaison en temps constant)"""
+    (n, r, p), salt, expected = _parse_hash(encoded)
+    digest = hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+                            maxmem=256 * n * r + 1024 * 1024, dklen=len(expected))
+    return hmac.compare_digest(digest, expected)
+
+
+def needs_rehash(encoded, params=SCRYPT_PARAMS):
+    """Vrai si le hachage a été produit avec d'autres paramètres que `params`"""
+    try:
+        return _parse_hash(encoded)[0] != tuple(params)
+    except ValueError:
+        return True
+
+
+def _verify_and_rehash(password, encoded, params):
+    """Tâche du pool : (valide, nouveau hachage si les paramètres ont changé)"""
+    if not verify_password(password, encoded):
+        return False, None
+    return True, hash_password(password, params) if needs_rehash(encoded, params) else None
+
+
+class CredentialStore:
+    """Identifiants hachés (scrypt) stockés dans la table users
+
+    Les vérifications, coûteuses par construction, tournent dans un pool de
+    `max_workers` processus : les threads de requête (liés au GIL) restent
+    disponibles. Au-delà de `max_pending` vérifications en cours ou en file,
+    les nouvelles sont refusées (CredentialsOverloaded) plutôt que d'empiler
+    du travail de hachage au service d'un déni de service. Un utilisateur
+    inconnu coûte le même hachage qu'un mot de passe faux, et un hachage aux
+    paramètres périmés est remplacé à la connexion suivante.
+
+    Les connexions réussies récentes sont mémorisées `cache_ttl` secondes
+    sous une empreinte HMAC (clé propre au processus) de l'utilisateur, du
+    mot de passe et du hachage : une reconnexion évite le KDF, un mot de
+    passe faux n'est jamais en cache. `max_workers=0` vérifie dans le thread
+    appelant (tests, environnements sans processus).
+    """
+
+    def __init__(self, db, params=SCRYPT_PARAMS, max_workers=None, max_pending=None,
+                 timeout=10.0, cache_ttl=300, cache_size=1024):
+        self.db = db
+        self.params = tuple(params)
+        self.max_workers = (os.cpu_count() or 1) if max_workers is None else max_workers
+        self.max_pending = max_pending or 4 * max(1, self.max_workers)
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._pending_lock = threading.Lock()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._cache = {}
+        self._cache_key = os.urandom(32)
+        self._cache_lock = threading.Lock()
+        self._dummy_hash = None
+        self.pending = 0
+        self.shed = 0
+
+    @property
+    def dummy_hash(self):
+        """Hachage d'un secret aléatoire, vérifié pour les utilisateurs inconnus
+
+        Calculé à la première vérification : importer l'application ou lancer
+        une commande d'administration ne paie pas le coût du KDF.
+        """
+        if self._dummy_hash is None:
+            self._dummy_hash = hash_password(os.urandom(16).hex(), self.params)
+        return self._dummy_hash
+
+    @property
+    def executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                # forkserver : les workers ne réimportent pas l'application et
+                # ne sont pas forkés depuis un processus multi-thread
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                if 'forkserver' in methods:
+                    context.set_forkserver_preload(['credentials'])
+                self._executor = ProcessPoolExecutor(self.max_workers, mp_context=context)
+            return self._executor
+
+    def _run(self, password, encoded):
+        if not self.max_workers:
+            return _verify_and_rehash(password, encoded, self.params)
+        future = self.executor.submit(_verify_and_rehash, password, encoded, self.params)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # Pool bloqué ou en retard : délestage (503) plutôt qu'une erreur interne
+            future.cancel()
+            self.shed += 1
+            KDF_SHED.inc()
+            raise CredentialsOverloaded("Vérification du mot de passe trop longue") from None
+
+    def _cache_digest(self, username, password, encoded):
+        message = '\0'.join((username, password, encoded)).encode('utf-8')
+        return hmac.new(self._cache_key, message, hashlib.sha256).digest()
+
+    def _cached(self, digest, now):
+        with self._cache_lock:
+            expires = self._cache.get(digest)
+            if expires is None:
+                return False
+            if expires < now:
+                del self._cache[digest]
+                return False
+            return True
+
+    def _remember(self, digest, now):
+        with self._cache_lock:
+            if len(self._cache) >= self.cache_size:
+                self._cache.pop(next(iter(self._cache)))
+            self._cache[digest] = now + self.cache_ttl
+
+    def _get_hash(self, username):
+        with self.db.connection() as conn:
+            row = conn.execute('SELECT password_hash FROM users WHERE username = ?', (username,)).fetchone()
+        return row[0] if row else None
+
+    def verify(self, username, password):
+        """Vérifie des identifiants, lève CredentialsOverloaded si le pool est saturé"""
+        encoded = self._get_hash(username) if username else None
+        now = time.time()
+        digest = None
+        if encoded is not None:
+            digest = self._cache_digest(username, password, encoded)
+            if self._cached(digest, now):
+                return True
+
+        if not self._slots.acquire(blocking=False):
+            self.shed += 1
+            KDF_SHED.inc()
+            raise CredentialsOverloaded("Trop de vérifications de mot de passe en attente")
+        with self._pending_lock:
+            self.pending += 1
+        started = time.perf_counter()
+        try:
+            # Utilisateur inconnu : même coût qu'un mauvais mot de passe
+            valid, new_hash = self._run(password, encoded or self.dummy_hash)
+        finally:
+            KDF_SECONDS.observe(time.perf_counter() - started)
+            with self._pending_lock:
+                self.pending -= 1
+            self._slots.release()
+
+        if encoded is None or not valid:
+            return False
+        if new_hash:
+            self._update_hash(username, encoded, new_hash)
+            digest = self._cache_digest(username, password, new_hash)
+        self._remember(digest, now)
+        return True
+
+    def _update_hash(self, username, old_hash, new_hash):
+        with self.db.connection() as conn:
+            # Ne remplace pas un mot de passe changé entre-temps
+            conn.execute(
+                'UPDATE users SET password_hash = ?, updated_at = ? WHERE username = ? AND password_hash = ?',
+                (new_hash, int(time.time()), username, old_hash)
+            )
+        logger.info("Hachage du mot de passe mis à jour: %s", username, extra={'username': username})
+
+    def set_password(self, username, password):
+        """Crée un utilisateur ou change son mot de passe"""
+        now = int(time.time())
+        with self.db.connection() as conn:
+            conn.execute(
+                '''INSERT INTO users (username, password_hash, created_at, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(username) DO UPDATE SET password_hash = excluded.password_hash,
+                                                    updated_at = excluded.updated_at''',
+                (username, hash_password(password, self.params), now, now)
+            )
+
+    def delete_user(self, username):
+        """Supprime un utilisateur, renvoie True s'il existait"""
+        with self.db.connection() as conn:
+            return conn.execute('DELETE FROM users WHERE username = ?', (username,)).rowcount > 0
+
+    def seed_users(self, users):
+        """Crée les utilisateurs {nom: mot de passe} absents (comptes de démonstration)"""
+        with self.db.connection() as conn:
+            existing = {row[0] for row in conn.execute('SELECT username FROM users')}
+        for username, password in users.items():
+            if username not in existing:
+                self.set_password(username, password)
+
+    def get_stats(self):
+        return {
+            'workers': self.max_workers,
+            'pending': self.pending,
+            'max_pending': self.max_pending,
+            'shed': self.shed,
+            'cached': len(self._cache),
+        }
+
+    def close(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
@@ -1,43 +1,264 @@
 import sqlite3
 import logging
-from datetime import datetime
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import SQLITE_TRANSACTION_SECONDS
 
 logger = logging.getLogger(__name__)
 
+# Paramètres appliqués à chaque connexion du pool
+BUSY_TIMEOUT_MS = 5000
+CACHED_STATEMENTS = 256
+
+# Migrations du schéma, appliquées dans l'ordre et suivies via PRAGMA user_version.
+# Chaque migration est une liste d'instructions exécutées dans une transaction.
+MIGRATIONS = [
+    (1, "Schéma initial", [
+        '''CREATE TABLE IF NOT EXISTS login_attempts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ip_address TEXT NOT NULL,
+            username TEXT,
+            success INTEGER DEFAULT 0,
+            attempt_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        '''CREATE TABLE IF NOT EXISTS blocked_ips (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ip_address TEXT NOT NULL UNIQUE,
+            block_reason TEXT,
+            block_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            unblock_time TIMESTAMP
+        )''',
+    ]),
+    # Les horodatages ISO (heure locale) deviennent des epoch entiers (UTC)
+    (2, "Horodatages en epoch entier", [
+        '''CREATE TABLE login_attempts_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ip_address TEXT NOT NULL,
+            username TEXT,
+            success INTEGER DEFAULT 0,
+            attempt_time INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+        )''',
+        '''INSERT INTO login_attempts_new (id, ip_address, username, success, attempt_time)
+        SELECT id, ip_address, username, success,
+               CASE WHEN typeof(attempt_time) = 'text'
+                    THEN COALESCE(CAST(strftime('%s', attempt_time, 'utc') AS INTEGER),
+                                  CAST(strftime('%s', 'now') AS INTEGER))
+                    ELSE attempt_time END
+        FROM login_attempts''',
+        'DROP TABLE login_attempts',
+        'ALTER TABLE login_attempts_new RENAME TO login_attempts',
+        '''CREATE TABLE blocked_ips_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ip_address TEXT NOT NULL UNIQUE,
+            block_reason TEXT,
+            block_time INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+            unblock_time INTEGER
+        )''',
+        '''INSERT INTO blocked_ips_new (id, ip_address, block_reason, block_time, unblock_time)
+        SELECT id, ip_address, block_reason,
+               CASE WHEN typeof(block_time) = 'text'
+                    THEN COALESCE(CAST(strftime('%s', block_time, 'utc') AS INTEGER),
+                                  CAST(strftime('%s', 'now') AS INTEGER))
+                    ELSE block_time END,
+               CASE WHEN typeof(unblock_time) = 'text'
+                    THEN CAST(strftime('%s', unblock_time, 'utc') AS INTEGER)
+                    ELSE unblock_time END
+        FROM blocked_ips''',
+        'DROP TABLE blocked_ips',
+        'ALTER TABLE blocked_ips_new RENAME TO blocked_ips',
+    ]),
+    (3, "Index des tentatives et des blocages", [
+        '''CREATE INDEX IF NOT EXISTS idx_login_attempts_ip_success_time
+        ON login_attempts (ip_address, success, attempt_time)''',
+        '''CREATE INDEX IF NOT EXISTS idx_login_attempts_success_time
+        ON login_attempts (success, attempt_time)''',
+        '''CREATE INDEX IF NOT EXISTS idx_login_attempts_time
+        ON login_attempts (attempt_time)''',
+        '''CREATE INDEX IF NOT EXISTS idx_blocked_ips_unblock_time
+        ON blocked_ips (unblock_time)''',
+    ]),
+    # Pagination de /api/blocked-ips par (block_time, id) : l'index contient
+    # implicitement le rowid (id), l'ordre est lu sans tri
+    (4, "Index des blocages par heure de blocage", [
+        '''CREATE INDEX IF NOT EXISTS idx_blocked_ips_block_time
+        ON blocked_ips (block_time)''',
+    ]),
+    # Historique des récidives (blocages progressifs) : une ligne par IP ou
+    # préfixe, conservée après la fin du blocage jusqu'à décroissance complète
+    (5, "Historique des récidives", [
+        '''CREATE TABLE IF NOT EXISTS ip_offenses (
+            ip_address TEXT PRIMARY KEY,
+            offense_level INTEGER NOT NULL,
+            blocked_until INTEGER NOT NULL
+        ) WITHOUT ROWID''',
+        'ALTER TABLE blocked_ips ADD COLUMN offense_level INTEGER NOT NULL DEFAULT 1',
+    ]),
+    # Identifiants hachés (format "scrypt$n$r$p$sel$empreinte", voir credentials.py)
+    (6, "Table des utilisateurs", [
+        '''CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            password_hash TEXT NOT NULL,
+            created_at INTEGER NOT NULL,
+            updated_at INTEGER NOT NULL
+        ) WITHOUT ROWID''',
+    ]),
+    # Agrégats par minute, heure et jour (voir rollups.py) : une série se lit
+    # par plage de clé primaire, le classement d'une plage par (dimension, bucket).
+    # rollup_state garde le dernier identifiant de login_attempts agrégé.
+    (7, "Agrégats historiques des tentatives", [
+        *(f'''CREATE TABLE IF NOT EXISTS rollup_{name} (
+            dimension TEXT NOT NULL,
+            item TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            attempts INTEGER NOT NULL,
+            failures INTEGER NOT NULL,
+            PRIMARY KEY (dimension, item, bucket)
+        ) WITHOUT ROWID''' for name in ('minute', 'hour', 'day')),
+        *(f'''CREATE INDEX IF NOT EXISTS idx_rollup_{name}_bucket
+        ON rollup_{name} (dimension, bucket)''' for name in ('minute', 'hour', 'day')),
+        '''CREATE TABLE IF NOT EXISTS rollup_state (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        ) WITHOUT ROWID''',
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def apply_migrations(conn):
+    """Applique les migrations manquantes, renvoie la liste des versions appliquées"""
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    applied = []
+    try:
+        current = conn.execute('PRAGMA user_version').fetchone()[0]
+        # Base vierge : l'auto_vacuum incrémental ne peut être choisi qu'avant
+        # la création des tables (une base existante garde son mode)
+        if current == 0 and conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0] == 0:
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        for version, description, statements in MIGRATIONS:
+            if version <= current:
+                continue
+
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                # Une autre instance a pu migrer entre-temps
+                if conn.execute('PRAGMA user_version').fetchone()[0] >= version:
+                    conn.execute('COMMIT')
+                    continue
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f'PRAGMA user_version = {version}')
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+            logger.info("Migration %d appliquée: %s", version, description)
+            applied.append(version)
+    finally:
+        conn.isolation_level = isolation_level
+    return applied
+
+def migrate_database(db_path='security.db'):
+    """Met le schéma de la base à jour (idempotent)"""
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000)
+    try:
+        return apply_migrations(conn)
+    finally:
+        conn.close()
+
 def init_database(db_path='security.db'):
     """Initialise la base de données SQLite"""
     try:
-        with sqlite3.connect(db_path) as conn:
-            # Table des tentatives de connexion
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS login_attempts (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    ip_address TEXT NOT NULL,
-                    username TEXT,
-                    success INTEGER DEFAULT 0,
-                    attempt_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Table des IPs bloquées
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS blocked_ips (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    ip_address TEXT NOT NULL UNIQUE,
-                    block_reason TEXT,
-                    block_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    unblock_time TIMESTAMP
-                )
-            ''')
-            
-            conn.commit()
-        
+        migrate_database(db_path)
         print("✅ Base de données initialisée avec succès")
         
     except Exception as e:
         print(f"❌ Erreur initialisation base de données: {str(e)}")
         raise
 
+class ConnectionPool:
+    """Pool de connexions SQLite réutilisables
+
+    Les connexions sont ouvertes une seule fois, en mode WAL (les lectures ne
+    sont plus sérialisées derrière les écritures) avec `synchronous=NORMAL`,
+    un `busy_timeout` et un cache de requêtes préparées. Une connexion n'est
+    utilisée que par un thread à la fois puis rendue au pool, ce qui convient
+    aussi aux serveurs qui créent un thread par requête.
+    """
+
+    def __init__(self, db_path='security.db', max_idle=8,
+                 busy_timeout=BUSY_TIMEOUT_MS, cached_statements=CACHED_STATEMENTS):
+        self.db_path = db_path
+        self.max_idle = max_idle
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self._idle = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout / 1000,
+            cached_statements=self.cached_statements,
+            check_same_thread=False
+        )
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout)}')
+        return conn
+
+    def acquire(self):
+        """Emprunte une connexion au pool (ou en ouvre une nouvelle)"""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._connect()
+
+    def release(self, conn):
+        """Rend une connexion au pool"""
+        with self._lock:
+            if not self._closed and len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    @contextmanager
+    def connection(self):
+        """Fournit une connexion du pool dans une transaction (commit ou rollback en sortie)"""
+        conn = self.acquire()
+        started = time.perf_counter()
+        try:
+            with conn:
+                yield conn
+        finally:
+            SQLITE_TRANSACTION_SECONDS.observe(time.perf_counter() - started)
+            self.release(conn)
+
+    def close(self):
+        """Ferme toutes les connexions inactives du pool"""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_connection_pool(db_path='security.db'):
+    """Retourne le pool partagé associé à un fichier de base de données"""
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None:
+            pool = _pools[db_path] = ConnectionPool(db_path)
+        return pool
+
 def get_db_connection(db_path='security.db'):
-    """Retourne une connexion à la base de données"""
-    return sqlite3.connect(db_path)
+    """Retourne une connexion du pool partagé (à utiliser avec `with`)"""
+    return get_connection_pool(db_path).connection()
@@ -0,0 +1,216 @@
+import asyncio
+import itertools
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """File d'événements d'un abonné (un onglet du tableau de bord)
+
+    La file est bornée : un abonné trop lent perd les événements les plus
+    anciens et reçoit à la place un événement 'resync' lui demandant de
+    recharger l'état complet. Utilisable depuis un thread (`get`) ou depuis
+    une boucle asyncio (`aget`).
+    """
+
+    def __init__(self, broker, max_pending=100):
+        self.broker = broker
+        self._events = deque(maxlen=max_pending)
+        self._overflowed = False
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._loop = None
+        self._async_ready = None
+
+    def push(self, event):
+        with self._lock:
+            if len(self._events) == self._events.maxlen:
+                self._overflowed = True
+            self._events.append(event)
+            # Boucle et événement lus ensemble : `aget` les publie sous le même verrou
+            loop, async_ready = self._loop, self._async_ready
+        self._ready.set()
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(async_ready.set)
+            except RuntimeError:
+                # Boucle de l'abonné déjà fermée : l'événement reste dans la file
+                pass
+
+    def _pop(self):
+        with self._lock:
+            if self._overflowed:
+                self._overflowed = False
+                self._events.clear()
+                return (None, 'resync', {})
+            if self._events:
+                return self._events.popleft()
+            self._ready.clear()
+            if self._async_ready is not None:
+                self._async_ready.clear()
+            return None
+
+    def get(self, timeout=None):
+        """Renvoie le prochain événement (id, type, données), ou None après `timeout` secondes"""
+        event = self._pop()
+        if event is None and self._ready.wait(timeout):
+            event = self._pop()
+        return event
+
+    async def aget(self, timeout=None):
+        """Équivalent asynchrone de `get`"""
+        if self._loop is None:
+            async_ready = asyncio.Event()
+            with self._lock:
+                if self._events or self._overflowed:
+                    async_ready.set()
+                self._async_ready = async_ready
+                self._loop = asyncio.get_running_loop()
+        event = self._pop()
+        if event is None:
+            try:
+                await asyncio.wait_for(self._async_ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+            event = self._pop()
+        return event
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class EventBroker:
+    """Diffusion d'événements (blocages, statistiques) à tous les abonnés
+
+    La publication coûte une itération sur les abonnés et n'effectue aucune
+    requête : elle est appelée depuis le chemin de blocage. Les derniers
+    événements des types « persistants » (ex. 'stats') sont conservés et
+    remis à chaque nouvel abonné.
+    """
+
+    def __init__(self, sticky_types=('stats',), max_pending=100):
+        self.sticky_types = frozenset(sticky_types)
+        self.max_pending = max_pending
+        self._subscribers = set()
+        self._latest = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        """Crée un abonné, à fermer avec `close()` (ou via `with`)"""
+        subscription = Subscription(self, self.max_pending)
+        with self._lock:
+            for event in self._latest.values():
+                subscription.push(event)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def publish(self, event_type, data, snapshot=None):
+        """Envoie un événement à tous les abonnés
+
+        Pour un type persistant, `snapshot` (l'état complet, par défaut `data`)
+        est ce que recevront les prochains abonnés.
+        """
+        with self._lock:
+            event_id = next(self._ids)
+            event = (event_id, event_type, data)
+            if event_type in self.sticky_types:
+                self._latest[event_type] = (event_id, event_type, data if snapshot is None else snapshot)
+            subscribers = list(self._subscribers)
+        # Un abonné défaillant ne doit pas faire échouer l'appelant (chemin de blocage)
+        for subscription in subscribers:
+            try:
+                subscription.push(event)
+            except Exception:
+                logger.exception("Événement %s non remis à un abonné", event_type)
+
+    def latest(self, event_type):
+        """Données du dernier événement persistant de ce type, ou None"""
+        event = self._latest.get(event_type)
+        return event[2] if event else None
+
+
+class StatsPublisher:
+    """Producteur unique des statistiques du tableau de bord
+
+    Un thread calcule les statistiques toutes les `interval` secondes, tant
+    qu'il y a des abonnés, et ne publie que les champs modifiés : le coût
+    est le même pour un ou cent tableaux de bord ouverts. L'état complet est
+    conservé par le broker pour les nouveaux abonnés.
+    """
+
+    def __init__(self, broker, get_stats, interval=2.0):
+        self.broker = broker
+        self.get_stats = get_stats
+        self.interval = interval
+        self.current = {}
+        self._thread = None
+        self._lock = threading.Lock()
+        self._publish_lock = threading.Lock()
+
+    def start(self):
+        """Démarre le thread producteur (sans effet s'il tourne déjà)"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='stats-publisher', daemon=True)
+                self._thread.start()
+
+    def subscribe(self):
+        """Abonne un client, en démarrant le producteur au premier abonnement"""
+        if not self.current:
+            self.publish_changes()
+        self.start()
+        return self.broker.subscribe()
+
+    def publish_changes(self):
+        """Calcule les statistiques et publie les champs modifiés, renvoie le delta"""
+        with self._publish_lock:
+            stats = self.get_stats()
+            delta = {key: value for key, value in stats.items() if self.current.get(key) != value}
+            if delta:
+                self.current = {**self.current, **delta}
+                # Le delta pour les abonnés existants, l'état complet pour les nouveaux
+                self.broker.publish('stats', delta, snapshot=self.current)
+            return delta
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            if not self.broker.subscriber_count():
+                continue
+            try:
+                self.publish_changes()
+            except Exception as e:
+                logger.error("Erreur publication des statistiques: %s", e)
+
+
+def format_sse(event):
+    """Sérialise un événement (id, type, données) au format text/event-stream"""
+    event_id, event_type, data = event
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return ('\n'.join(lines) + '\n\n').encode()
+
+
+SSE_HEARTBEAT = b": ping\n\n"
@@ -0,0 +1,119 @@
+import ipaddress
+import json
+import logging
+import math
+import time
+
+from metrics import REGISTRY
+from security_system import BLOCKED_MESSAGE
+
+logger = logging.getLogger(__name__)
+
+FAST_REJECTS = REGISTRY.counter(
+    'blockage_fast_rejects_total',
+    'Requêtes d\'IPs bloquées rejetées avant le routage Flask'
+)
+
+# Réponse de rejet calculée une seule fois
+BLOCKED_BODY = json.dumps({'success': False, 'message': BLOCKED_MESSAGE, 'blocked': True}).encode()
+
+
+def retry_after(unblock_time, now=None):
+    """Valeur de l'en-tête Retry-After (secondes entières, au moins 1)"""
+    now = time.time() if now is None else now
+    return str(max(1, math.ceil(unblock_time - now)))
+
+
+class TrustedProxies:
+    """Adresses ou réseaux des reverse proxies dont X-Forwarded-For fait foi"""
+
+    def __init__(self, specs=()):
+        self.networks = [ipaddress.ip_network(spec.strip(), strict=False) for spec in specs if spec.strip()]
+        self._cache = {}
+
+    @classmethod
+    def from_string(cls, value):
+        """Construit la liste à partir d'une chaîne séparée par des virgules"""
+        return cls((value or '').split(','))
+
+    def __bool__(self):
+        return bool(self.networks)
+
+    def __contains__(self, address):
+        trusted = self._cache.get(address)
+        if trusted is None:
+            try:
+                parsed = ipaddress.ip_address(address)
+                trusted = any(parsed in network for network in self.networks)
+            except ValueError:
+                trusted = False
+            # Cache borné : les adresses vues ici sont surtout celles des proxies
+            if len(self._cache) < 1024:
+                self._cache[address] = trusted
+        return trusted
+
+    def resolve(self, remote_addr, forwarded_for):
+        """Renvoie l'adresse du client
+
+        X-Forwarded-For n'est lu que si la connexion vient d'un proxy de
+        confiance ; la liste est parcourue de droite à gauche et la première
+        adresse qui n'est pas un proxy de confiance est retenue.
+        """
+        if not forwarded_for or not self.networks or remote_addr not in self:
+            return remote_addr
+        client = remote_addr
+        for hop in reversed(forwarded_for.split(',')):
+            client = hop.strip()
+            if client not in self:
+                break
+        return client or remote_addr
+
+
+class FastRejectMiddleware:
+    """Middleware WSGI qui rejette les IPs bloquées avant Flask
+
+    La liste de blocage est consultée sur l'adresse du client dès réception
+    de la requête : une IP bloquée reçoit un 403 au corps précalculé avec
+    Retry-After, sans routage, lecture du JSON, chargement de session ni
+    journalisation par requête (un message résumé tous les `log_every` rejets).
+
+    L'adresse résolue (X-Forwarded-For de confiance) remplace REMOTE_ADDR pour
+    l'application, qui voit ainsi la même adresse que le middleware.
+    """
+
+    def __init__(self, wsgi_app, get_unblock_time, trusted_proxies=None, paths=('/api/login',),
+                 log_every=1000):
+        self.wsgi_app = wsgi_app
+        self.get_unblock_time = get_unblock_time
+        self.trusted_proxies = trusted_proxies or TrustedProxies()
+        self.paths = frozenset(paths) if paths is not None else None
+        self.log_every = log_every
+        self.rejected = 0
+        self._headers = [
+            ('Content-Type', 'application/json'),
+            ('Content-Length', str(len(BLOCKED_BODY))),
+        ]
+
+    def __call__(self, environ, start_response):
+        remote_addr = environ.get('REMOTE_ADDR')
+        if self.trusted_proxies:
+            client = self.trusted_proxies.resolve(remote_addr, environ.get('HTTP_X_FORWARDED_FOR'))
+            if client != remote_addr:
+                environ['REMOTE_ADDR'] = client
+                remote_addr = client
+
+        if self.paths is None or environ.get('PATH_INFO') in self.paths:
+            unblock_time = self.get_unblock_time(remote_addr) if remote_addr else None
+            if unblock_time is not None:
+                return self.reject(remote_addr, unblock_time, start_response)
+
+        return self.wsgi_app(environ, start_response)
+
+    def reject(self, remote_addr, unblock_time, start_response):
+        start_response('403 FORBIDDEN', self._headers + [('Retry-After', retry_after(unblock_time))])
+        FAST_REJECTS.inc()
+        self.rejected += 1
+        if (self.rejected - 1) % self.log_every == 0:
+            logger.warning("Rejet rapide des IPs bloquées: %d requêtes (dernière: %s)", self.rejected, remote_addr,
+                           extra={'ip': remote_addr})
+        return [BLOCKED_BODY]
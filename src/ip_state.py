@@ -0,0 +1,177 @@
+import socket
+import threading
+import time
+from array import array
+
+# Empreinte d'une entrée hors horodatages (mesurée : clé entière, enregistrement
+# à __slots__, tableau, case du dict), majorée
+_ENTRY_OVERHEAD = 300
+# Nombre d'enregistrements examinés, des moins récemment utilisés, pour trouver une victime
+_EVICTION_SAMPLE = 32
+
+
+def ip_key(ip_address):
+    """Clé entière d'une adresse : IPv4 en ::ffff:a.b.c.d, IPv6 sur 128 bits
+
+    Les chaînes qui ne sont pas des adresses (noms, tests) sont gardées telles quelles.
+    """
+    try:
+        return 0xFFFF00000000 | int.from_bytes(socket.inet_pton(socket.AF_INET, ip_address), 'big')
+    except (OSError, TypeError):
+        pass
+    try:
+        return int.from_bytes(socket.inet_pton(socket.AF_INET6, ip_address), 'big')
+    except (OSError, TypeError):
+        return ip_address
+
+
+class _IPRecord:
+    """Échecs récents d'une adresse : horodatages en tableau de doubles (8 octets chacun)"""
+
+    __slots__ = ('stamps',)
+
+    def __init__(self):
+        self.stamps = array('d')
+
+    def prune(self, threshold):
+        stamps = self.stamps
+        expired = 0
+        for stamp in stamps:
+            if stamp > threshold:
+                break
+            expired += 1
+        if expired:
+            del stamps[:expired]
+        return len(stamps)
+
+
+class IPStateTable:
+    """Fenêtres d'échecs par IP, en mémoire bornée
+
+    Remplace un dict de deques quand les adresses sources sont contrôlées par
+    l'attaquant (IPv6 : une adresse par tentative ne coûte rien). Les clés
+    sont des entiers (adresse packée), chaque entrée un enregistrement à
+    `__slots__` dont les horodatages tiennent dans un `array('d')` d'au plus
+    `capacity` valeurs.
+
+    Au-delà de `max_bytes` (estimation), la table évince une entrée parmi
+    les moins récemment utilisées, en préférant une adresse dont les échecs
+    sont sortis de la fenêtre, sinon celle qui en a le moins : les adresses
+    réellement en train d'échouer sont gardées le plus longtemps. Les entrées
+    expirées sont aussi retirées par `purge` (TTL de la fenêtre).
+
+    Même interface que SlidingWindowCounter (hit, count, reset, purge).
+    """
+
+    def __init__(self, capacity=32, max_bytes=64 * 1024 * 1024, window_seconds=900):
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        # Fenêtre pour reconnaître une entrée « propre » à l'éviction (celle du dernier appel)
+        self.window_seconds = window_seconds
+        self.entry_bytes = _ENTRY_OVERHEAD + 8 * capacity
+        self.max_entries = max(1, max_bytes // self.entry_bytes)
+        self.evictions = 0
+        self.evicted_with_failures = 0
+        self.expired = 0
+        self._records = {}
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        threshold = now - self.window_seconds
+        victim = None
+        victim_failures = None
+        for checked, (key, record) in enumerate(self._records.items()):
+            if checked >= _EVICTION_SAMPLE:
+                break
+            if not record.stamps or record.stamps[-1] <= threshold:
+                victim, victim_failures = key, 0
+                break
+            failures = len(record.stamps)
+            if victim is None or failures < victim_failures:
+                victim, victim_failures = key, failures
+        del self._records[victim]
+        self.evictions += 1
+        if victim_failures:
+            self.evicted_with_failures += 1
+
+    def hit(self, ip_address, window_seconds, timestamp=None):
+        """Ajoute un échec pour l'adresse et renvoie le nombre d'échecs dans la fenêtre"""
+        now = time.time() if timestamp is None else timestamp
+        key = ip_key(ip_address)
+        with self._lock:
+            self.window_seconds = window_seconds
+            # Réinsertion : l'ordre du dict devient l'ordre d'utilisation
+            record = self._records.pop(key, None)
+            if record is None:
+                if len(self._records) >= self.max_entries:
+                    self._evict(now)
+                record = _IPRecord()
+            self._records[key] = record
+            if len(record.stamps) >= self.capacity:
+                del record.stamps[0]
+            record.stamps.append(now)
+            return record.prune(now - window_seconds)
+
+    def count(self, ip_address, window_seconds, now=None):
+        """Renvoie le nombre d'échecs de l'adresse sur les `window_seconds` dernières secondes"""
+        now = time.time() if now is None else now
+        key = ip_key(ip_address)
+        with self._lock:
+            record = self._records.get(key)
+            if record is None:
+                return 0
+            count = record.prune(now - window_seconds)
+            if not count:
+                del self._records[key]
+                self.expired += 1
+            return count
+
+    def reset(self, ip_address):
+        """Oublie les échecs d'une adresse"""
+        with self._lock:
+            self._records.pop(ip_key(ip_address), None)
+
+    def purge(self, window_seconds, now=None):
+        """Supprime les entrées dont tous les échecs sont expirés, renvoie leur nombre"""
+        now = time.time() if now is None else now
+        threshold = now - window_seconds
+        with self._lock:
+            stale = [key for key, record in self._records.items()
+                     if not record.stamps or record.stamps[-1] <= threshold]
+            for key in stale:
+                del self._records[key]
+            self.expired += len(stale)
+            return len(stale)
+
+    def dump(self):
+        """Copie des fenêtres : liste de couples (clé packée, horodatages), pour les instantanés"""
+        with self._lock:
+            return [(key, array('d', record.stamps)) for key, record in self._records.items()]
+
+    def restore(self, key, stamps):
+        """Recharge la fenêtre d'une clé packée (dans la limite du plafond)"""
+        with self._lock:
+            if key not in self._records and len(self._records) >= self.max_entries:
+                return False
+            record = self._records[key] = _IPRecord()
+            record.stamps.extend(stamps[-self.capacity:])
+            return True
+
+    def memory_estimate(self):
+        """Empreinte estimée en octets (majorant : fenêtres pleines)"""
+        return len(self._records) * self.entry_bytes
+
+    def get_stats(self):
+        """Compteurs pour la surveillance"""
+        return {
+            'entries': len(self._records),
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'memory_estimate': self.memory_estimate(),
+            'evictions': self.evictions,
+            'evicted_with_failures': self.evicted_with_failures,
+            'expired': self.expired,
+        }
+
+    def __len__(self):
+        return len(self._records)
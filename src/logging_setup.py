@@ -0,0 +1,157 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+# Attributs standard d'un LogRecord, exclus des champs structurés
+_RESERVED_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+_queue_handler = None
+_setup_lock = threading.Lock()
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Formate chaque enregistrement en une ligne JSON compacte
+
+    Les champs passés via `extra=` (ip, username, ...) sont ajoutés tels quels.
+    """
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str, separators=(',', ':'))
+
+
+class PerIPRateLimitFilter(logging.Filter):
+    """Limite les messages répétitifs par IP pendant une attaque
+
+    Au plus `burst` enregistrements par couple (IP, modèle de message) et par
+    intervalle de `interval` secondes ; les suivants sont supprimés et leur
+    nombre est reporté (champ `suppressed`) sur le prochain message accepté.
+    Les enregistrements sans champ `ip` et ceux de niveau ERROR ou plus passent
+    toujours. Le nombre de clés suivies est borné (éviction LRU).
+    """
+
+    def __init__(self, burst=5, interval=60.0, max_keys=10000):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.max_keys = max_keys
+        self._windows = OrderedDict()
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        ip_address = getattr(record, 'ip', None)
+        if ip_address is None or record.levelno >= logging.ERROR:
+            return True
+
+        key = (ip_address, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window is not None else 0
+                window = [now, 0, 0]
+                self._windows[key] = window
+                if len(self._windows) > self.max_keys:
+                    self._windows.popitem(last=False)
+            else:
+                suppressed = 0
+                self._windows.move_to_end(key)
+
+            if window[1] >= self.burst:
+                window[2] += 1
+                return False
+            window[1] += 1
+
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler qui ne formate rien et ne bloque jamais le thread appelant
+
+    Le message est formaté par le thread du QueueListener (formatage paresseux) ;
+    si la file est pleine, l'enregistrement est abandonné et compté.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # File en mémoire du processus : pas besoin de sérialiser l'enregistrement
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(log_file='security.log', level=logging.INFO, max_bytes=10 * 1024 * 1024,
+                  backup_count=5, queue_size=10000, burst=5, interval=60.0):
+    """Installe le pipeline de journalisation asynchrone sur le logger racine
+
+    Les threads de requête ne font que filtrer et déposer l'enregistrement dans
+    une file bornée ; un QueueListener formate en JSON lines et écrit dans un
+    fichier à rotation par taille ainsi que sur la console. Idempotent : un
+    second appel renvoie le listener déjà démarré.
+    """
+    global _listener, _queue_handler
+    with _setup_lock:
+        if _listener is not None:
+            return _listener
+
+        formatter = JsonLinesFormatter()
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+        )
+        file_handler.setFormatter(formatter)
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(formatter)
+
+        log_queue = queue.Queue(maxsize=queue_size)
+        _queue_handler = NonBlockingQueueHandler(log_queue)
+        _queue_handler.addFilter(PerIPRateLimitFilter(burst=burst, interval=interval))
+
+        root = logging.getLogger()
+        root.setLevel(level)
+        root.addHandler(_queue_handler)
+
+        _listener = logging.handlers.QueueListener(
+            log_queue, file_handler, console_handler, respect_handler_level=True
+        )
+        _listener.start()
+        atexit.register(stop_logging)
+        return _listener
+
+
+def stop_logging():
+    """Vide la file et arrête le listener (appelé à la sortie du processus)"""
+    global _listener, _queue_handler
+    with _setup_lock:
+        if _listener is None:
+            return
+        logging.getLogger().removeHandler(_queue_handler)
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+        _queue_handler = None
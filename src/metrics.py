@@ -0,0 +1,270 @@
+import bisect
+import threading
+import time
+
+# Bornes par défaut des histogrammes de latence, en secondes (10 µs à 2,5 s)
+DEFAULT_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+)
+
+
+class _ShardedValues:
+    """Valeurs numériques réparties par thread
+
+    Chaque thread incrémente son propre tableau préalloué, sans verrou ; le
+    verrou n'est pris qu'à la première écriture d'un thread et à la lecture.
+    Les tableaux des threads terminés sont fusionnés à la lecture, ce qui borne
+    la mémoire avec les serveurs qui créent un thread par requête.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._local = threading.local()
+        self._shards = []
+        self._retired = [0] * size
+        self._lock = threading.Lock()
+
+    def shard(self):
+        values = getattr(self._local, 'values', None)
+        if values is None:
+            values = self._local.values = [0] * self.size
+            with self._lock:
+                self._shards.append((threading.current_thread(), values))
+        return values
+
+    def collect(self):
+        """Renvoie la somme des valeurs de tous les threads"""
+        with self._lock:
+            alive = []
+            for thread, values in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, values))
+                else:
+                    for index, value in enumerate(values):
+                        self._retired[index] += value
+            self._shards = alive
+            totals = list(self._retired)
+            for _, values in alive:
+                for index, value in enumerate(values):
+                    totals[index] += value
+        return totals
+
+
+class _CounterChild:
+    def __init__(self):
+        self._values = _ShardedValues(1)
+
+    def inc(self, amount=1):
+        self._values.shard()[0] += amount
+
+    def get(self):
+        return self._values.collect()[0]
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # Un compteur par borne, plus +Inf, la somme et le nombre d'observations
+        self._values = _ShardedValues(len(buckets) + 3)
+
+    def observe(self, value):
+        values = self._values.shard()
+        values[bisect.bisect_left(self.buckets, value)] += 1
+        values[-2] += value
+        values[-1] += 1
+
+    def time(self):
+        """Mesure la durée d'un bloc `with`"""
+        return _Timer(self)
+
+    def get(self):
+        values = self._values.collect()
+        return values[:-2], values[-2], values[-1]
+
+
+class _Timer:
+    __slots__ = ('histogram', 'started')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """Renvoie la série correspondant aux valeurs d'étiquettes (créée une seule fois)"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: étiquettes attendues {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _label_text(self, values, extra=None):
+        pairs = list(zip(self.labelnames, values))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}'
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class Counter(_Metric):
+    """Compteur monotone"""
+
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{self._label_text(values)} {child.get()}"]
+
+
+class Histogram(_Metric):
+    """Histogramme à compartiments préalloués"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+    def _render_child(self, values, child):
+        counts, total, count = child.get()
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f"{self.name}_bucket{self._label_text(values, ('le', le))} {cumulative}")
+        lines.append(f"{self.name}_sum{self._label_text(values)} {total}")
+        lines.append(f"{self.name}_count{self._label_text(values)} {count}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Jauge lue à la demande via une fonction"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, function):
+        self.function = function
+        super().__init__(name, documentation)
+
+    def _new_child(self):
+        return None
+
+    def _render_child(self, values, child):
+        try:
+            value = self.function()
+        except Exception:
+            value = float('nan')
+        return [f"{self.name} {value}"]
+
+
+class MetricsRegistry:
+    """Registre des métriques exposées au format texte Prometheus"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None and not isinstance(metric, Gauge):
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, function):
+        """Déclare (ou remplace) une jauge calculée par `function` à chaque lecture"""
+        return self._register(Gauge(name, documentation, function))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+# Métriques du chemin de décision, partagées par les modules
+SQLITE_TRANSACTION_SECONDS = REGISTRY.histogram(
+    'blockage_sqlite_transaction_seconds',
+    'Durée des transactions SQLite (connexion empruntée au pool)'
+)
+LOCK_WAIT_SECONDS = REGISTRY.histogram(
+    'blockage_lock_wait_seconds',
+    'Attente du verrou par IP avant vérification ou blocage'
+)
+CHECK_STAGE_SECONDS = REGISTRY.histogram(
+    'blockage_check_stage_seconds',
+    'Durée des étapes de check_and_block',
+    ('stage',)
+)
+RECORD_STAGE_SECONDS = REGISTRY.histogram(
+    'blockage_record_stage_seconds',
+    'Durée des étapes de record_login_attempt',
+    ('stage',)
+)
+LOGIN_SECONDS = REGISTRY.histogram(
+    'blockage_login_request_seconds',
+    'Latence de /api/login par issue',
+    ('outcome',)
+)
+MONITOR_LOOP_SECONDS = REGISTRY.histogram(
+    'blockage_monitor_loop_seconds',
+    'Durée d\'un passage de la boucle de surveillance',
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0)
+)
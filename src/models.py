@@ -2,6 +2,14 @@ from datetime import datetime
 from dataclasses import dataclass
 from typing import Optional
 
+def _to_datetime(value):
+    """Convertit un horodatage de la base (epoch entier ou texte ISO) en datetime"""
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value)
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
+
 @dataclass
 class LoginAttempt:
     """Modèle représentant une tentative de connexion"""
@@ -19,7 +27,7 @@ class LoginAttempt:
             ip_address=row[1],
             username=row[2],
             success=bool(row[3]),
-            attempt_time=datetime.fromisoformat(row[4]) if isinstance(row[4], str) else row[4]
+            attempt_time=_to_datetime(row[4])
         )
 
 @dataclass
@@ -38,8 +46,8 @@ class BlockedIP:
             id=row[0],
             ip_address=row[1],
             block_reason=row[2],
-            block_time=datetime.fromisoformat(row[3]) if isinstance(row[3], str) else row[3],
-            unblock_time=datetime.fromisoformat(row[4]) if isinstance(row[4], str) else row[4]
+            block_time=_to_datetime(row[3]),
+            unblock_time=_to_datetime(row[4])
         )
     
     @property
@@ -3,8 +3,10 @@ import time
 import logging
 from datetime import datetime, timedelta
 import smtplib
-from email.mime.text import MimeText
-from email.mime.multipart import MimeMultipart
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+
+from metrics import MONITOR_LOOP_SECONDS
 
 logger = logging.getLogger(__name__)
 
@@ -47,11 +49,14 @@ class SecurityMonitor:
         """Boucle principale de surveillance"""
         while self.running:
             try:
-                self.check_security_status()
-                self.security_system.cleanup_old_records()
+                with MONITOR_LOOP_SECONDS.time():
+                    self.check_security_status()
+                    self.security_system.rollups.run()
+                    self.security_system.cleanup_old_records()
+                    self.security_system.save_snapshot()
                 time.sleep(self.check_interval)
             except Exception as e:
-                logger.error(f"Erreur dans la boucle de monitoring: {str(e)}")
+                logger.error("Erreur dans la boucle de monitoring: %s", e)
                 time.sleep(60)  # Attendre 1 minute en cas d'erreur
 
     def check_security_status(self):
@@ -64,7 +69,7 @@ class SecurityMonitor:
                 self.send_security_alert(stats)
                 
         except Exception as e:
-            logger.error(f"Erreur vérification statut sécurité: {str(e)}")
+            logger.error("Erreur vérification statut sécurité: %s", e)
 
     def send_security_alert(self, stats):
         """Envoie une alerte par email"""
@@ -103,18 +108,18 @@ class SecurityMonitor:
             self.last_alert_time = datetime.now()
             logger.info("Alerte de sécurité envoyée")
         except Exception as e:
-            logger.error(f"Erreur envoi alerte: {str(e)}")
+            logger.error("Erreur envoi alerte: %s", e)
 
     def _send_email(self, subject, body):
         """Envoie un email (méthode à adapter selon votre configuration SMTP)"""
         # Cette méthode est un exemple - À ADAPTER pour votre environnement
         try:
-            msg = MimeMultipart()
+            msg = MIMEMultipart()
             msg['Subject'] = subject
             msg['From'] = self.smtp_config['from_email']
             msg['To'] = self.smtp_config['to_email']
             
-            text_part = MimeText(body, 'plain')
+            text_part = MIMEText(body, 'plain')
             msg.attach(text_part)
             
             # Décommentez et adaptez cette section pour envoyer des emails réels
@@ -126,10 +131,10 @@ class SecurityMonitor:
             """
             
             # Pour l'instant, on log juste l'email
-            logger.info(f"EMAIL ALERTE: {subject}\n{body}")
+            logger.info("EMAIL ALERTE: %s\n%s", subject, body)
             
         except Exception as e:
-            logger.error(f"Erreur configuration email: {str(e)}")
+            logger.error("Erreur configuration email: %s", e)
             raise
 
     def get_monitoring_stats(self):
@@ -138,5 +143,10 @@ class SecurityMonitor:
             'running': self.running,
             'last_alert': self.last_alert_time.isoformat() if self.last_alert_time else None,
             'check_interval': self.check_interval,
-            'alert_threshold': self.alert_threshold
+            'alert_threshold': self.alert_threshold,
+            'cleanup': dict(self.security_system.cleanup_stats),
+            'accounts': self.security_system.accounts.get_stats(),
+            'ip_state': self.security_system.state.get_stats(),
+            'snapshot': dict(self.security_system.snapshot_stats),
+            'rollups': self.security_system.rollups.get_stats()
         }
\ No newline at end of file
@@ -0,0 +1,79 @@
+import threading
+import time
+
+# Durées de blocage par niveau de récidive : 1 h, 6 h, 24 h puis 7 jours
+DEFAULT_BLOCK_DURATIONS = (3600, 6 * 3600, 24 * 3600, 7 * 24 * 3600)
+
+
+class OffenseHistory:
+    """Historique des récidives par IP ou préfixe, pour des blocages progressifs
+
+    Chaque clé ne coûte qu'un tuple (niveau, fin du dernier blocage). Le niveau
+    décroît d'un cran par période `decay` passée sans blocage après la fin du
+    dernier : une adresse qui revient aussitôt débloquée monte d'un niveau,
+    une adresse restée tranquille repart du bas de l'échelle.
+    """
+
+    def __init__(self, durations=DEFAULT_BLOCK_DURATIONS, decay=24 * 3600):
+        self.durations = tuple(durations)
+        self.decay = decay
+        self._offenses = {}
+        self._lock = threading.Lock()
+
+    def _effective_level(self, entry, now):
+        level, until = entry
+        if now <= until:
+            return level
+        return max(0, level - int((now - until) // self.decay))
+
+    def level(self, key, now=None):
+        """Niveau de récidive courant d'une clé (0 : aucun antécédent)"""
+        now = time.time() if now is None else now
+        entry = self._offenses.get(key)
+        return self._effective_level(entry, now) if entry else 0
+
+    def escalate(self, key, now=None):
+        """Enregistre un nouveau blocage, renvoie (niveau, durée du blocage en secondes)"""
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._offenses.get(key)
+            level = self._effective_level(entry, now) if entry else 0
+            level = min(level + 1, len(self.durations))
+            duration = self.durations[level - 1]
+            self._offenses[key] = (level, int(now) + duration)
+            return level, duration
+
+    def load(self, key, level, until):
+        """Reprend un antécédent persisté (s'il est plus récent que celui en mémoire)"""
+        with self._lock:
+            entry = self._offenses.get(key)
+            if entry is None or until >= entry[1]:
+                self._offenses[key] = (int(level), int(until))
+
+    def forget(self, key):
+        """Efface les antécédents d'une clé (déblocage manuel)"""
+        with self._lock:
+            self._offenses.pop(key, None)
+
+    def purge(self, now=None):
+        """Supprime les antécédents entièrement oubliés, renvoie le nombre de clés retirées"""
+        now = time.time() if now is None else now
+        with self._lock:
+            stale = [key for key, entry in self._offenses.items() if self._effective_level(entry, now) == 0]
+            for key in stale:
+                del self._offenses[key]
+            return len(stale)
+
+    def __len__(self):
+        return len(self._offenses)
+
+
+def format_duration(seconds):
+    """Durée lisible en français (ex. « 6 heures », « 7 jours », « 12 minutes »)"""
+    seconds = max(0, int(seconds))
+    for unit, singular, plural in ((86400, 'jour', 'jours'), (3600, 'heure', 'heures')):
+        if seconds >= unit:
+            count = round(seconds / unit)
+            return f"{count} {singular if count == 1 else plural}"
+    count = max(1, round(seconds / 60))
+    return f"{count} {'minute' if count == 1 else 'minutes'}"
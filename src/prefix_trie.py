@@ -0,0 +1,113 @@
+class _Node:
+    __slots__ = ('key', 'length', 'value', 'children')
+
+    def __init__(self, key, length, value=None):
+        self.key = key
+        self.length = length
+        self.value = value
+        self.children = [None, None]
+
+
+class PrefixTrie:
+    """Arbre de Patricia (trie binaire compressé) sur des adresses entières
+
+    Les préfixes (réseau, longueur) sont stockés comme des entiers de `bits`
+    bits ; les nœuds sans valeur ne subsistent qu'aux bifurcations. La
+    recherche du plus long préfixe couvrant une adresse coûte O(bits), quel
+    que soit le nombre de règles.
+    """
+
+    def __init__(self, bits):
+        self.bits = bits
+        self._root = _Node(0, 0)
+        self._size = 0
+
+    def _bit(self, key, position):
+        """Bit de rang `position` (0 = bit de poids fort)"""
+        return (key >> (self.bits - position - 1)) & 1
+
+    def _mask(self, key, length):
+        if length == 0:
+            return 0
+        shift = self.bits - length
+        return (key >> shift) << shift
+
+    def _common_length(self, a, b, limit):
+        diff = a ^ b
+        if diff == 0:
+            return limit
+        return min(self.bits - diff.bit_length(), limit)
+
+    def insert(self, key, length, value):
+        """Associe une valeur au préfixe `key/length`"""
+        key = self._mask(key, length)
+        node = self._root
+        while True:
+            if node.length == length:
+                # Invariant : node couvre key, donc même préfixe
+                if node.value is None:
+                    self._size += 1
+                node.value = value
+                return
+
+            bit = self._bit(key, node.length)
+            child = node.children[bit]
+            if child is None:
+                node.children[bit] = _Node(key, length, value)
+                self._size += 1
+                return
+
+            common = self._common_length(child.key, key, min(child.length, length))
+            if common == child.length:
+                node = child
+                continue
+
+            new_node = _Node(key, length, value)
+            self._size += 1
+            if common == length:
+                # Le nouveau préfixe englobe le nœud existant
+                new_node.children[self._bit(child.key, length)] = child
+                node.children[bit] = new_node
+            else:
+                split = _Node(self._mask(key, common), common)
+                split.children[self._bit(child.key, common)] = child
+                split.children[self._bit(key, common)] = new_node
+                node.children[bit] = split
+            return
+
+    def remove(self, key, length):
+        """Retire le préfixe `key/length`, renvoie True s'il existait"""
+        key = self._mask(key, length)
+        parent, node = None, self._root
+        while node is not None and node.length < length:
+            if self._mask(key, node.length) != node.key:
+                return False
+            parent, node = node, node.children[self._bit(key, node.length)]
+
+        if node is None or node.length != length or node.key != key or node.value is None:
+            return False
+
+        node.value = None
+        self._size -= 1
+        # Élagage : un nœud sans valeur et avec au plus un enfant est inutile
+        if parent is not None and node.children.count(None) >= 1:
+            replacement = node.children[0] or node.children[1]
+            parent.children[self._bit(key, parent.length)] = replacement
+        return True
+
+    def longest_match(self, address):
+        """Renvoie (longueur, valeur) du plus long préfixe couvrant l'adresse, ou None"""
+        node = self._root
+        best = None
+        while node is not None:
+            if self._mask(address, node.length) != node.key:
+                break
+            if node.value is not None:
+                best = (node.length, node.value)
+            if node.length == self.bits:
+                break
+            node = node.children[self._bit(address, node.length)]
+        return best
+
+    def __len__(self):
+        return self._size
@@ -0,0 +1,265 @@
+import logging
+import socket
+import time
+from dataclasses import dataclass
+
+from account_guard import AccountGuard
+
+logger = logging.getLogger(__name__)
+
+# Nombre maximal de compartiments renvoyés par une série : au-delà, une
+# granularité plus grossière est exigée (la réponse reste en millisecondes)
+MAX_POINTS = 1500
+
+
+@dataclass(frozen=True)
+class Granularity:
+    """Table d'agrégats d'une granularité : pas, rétention et dimensions conservées"""
+    name: str
+    seconds: int
+    retention: int
+    dimensions: tuple
+
+    @property
+    def table(self):
+        return f'rollup_{self.name}'
+
+
+# Les agrégats par minute ne servent qu'aux courbes récentes : par IP ou par
+# nom d'utilisateur, ils compteraient presque autant de lignes que les tentatives
+GRANULARITIES = {
+    'minute': Granularity('minute', 60, 2 * 24 * 3600, ('all', 'prefix')),
+    'hour': Granularity('hour', 3600, 90 * 24 * 3600, ('all', 'prefix', 'ip', 'username')),
+    'day': Granularity('day', 24 * 3600, 2 * 365 * 24 * 3600, ('all', 'prefix', 'ip', 'username')),
+}
+DIMENSIONS = ('all', 'prefix', 'ip', 'username')
+
+_WATERMARK = 'login_attempts'
+# Valeur d'une tentative pour chaque dimension (NULL : non comptée)
+_ITEM_SQL = {
+    'all': "''",
+    # IPv4 sous forme canonique : le /24 se calcule dans SQLite, le reste passe par Python
+    'prefix': """CASE WHEN ip_address NOT GLOB '*[^0-9.]*'
+                     AND length(ip_address) - length(replace(ip_address, '.', '')) = 3
+                THEN rtrim(ip_address, '0123456789') || '0/24'
+                ELSE attempt_prefix(ip_address) END""",
+    'ip': 'ip_address',
+    'username': 'account_key(username)',
+}
+
+
+def attempt_prefix(ip_address):
+    """Préfixe d'analyse d'une adresse (/24 en IPv4, /64 en IPv6), None si ce n'en est pas une"""
+    try:
+        packed = socket.inet_pton(socket.AF_INET, ip_address)
+        return socket.inet_ntop(socket.AF_INET, packed[:3] + b'\0') + '/24'
+    except (OSError, TypeError):
+        pass
+    try:
+        packed = socket.inet_pton(socket.AF_INET6, ip_address)
+        return socket.inet_ntop(socket.AF_INET6, packed[:8] + bytes(8)) + '/64'
+    except (OSError, TypeError):
+        return None
+
+
+class RollupPipeline:
+    """Agrégats de login_attempts par minute, heure et jour
+
+    Chaque passage lit les tentatives postérieures au dernier identifiant
+    traité (filigrane dans rollup_state), par lots de `batch_size` lignes, et
+    ajoute leurs comptes aux tables rollup_minute, rollup_hour et rollup_day :
+    une ligne par (dimension, valeur, compartiment) où la dimension est
+    'all', 'prefix' (/24, /64), 'ip' ou 'username'. Le lot et le filigrane
+    sont écrits dans la même transaction (BEGIN IMMEDIATE) : un lot n'est
+    jamais compté deux fois, même avec plusieurs workers.
+
+    Les agrégats ont leur propre rétention (2 jours, 90 jours, 2 ans), bien
+    au-delà des 7 jours de tentatives brutes. Les requêtes lisent une plage
+    de la clé primaire : leur coût dépend du nombre de compartiments, pas de
+    la durée couverte ni du volume de tentatives.
+    """
+
+    def __init__(self, db, batch_size=5000, max_batches=20):
+        self.db = db
+        self.batch_size = batch_size
+        # Borne le travail d'un passage (rattrapage d'un historique existant)
+        self.max_batches = max_batches
+        self.stats = {
+            'runs': 0,
+            'last_run': None,
+            'last_duration_ms': 0.0,
+            'last_rows': 0,
+            'total_rows': 0,
+            'last_attempt_id': self._read_watermark(),
+        }
+
+    @property
+    def last_attempt_id(self):
+        """Dernier identifiant de login_attempts déjà agrégé"""
+        return self.stats['last_attempt_id']
+
+    def _read_watermark(self):
+        with self.db.connection() as conn:
+            row = conn.execute('SELECT value FROM rollup_state WHERE name = ?', (_WATERMARK,)).fetchone()
+        return row[0] if row else 0
+
+    def _roll_batch(self):
+        """Agrège un lot de tentatives, renvoie le nombre de lignes lues"""
+        with self.db.connection() as conn:
+            # Verrou d'écriture dès la lecture du filigrane : deux workers ne
+            # peuvent pas agréger le même lot
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT value FROM rollup_state WHERE name = ?', (_WATERMARK,)).fetchone()
+            last_id = row[0] if row else 0
+            count, upper = conn.execute(
+                'SELECT COUNT(*), MAX(id) FROM (SELECT id FROM login_attempts WHERE id > ? ORDER BY id LIMIT ?)',
+                (last_id, self.batch_size)
+            ).fetchone()
+            if not count:
+                self.stats['last_attempt_id'] = last_id
+                return 0
+
+            conn.create_function('attempt_prefix', 1, attempt_prefix, deterministic=True)
+            conn.create_function('account_key', 1, AccountGuard.key, deterministic=True)
+            # Regroupement dans SQLite : le lot est lu une fois par dimension et
+            # compté par minute dans une table temporaire, d'où sont tirés les
+            # comptes par minute, heure et jour (triés dans l'ordre de la clé primaire)
+            conn.execute('''CREATE TEMP TABLE IF NOT EXISTS rollup_batch (
+                dimension TEXT, item TEXT, bucket INTEGER, attempts INTEGER, failures INTEGER
+            )''')
+            conn.execute('DELETE FROM temp.rollup_batch')
+            for dimension in DIMENSIONS:
+                conn.execute(
+                    f'''INSERT INTO temp.rollup_batch (dimension, item, bucket, attempts, failures)
+                    SELECT ?, item, bucket, COUNT(*), SUM(success = 0) FROM (
+                        SELECT {_ITEM_SQL[dimension]} AS item, attempt_time - attempt_time % 60 AS bucket, success
+                        FROM login_attempts WHERE id > ? AND id <= ?
+                    )
+                    WHERE item IS NOT NULL
+                    GROUP BY item, bucket''',
+                    (dimension, last_id, upper)
+                )
+            for granularity in GRANULARITIES.values():
+                for dimension in granularity.dimensions:
+                    conn.execute(
+                        f'''INSERT INTO {granularity.table} (dimension, item, bucket, attempts, failures)
+                        SELECT dimension, item, bucket - bucket % ?, SUM(attempts), SUM(failures)
+                        FROM temp.rollup_batch WHERE dimension = ?
+                        GROUP BY item, bucket - bucket % ?
+                        ON CONFLICT (dimension, item, bucket) DO UPDATE SET
+                            attempts = attempts + excluded.attempts,
+                            failures = failures + excluded.failures''',
+                        (granularity.seconds, dimension, granularity.seconds)
+                    )
+            conn.execute(
+                'INSERT OR REPLACE INTO rollup_state (name, value) VALUES (?, ?)',
+                (_WATERMARK, upper)
+            )
+        self.stats['last_attempt_id'] = upper
+        return count
+
+    def _purge(self, now):
+        """Applique la rétention de chaque granularité"""
+        with self.db.connection() as conn:
+            for granularity in GRANULARITIES.values():
+                placeholders = ', '.join('?' * len(granularity.dimensions))
+                conn.execute(
+                    f'DELETE FROM {granularity.table} WHERE dimension IN ({placeholders}) AND bucket < ?',
+                    (*granularity.dimensions, now - granularity.retention)
+                )
+
+    def run(self, now=None):
+        """Agrège les nouvelles tentatives et purge les agrégats expirés, renvoie le nombre de tentatives lues"""
+        started = time.perf_counter()
+        now = int(time.time()) if now is None else int(now)
+        rows = 0
+        for _ in range(self.max_batches):
+            count = self._roll_batch()
+            rows += count
+            if count < self.batch_size:
+                break
+        self._purge(now)
+
+        duration_ms = (time.perf_counter() - started) * 1000
+        self.stats.update({
+            'runs': self.stats['runs'] + 1,
+            'last_run': now,
+            'last_duration_ms': round(duration_ms, 3),
+            'last_rows': rows,
+            'total_rows': self.stats['total_rows'] + rows,
+        })
+        logger.info("Agrégats mis à jour: %d tentatives jusqu'à l'id %d (%.0f ms)",
+                    rows, self.last_attempt_id, duration_ms)
+        return rows
+
+    @staticmethod
+    def choose_granularity(start, end, dimension='all', now=None):
+        """Granularité la plus fine qui couvre la plage en MAX_POINTS compartiments au plus"""
+        now = time.time() if now is None else now
+        for granularity in GRANULARITIES.values():
+            if (dimension in granularity.dimensions
+                    and start >= now - granularity.retention
+                    and (end - start) / granularity.seconds <= MAX_POINTS):
+                return granularity.name
+        return 'day'
+
+    def query(self, start, end, granularity=None, dimension='all', item=None, limit=20):
+        """Historique agrégé sur [start, end)
+
+        Sans `item` (et hors dimension 'all'), renvoie les `limit` valeurs les
+        plus en échec sur la plage ; sinon la série de la valeur, un point par
+        compartiment (zéros compris). Lève ValueError sur des paramètres invalides.
+        """
+        if dimension not in DIMENSIONS:
+            raise ValueError(f"Dimension inconnue, attendue: {', '.join(DIMENSIONS)}")
+        if end <= start:
+            raise ValueError("La fin de la plage doit suivre son début")
+        if granularity is None:
+            granularity = self.choose_granularity(start, end, dimension)
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Granularité inconnue, attendue: {', '.join(GRANULARITIES)}")
+        spec = GRANULARITIES[granularity]
+        if dimension not in spec.dimensions:
+            raise ValueError(f"Dimension '{dimension}' non agrégée à la granularité '{granularity}'")
+
+        start = int(start) - int(start) % spec.seconds
+        end = int(end)
+        result = {'granularity': granularity, 'from': start, 'to': end, 'dimension': dimension}
+
+        if dimension == 'all' or item is not None:
+            if (end - start) / spec.seconds > MAX_POINTS:
+                raise ValueError(f"Plage trop longue pour la granularité '{granularity}' "
+                                 f"(plus de {MAX_POINTS} points)")
+            if dimension == 'username':
+                item = AccountGuard.key(item)
+            item = '' if dimension == 'all' else item
+            with self.db.connection() as conn:
+                rows = conn.execute(
+                    f'''SELECT bucket, attempts, failures FROM {spec.table}
+                    WHERE dimension = ? AND item = ? AND bucket >= ? AND bucket < ?
+                    ORDER BY bucket''',
+                    (dimension, item, start, end)
+                ).fetchall()
+            counts = {bucket: (attempts, failures) for bucket, attempts, failures in rows}
+            result['key'] = item or None
+            result['series'] = [
+                {'time': bucket, 'attempts': counts.get(bucket, (0, 0))[0],
+                 'failures': counts.get(bucket, (0, 0))[1]}
+                for bucket in range(start, end, spec.seconds)
+            ]
+            return result
+
+        with self.db.connection() as conn:
+            rows = conn.execute(
+                f'''SELECT item, SUM(attempts), SUM(failures) FROM {spec.table}
+                WHERE dimension = ? AND bucket >= ? AND bucket < ?
+                GROUP BY item ORDER BY SUM(failures) DESC, SUM(attempts) DESC LIMIT ?''',
+                (dimension, start, end, max(1, min(limit, 1000)))
+            ).fetchall()
+        result['top'] = [{'key': item, 'attempts': attempts, 'failures': failures}
+                         for item, attempts, failures in rows]
+        return result
+
+    def get_stats(self):
+        """Compteurs pour la surveillance"""
+        return dict(self.stats)
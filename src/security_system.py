@@ -1,197 +1,730 @@
-import sqlite3
-import threading
-from datetime import datetime, timedelta
+import ipaddress
+import itertools
+import os
+import time
+from datetime import datetime
 import logging
 
+from account_guard import AccountGuard
+from attempt_writer import AttemptWriter
+from blocklist import canonical_ip, normalize_block_key
+from database import ConnectionPool, migrate_database
+from event_broker import EventBroker
+from metrics import CHECK_STAGE_SECONDS, LOCK_WAIT_SECONDS, RECORD_STAGE_SECONDS
+from offense_history import OffenseHistory, format_duration
+from rollups import RollupPipeline
+from sliding_window import SlidingWindowCounter
+from snapshot import Snapshot, SnapshotError, read_snapshot, write_snapshot
+from state_backends import LocalStateBackend
+from stats_aggregator import SecurityStatsAggregator
+from striped_lock import StripedLock
+from tarpit import Tarpit
+
 logger = logging.getLogger(__name__)
 
+# Séries de métriques résolues une fois pour toutes (chemin critique)
+_CHECK_BLOCKLIST = CHECK_STAGE_SECONDS.labels('blocklist')
+_CHECK_WINDOW = CHECK_STAGE_SECONDS.labels('window')
+_CHECK_BLOCK = CHECK_STAGE_SECONDS.labels('block')
+_RECORD_AGGREGATE = RECORD_STAGE_SECONDS.labels('aggregate')
+_RECORD_WINDOW = RECORD_STAGE_SECONDS.labels('window')
+_RECORD_PREFIX = RECORD_STAGE_SECONDS.labels('prefix')
+_RECORD_ENQUEUE = RECORD_STAGE_SECONDS.labels('enqueue')
+
+# Taille maximale d'une page de /api/blocked-ips
+BLOCKED_PAGE_MAX = 1000
+
+# Message générique (rejet précalculé, la durée restante est dans Retry-After)
+BLOCKED_MESSAGE = "Votre adresse IP est temporairement bloquée pour cause de tentatives de connexion excessives. Veuillez réessayer plus tard."
+
+def blocked_message(remaining):
+    """Message de blocage indiquant la durée restante (en secondes)"""
+    return ("Votre adresse IP est temporairement bloquée pour cause de tentatives de connexion excessives. "
+            f"Veuillez réessayer dans {format_duration(remaining)}.")
+
+def _chunks(iterable, size):
+    """Découpe un itérable en listes d'au plus `size` éléments"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _escape_like(value):
+    """Échappe les jokers d'un motif LIKE"""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
 class AntiBruteForceSystem:
-    def __init__(self, db_path='security.db'):
+    def __init__(self, db_path='security.db', state_backend=None, lock_stripes=64,
+                 state_memory_limit=64 * 1024 * 1024, snapshot_path=None):
         self.db_path = db_path
+        self.db = ConnectionPool(db_path)
         self.max_attempts = 5
         self.time_window = 900  # 15 minutes en secondes
-        self.block_duration = 3600  # 1 heure en secondes
-        self.lock = threading.Lock()
-        
-    def record_login_attempt(self, ip_address, username, success):
-        """Enregistre une tentative de connexion"""
+        self.block_duration = 3600  # 1 heure en secondes (blocages en masse)
+        # Blocages progressifs : 1 h, 6 h, 24 h puis 7 jours pour les récidivistes,
+        # un niveau oublié par jour passé sans blocage
+        self.offenses = OffenseHistory()
+        # Escalade vers un blocage de préfixe quand trop d'adresses distinctes
+        # d'un même /24 (IPv4) ou /64 (IPv6) échouent dans la fenêtre (0 : désactivée)
+        self.prefix_escalation_threshold = 20
+        self.ipv4_escalation_prefix = 24
+        self.ipv6_escalation_prefix = 64
+        # Rétention des tentatives et purge par lots
+        self.retention_days = 7
+        self.cleanup_batch_size = 5000
+        self.cleanup_pause = 0.01  # secondes entre deux lots
+        self.vacuum_pages = 1000
+        self.cleanup_stats = {
+            'runs': 0,
+            'last_run': None,
+            'last_duration_ms': 0.0,
+            'last_rows_removed': 0,
+            'last_batches': 0,
+            'total_rows_removed': 0,
+        }
+        # Instantané binaire de l'état en mémoire : au redémarrage, seules les
+        # tentatives postérieures sont rejouées (None : reconstruction complète)
+        self.snapshot_path = snapshot_path
+        self.snapshot_max_age = 24 * 3600
+        self.snapshot_stats = {
+            'loaded': False,
+            'replayed_attempts': 0,
+            'last_saved': None,
+            'last_size': 0,
+            'last_duration_ms': 0.0,
+        }
+        # Verrou par IP (réparti sur `lock_stripes` verrous) : la séquence
+        # vérification puis blocage reste atomique pour une IP sans bloquer les autres
+        self.locks = StripedLock(lock_stripes)
+
+        # Fenêtres d'échecs par IP et liste de blocage : la décision ne lit plus
+        # SQLite, la table login_attempts reste le journal d'audit durable.
+        # Un backend partagé (Redis) rend les compteurs communs à tous les workers.
+        # L'état local par IP est borné à `state_memory_limit` octets (IPStateTable).
+        self.state = state_backend or LocalStateBackend(state_memory_limit)
+        self.prefix_failures = SlidingWindowCounter(max_keys=100000)
+        # Échecs par nom d'utilisateur (toutes IPs) et taux global : ralentit
+        # les comptes visés par une attaque répartie sur de nombreuses IPs
+        self.accounts = AccountGuard()
+        # Délais progressifs par IP et par compte (désactivés par défaut) ; actifs,
+        # ils remplacent le blocage au 5e échec par un blocage au 20e
+        self.tarpit = Tarpit()
+        # Statistiques maintenues à chaque tentative plutôt que recalculées par requête
+        self.stats = SecurityStatsAggregator()
+        # Événements de blocage/déblocage poussés au tableau de bord
+        self.events = EventBroker()
+
+        migrate_database(db_path)
+        self._load_state()
+        # Agrégats historiques (minute, heure, jour), alimentés par la surveillance
+        self.rollups = RollupPipeline(self.db)
+
+        # Journal d'audit écrit par lots hors du thread de la requête
+        self.attempt_writer = AttemptWriter(self.db)
+        self._closed = False
+
+    def _load_state(self):
+        """Reconstruit l'état en mémoire à partir de la base de données"""
+        now = int(time.time())
+
+        # Un état partagé survit au redémarrage du processus
+        rebuild_state = not self.state.shared
+
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute(
-                    '''INSERT INTO login_attempts 
-                    (ip_address, username, success, attempt_time) 
-                    VALUES (?, ?, ?, ?)''',
-                    (ip_address, username, 1 if success else 0, datetime.now())
+            with self.db.connection() as conn:
+                if rebuild_state:
+                    cursor = conn.execute(
+                        'SELECT ip_address, unblock_time FROM blocked_ips WHERE unblock_time > ?',
+                        (now,)
+                    )
+                    for ip_address, unblock_time in cursor:
+                        self.state.block(ip_address, unblock_time)
+
+                for ip_address, level, blocked_until in conn.execute(
+                    'SELECT ip_address, offense_level, blocked_until FROM ip_offenses'
+                ):
+                    self.offenses.load(ip_address, level, blocked_until)
+                self.offenses.purge(now)
+
+                snapshot = self._read_snapshot(conn, now)
+                if snapshot is not None:
+                    self._restore_snapshot(conn, snapshot, now, rebuild_state)
+                    return
+
+                total_attempts = conn.execute('SELECT COUNT(*) FROM login_attempts').fetchone()[0]
+
+                # Rejoue les échecs des dernières 24h (fenêtre des statistiques)
+                cursor = conn.execute(
+                    '''SELECT ip_address, username, attempt_time FROM login_attempts 
+                    WHERE success = 0 AND attempt_time > ?
+                    ORDER BY attempt_time''',
+                    (now - 24 * 3600,)
                 )
-                conn.commit()
+                for ip_address, username, attempt_time in cursor:
+                    self.stats.record(ip_address, False, attempt_time)
+                    self._replay_failure(ip_address, username, attempt_time, now, rebuild_state)
+
+                # Les succès ne sont pas rejoués : seul le total les comptabilise
+                self.stats.total_attempts = total_attempts
         except Exception as e:
-            logger.error(f"Erreur enregistrement tentative: {str(e)}")
+            logger.warning("État en mémoire non reconstruit: %s", e)
 
-    def get_recent_failed_attempts(self, ip_address):
-        """Récupère les tentatives échouées récentes pour une IP"""
-        time_threshold = datetime.now() - timedelta(seconds=self.time_window)
-        
+    def _replay_failure(self, ip_address, username, attempt_time, now, rebuild_state):
+        """Rejoue un échec passé dans les fenêtres par compte et par IP"""
+        if attempt_time > now - self.accounts.window:
+            self.accounts.record_failure(username, attempt_time)
+        if rebuild_state and attempt_time > now - self.time_window:
+            self.state.record_failure(ip_address, self.time_window, attempt_time)
+
+    def _read_snapshot(self, conn, now):
+        """Lit l'instantané s'il est utilisable pour cette base, sinon None"""
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return None
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.execute(
-                    '''SELECT COUNT(*) FROM login_attempts 
-                    WHERE ip_address = ? AND success = 0 AND attempt_time > ?''',
-                    (ip_address, time_threshold)
-                )
-                return cursor.fetchone()[0]
+            snapshot = read_snapshot(self.snapshot_path)
+        except (OSError, SnapshotError) as e:
+            logger.warning("Instantané ignoré (%s): %s", self.snapshot_path, e)
+            return None
+        if now - snapshot.created_at > self.snapshot_max_age:
+            logger.info("Instantané trop ancien, reconstruction complète")
+            return None
+        # Base remplacée ou restaurée depuis l'instantané : il ne la décrit pas
+        last_id = conn.execute('SELECT MAX(id) FROM login_attempts').fetchone()[0] or 0
+        if snapshot.last_attempt_id > last_id:
+            logger.warning("Instantané postérieur à la base, reconstruction complète")
+            return None
+        return snapshot
+
+    def _restore_snapshot(self, conn, snapshot, now, rebuild_state):
+        """Recharge l'instantané puis rejoue les tentatives enregistrées depuis"""
+        if snapshot.stats is not None:
+            self.stats.restore(snapshot.stats)
+        for username, stamps in snapshot.account_windows:
+            if stamps and stamps[-1] > now - self.accounts.window:
+                self.accounts.failures.restore(username, stamps)
+        if rebuild_state:
+            for key, stamps in snapshot.ip_windows:
+                if stamps and stamps[-1] > now - self.time_window:
+                    self.state.restore_failures(key, stamps)
+
+        # Parcours par clé primaire : coût proportionnel aux seules nouvelles tentatives
+        replayed = 0
+        cursor = conn.execute(
+            'SELECT ip_address, username, success, attempt_time FROM login_attempts WHERE id > ? ORDER BY id',
+            (snapshot.last_attempt_id,)
+        )
+        for ip_address, username, success, attempt_time in cursor:
+            replayed += 1
+            self.stats.record(ip_address, bool(success), attempt_time)
+            if not success:
+                self._replay_failure(ip_address, username, attempt_time, now, rebuild_state)
+
+        self.snapshot_stats.update({'loaded': True, 'replayed_attempts': replayed})
+        logger.info("État rechargé depuis l'instantané (%d adresses, %d tentatives rejouées)",
+                    len(snapshot.ip_windows), replayed)
+
+    def save_snapshot(self):
+        """Écrit l'instantané de l'état en mémoire, renvoie sa taille en octets (None si désactivé)
+
+        Les tentatives en attente sont d'abord écrites : l'instantané couvre
+        tout identifiant inférieur ou égal au dernier lu. Une tentative
+        enregistrée pendant la copie peut être rejouée une seconde fois au
+        redémarrage (compteurs légèrement majorés, jamais minorés).
+        """
+        if not self.snapshot_path:
+            return None
+        started = time.perf_counter()
+        try:
+            self.attempt_writer.flush(timeout=5)
+            with self.db.connection() as conn:
+                last_id = conn.execute('SELECT MAX(id) FROM login_attempts').fetchone()[0] or 0
+            snapshot = Snapshot(
+                last_attempt_id=last_id,
+                created_at=time.time(),
+                ip_windows=self.state.dump_failures(),
+                account_windows=self.accounts.failures.dump(),
+                stats=self.stats.dump(),
+            )
+            size = write_snapshot(self.snapshot_path, snapshot)
         except Exception as e:
-            logger.error(f"Erreur récupération tentatives: {str(e)}")
-            return 0
+            logger.error("Erreur écriture de l'instantané: %s", e)
+            return None
+
+        duration_ms = (time.perf_counter() - started) * 1000
+        self.snapshot_stats.update({
+            'last_saved': int(snapshot.created_at),
+            'last_size': size,
+            'last_duration_ms': round(duration_ms, 3),
+        })
+        logger.debug("Instantané écrit: %d octets, %d adresses (%.0f ms)", size, len(snapshot.ip_windows), duration_ms)
+        return size
+
+    def record_login_attempt(self, ip_address, username, success):
+        """Enregistre une tentative de connexion"""
+        ip_address = canonical_ip(ip_address)
+        attempt_time = time.time()
+        with _RECORD_AGGREGATE.time():
+            self.stats.record(ip_address, success, attempt_time)
+
+        if not success:
+            account_failures = self.accounts.record_failure(username, attempt_time)
+            with _RECORD_WINDOW.time():
+                lock = self.locks.for_key(ip_address)
+                wait_started = time.perf_counter()
+                with lock:
+                    LOCK_WAIT_SECONDS.observe(time.perf_counter() - wait_started)
+                    failed_attempts = self.state.record_failure(
+                        ip_address, self.time_window, attempt_time
+                    )
+                    # Le seuil est appliqué dès l'échec, sans attendre la prochaine vérification
+                    if failed_attempts >= self.block_threshold() and not self.is_ip_blocked(ip_address):
+                        self.block_ip(ip_address)
+
+            if self.tarpit.enabled:
+                self.tarpit.penalize(ip_address, failed_attempts, attempt_time)
+                if account_failures:
+                    self.tarpit.penalize(('user', self.accounts.key(username)), account_failures, attempt_time)
+
+            # Première erreur de cette adresse dans la fenêtre : une adresse de plus
+            # en échec dans son préfixe (hors du verrou de l'IP, qui n'est pas celui du préfixe)
+            if failed_attempts == 1:
+                with _RECORD_PREFIX.time():
+                    self._track_prefix_failure(ip_address, attempt_time)
+
+        with _RECORD_ENQUEUE.time():
+            self.attempt_writer.submit(
+                (ip_address, username, 1 if success else 0, int(attempt_time))
+            )
+
+    def _escalation_prefix(self, ip_address):
+        """Renvoie le préfixe d'escalade (/24 ou /64) d'une adresse"""
+        address = ipaddress.ip_address(ip_address)
+        # Client IPv4 sur une socket double pile : son /24, jamais ::/64
+        if address.version == 6 and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+        length = self.ipv4_escalation_prefix if address.version == 4 else self.ipv6_escalation_prefix
+        return str(ipaddress.ip_network(f"{address}/{length}", strict=False))
+
+    def _track_prefix_failure(self, ip_address, attempt_time):
+        """Bloque le préfixe d'une IP quand trop d'adresses distinctes y échouent"""
+        if not self.prefix_escalation_threshold:
+            return
+        try:
+            prefix = self._escalation_prefix(ip_address)
+        except ValueError:
+            return
+
+        with self.locks.for_key(prefix):
+            failing_addresses = self.prefix_failures.hit(prefix, self.time_window, attempt_time)
+            if failing_addresses >= self.prefix_escalation_threshold and not self.state.is_blocked(prefix):
+                self.block_ip(prefix, f"Échecs depuis {failing_addresses} adresses du réseau {prefix}")
+                self.prefix_failures.reset(prefix)
+
+    def get_recent_failed_attempts(self, ip_address):
+        """Récupère les tentatives échouées récentes pour une IP"""
+        return self.state.count_failures(canonical_ip(ip_address), self.time_window)
 
     def is_ip_blocked(self, ip_address):
         """Vérifie si une IP est actuellement bloquée"""
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.execute(
-                    '''SELECT 1 FROM blocked_ips 
-                    WHERE ip_address = ? AND unblock_time > ?''',
-                    (ip_address, datetime.now())
-                )
-                return cursor.fetchone() is not None
-        except Exception as e:
-            logger.error(f"Erreur vérification blocage: {str(e)}")
-            return False
+        return self.state.is_blocked(canonical_ip(ip_address))
 
     def block_ip(self, ip_address, reason="Tentatives de connexion excessives"):
-        """Bloque une IP pour la durée définie"""
+        """Bloque une IP ou un préfixe CIDR (ex. 203.0.113.0/24)
+
+        La durée dépend du niveau de récidive : chaque nouveau blocage peu après
+        la fin du précédent monte d'un niveau (1 h, 6 h, 24 h, 7 jours).
+        L'historique est conservé dans ip_offenses au-delà du blocage lui-même.
+        """
         try:
-            unblock_time = datetime.now() + timedelta(seconds=self.block_duration)
-            
-            with sqlite3.connect(self.db_path) as conn:
+            ip_address = normalize_block_key(ip_address)
+            block_time = int(time.time())
+
+            with self.db.connection() as conn:
+                if self.state.shared:
+                    # Un autre worker a pu bloquer cette clé : la base fait foi
+                    row = conn.execute(
+                        'SELECT offense_level, blocked_until FROM ip_offenses WHERE ip_address = ?',
+                        (ip_address,)
+                    ).fetchone()
+                    if row:
+                        self.offenses.load(ip_address, *row)
+                    else:
+                        self.offenses.forget(ip_address)
+                level, duration = self.offenses.escalate(ip_address, block_time)
+                unblock_time = block_time + duration
+                self.state.block(ip_address, unblock_time)
+
                 conn.execute(
                     '''INSERT OR REPLACE INTO blocked_ips 
-                    (ip_address, block_reason, block_time, unblock_time) 
-                    VALUES (?, ?, ?, ?)''',
-                    (ip_address, reason, datetime.now(), unblock_time)
+                    (ip_address, block_reason, block_time, unblock_time, offense_level) 
+                    VALUES (?, ?, ?, ?, ?)''',
+                    (ip_address, reason, block_time, unblock_time, level)
+                )
+                conn.execute(
+                    '''INSERT OR REPLACE INTO ip_offenses (ip_address, offense_level, blocked_until)
+                    VALUES (?, ?, ?)''',
+                    (ip_address, level, unblock_time)
                 )
-                conn.commit()
             
-            logger.warning(f"IP bloquée: {ip_address} - Raison: {reason}")
+            logger.warning("IP bloquée: %s - Raison: %s - Niveau %d (%s)", ip_address, reason, level,
+                           format_duration(duration), extra={'ip': ip_address})
+            self.events.publish('block', self._blocked_entry(ip_address, reason, block_time, unblock_time, level))
             return True
         except Exception as e:
-            logger.error(f"Erreur blocage IP: {str(e)}")
+            logger.error("Erreur blocage IP: %s", e)
             return False
 
+    def block_many(self, entries, reason="Import de liste de blocage", duration=None, chunk_size=5000):
+        """Bloque en masse des IPs/CIDR, en une seule transaction SQLite
+
+        `entries` est un itérable de couples (clé, raison ou None), lu par
+        morceaux de `chunk_size` : la liste n'est jamais chargée en entier.
+        Chaque morceau est écrit par executemany puis appliqué au backend d'état
+        en un seul appel. Un blocage existant qui se termine plus tard (IP déjà
+        escaladée) n'est pas raccourci et garde son niveau de récidive.
+        Renvoie le nombre de clés appliquées et invalides.
+        """
+        block_time = int(time.time())
+        unblock_time = block_time + (duration or self.block_duration)
+        result = {'applied': 0, 'invalid': 0, 'invalid_samples': []}
+
+        def rows():
+            for key, entry_reason in entries:
+                try:
+                    key = normalize_block_key(key)
+                except ValueError:
+                    result['invalid'] += 1
+                    if len(result['invalid_samples']) < 10:
+                        result['invalid_samples'].append(key)
+                    continue
+                yield (key, entry_reason or reason, block_time, unblock_time)
+
+        with self.db.connection() as conn:
+            for chunk in _chunks(rows(), chunk_size):
+                # Un blocage existant plus long (escalade) garde sa fin, sa
+                # raison et son niveau de récidive
+                conn.executemany(
+                    '''INSERT INTO blocked_ips (ip_address, block_reason, block_time, unblock_time)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (ip_address) DO UPDATE SET
+                        block_reason = CASE WHEN excluded.unblock_time > COALESCE(unblock_time, 0)
+                                            THEN excluded.block_reason ELSE block_reason END,
+                        block_time = CASE WHEN excluded.unblock_time > COALESCE(unblock_time, 0)
+                                          THEN excluded.block_time ELSE block_time END,
+                        unblock_time = MAX(COALESCE(unblock_time, 0), excluded.unblock_time)''',
+                    chunk
+                )
+                self.state.block_many([(row[0], unblock_time) for row in chunk])
+                result['applied'] += len(chunk)
+
+        logger.warning("Blocage en masse: %d clés appliquées, %d invalides", result['applied'], result['invalid'])
+        self.events.publish('resync', {'bulk': 'block', 'applied': result['applied']})
+        return result
+
+    def unblock_many(self, entries, chunk_size=5000):
+        """Débloque en masse des IPs/CIDR (couples (clé, raison) comme block_many)"""
+        result = {'applied': 0, 'invalid': 0, 'invalid_samples': []}
+
+        def keys():
+            for key, _ in entries:
+                try:
+                    yield normalize_block_key(key)
+                except ValueError:
+                    result['invalid'] += 1
+                    if len(result['invalid_samples']) < 10:
+                        result['invalid_samples'].append(key)
+
+        with self.db.connection() as conn:
+            for chunk in _chunks(keys(), chunk_size):
+                conn.executemany('DELETE FROM blocked_ips WHERE ip_address = ?', [(key,) for key in chunk])
+                conn.executemany('DELETE FROM ip_offenses WHERE ip_address = ?', [(key,) for key in chunk])
+                self.state.unblock_many(chunk)
+                for key in chunk:
+                    self.offenses.forget(key)
+                result['applied'] += len(chunk)
+
+        logger.info("Déblocage en masse: %d clés appliquées, %d invalides", result['applied'], result['invalid'])
+        self.events.publish('resync', {'bulk': 'unblock', 'applied': result['applied']})
+        return result
+
+    def iter_blocked_ips(self, batch_size=1000):
+        """Parcourt tous les blocages actifs par pages successives (export en flux)
+
+        Chaque page est lue dans sa propre transaction courte : un client lent
+        ne retient pas de connexion du pool pendant l'export.
+        """
+        cursor = None
+        while True:
+            page = self.get_blocked_ips_page(limit=batch_size, cursor=cursor)
+            yield from page['items']
+            cursor = page['next_cursor']
+            if cursor is None:
+                return
+
     def check_and_block(self, ip_address, username):
         """Vérifie les tentatives et bloque si nécessaire"""
-        with self.lock:
-            if self.is_ip_blocked(ip_address):
-                return False, "Votre adresse IP est temporairement bloquée pour cause de tentatives de connexion excessives. Veuillez réessayer dans 1 heure."
+        ip_address = canonical_ip(ip_address)
+        lock = self.locks.for_key(ip_address)
+        wait_started = time.perf_counter()
+        with lock:
+            LOCK_WAIT_SECONDS.observe(time.perf_counter() - wait_started)
+            with _CHECK_BLOCKLIST.time():
+                unblock_time = self.state.get_unblock_time(ip_address)
+            if unblock_time is not None:
+                return False, blocked_message(unblock_time - time.time())
             
-            failed_attempts = self.get_recent_failed_attempts(ip_address)
+            with _CHECK_WINDOW.time():
+                failed_attempts = self.get_recent_failed_attempts(ip_address)
             
-            if failed_attempts >= self.max_attempts:
-                self.block_ip(ip_address)
-                return False, "Trop de tentatives de connexion échouées. Votre adresse IP a été bloquée temporairement."
+            threshold = self.block_threshold()
+            if failed_attempts >= threshold:
+                with _CHECK_BLOCK.time():
+                    self.block_ip(ip_address)
+                unblock_time = self.state.get_unblock_time(ip_address)
+                duration = f" pour {format_duration(unblock_time - time.time())}" if unblock_time else " temporairement"
+                return False, f"Trop de tentatives de connexion échouées. Votre adresse IP a été bloquée{duration}."
             
-            return True, f"Tentatives récentes: {failed_attempts}/{self.max_attempts}"
+            return True, f"Tentatives récentes: {failed_attempts}/{threshold}"
+
+    def block_threshold(self):
+        """Nombre d'échecs dans la fenêtre qui déclenche le blocage de l'IP"""
+        return self.tarpit.block_attempts if self.tarpit.enabled else self.max_attempts
+
+    def next_attempt_delay(self, ip_address, username):
+        """Secondes avant la prochaine tentative autorisée en mode tarpit (0 : immédiate)"""
+        if not self.tarpit.enabled:
+            return 0.0
+        wait = self.tarpit.wait(canonical_ip(ip_address))
+        key = self.accounts.key(username)
+        if key:
+            wait = max(wait, self.tarpit.wait(('user', key)))
+        # Tolérance d'horloge pour une tentative différée par le mode asynchrone
+        return wait if wait > 0.05 else 0.0
+
+    def check_account(self, username):
+        """Délai (secondes) imposé avant une nouvelle tentative sur ce compte, 0 si aucun"""
+        return self.accounts.retry_after(username)
 
     def unblock_ip(self, ip_address):
-        """Débloque manuellement une IP"""
+        """Débloque manuellement une IP ou un préfixe CIDR"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            try:
+                ip_address = normalize_block_key(ip_address)
+            except ValueError:
+                pass
+
+            # Un déblocage manuel repart d'un compteur vierge et sans antécédents
+            self.state.unblock(ip_address)
+            self.state.reset_failures(ip_address)
+            self.offenses.forget(ip_address)
+
+            with self.db.connection() as conn:
                 conn.execute(
                     'DELETE FROM blocked_ips WHERE ip_address = ?',
                     (ip_address,)
                 )
-                conn.commit()
+                conn.execute('DELETE FROM ip_offenses WHERE ip_address = ?', (ip_address,))
             
-            logger.info(f"IP débloquée manuellement: {ip_address}")
+            logger.info("IP débloquée manuellement: %s", ip_address)
+            self.events.publish('unblock', {'ip_address': ip_address})
             return True
         except Exception as e:
-            logger.error(f"Erreur déblocage IP: {str(e)}")
+            logger.error("Erreur déblocage IP: %s", e)
             return False
 
     def get_security_stats(self):
         """Récupère les statistiques de sécurité"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                # Nombre d'IPs bloquées
-                cursor = conn.execute(
-                    'SELECT COUNT(*) FROM blocked_ips WHERE unblock_time > ?',
-                    (datetime.now(),)
-                )
-                blocked_count = cursor.fetchone()[0]
-
-                # Tentatives échouées dernières 24h
-                time_threshold = datetime.now() - timedelta(hours=24)
-                cursor = conn.execute(
-                    'SELECT COUNT(*) FROM login_attempts WHERE success = 0 AND attempt_time > ?',
-                    (time_threshold,)
-                )
-                failed_attempts = cursor.fetchone()[0]
-
-                # Total des connexions
-                cursor = conn.execute('SELECT COUNT(*) FROM login_attempts')
-                total_attempts = cursor.fetchone()[0]
-
-                # Top IPs suspectes
-                cursor = conn.execute('''
-                    SELECT ip_address, COUNT(*) as attempts 
-                    FROM login_attempts 
-                    WHERE success = 0 AND attempt_time > ?
-                    GROUP BY ip_address 
-                    ORDER BY attempts DESC 
-                    LIMIT 5
-                ''', (time_threshold,))
-                top_suspicious = cursor.fetchall()
-
             return {
-                'blocked_ips': blocked_count,
-                'failed_attempts_24h': failed_attempts,
-                'total_attempts': total_attempts,
-                'top_suspicious': [
-                    {'ip': row[0], 'attempts': row[1]} for row in top_suspicious
-                ]
+                'blocked_ips': self.state.blocked_count(),
+                'failed_attempts_24h': self.stats.failures_24h(),
+                'total_attempts': self.stats.total_attempts,
+                'top_suspicious': self.stats.top_suspicious(5),
+                'attack_mode': self.accounts.attack_mode()
             }
         except Exception as e:
-            logger.error(f"Erreur statistiques: {str(e)}")
+            logger.error("Erreur statistiques: %s", e)
             return {}
 
     def get_blocked_ips(self):
         """Récupère la liste des IPs bloquées"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            now = int(time.time())
+            with self.db.connection() as conn:
                 cursor = conn.execute('''
-                    SELECT ip_address, block_reason, block_time, unblock_time 
+                    SELECT ip_address, block_reason, block_time, unblock_time, offense_level 
                     FROM blocked_ips 
                     WHERE unblock_time > ?
                     ORDER BY block_time DESC
-                ''', (datetime.now(),))
+                ''', (now,))
                 
                 blocked_ips = []
                 for row in cursor.fetchall():
                     blocked_ips.append({
                         'ip_address': row[0],
                         'reason': row[1],
-                        'block_time': row[2],
-                        'unblock_time': row[3],
-                        'time_remaining': str((datetime.fromisoformat(row[3]) - datetime.now()).seconds // 60) + ' min'
+                        'block_time': datetime.fromtimestamp(row[2]).isoformat(),
+                        'unblock_time': datetime.fromtimestamp(row[3]).isoformat(),
+                        'time_remaining': str((row[3] - now) // 60) + ' min',
+                        'offense_level': row[4]
                     })
                 
                 return blocked_ips
         except Exception as e:
-            logger.error(f"Erreur récupération IPs bloquées: {str(e)}")
+            logger.error("Erreur récupération IPs bloquées: %s", e)
             return []
 
+    def get_blocked_ips_page(self, limit=100, cursor=None, prefix=None, reason=None):
+        """Récupère une page des blocages actifs, du plus récent au plus ancien
+
+        `cursor` est le `next_cursor` de la page précédente ("block_time:id") ;
+        `prefix` filtre sur le début de l'adresse (ex. "10.0."), `reason` sur une
+        partie de la raison. Les horodatages sont des epoch, le temps restant
+        est calculé par le client. Lève ValueError si le curseur est invalide.
+        """
+        limit = max(1, min(int(limit), BLOCKED_PAGE_MAX))
+        now = int(time.time())
+        clauses = ['unblock_time > ?']
+        params = [now]
+        if cursor:
+            block_time, row_id = (int(part) for part in cursor.split(':', 1))
+            clauses.append('(block_time < ? OR (block_time = ? AND id < ?))')
+            params += [block_time, block_time, row_id]
+        if prefix:
+            clauses.append("ip_address LIKE ? ESCAPE '\\'")
+            params.append(_escape_like(prefix) + '%')
+        if reason:
+            clauses.append("block_reason LIKE ? ESCAPE '\\'")
+            params.append('%' + _escape_like(reason) + '%')
+        params.append(limit + 1)
+
+        try:
+            with self.db.connection() as conn:
+                rows = conn.execute(f'''
+                    SELECT id, ip_address, block_reason, block_time, unblock_time, offense_level
+                    FROM blocked_ips
+                    WHERE {' AND '.join(clauses)}
+                    ORDER BY block_time DESC, id DESC
+                    LIMIT ?
+                ''', params).fetchall()
+        except Exception as e:
+            logger.error("Erreur récupération IPs bloquées: %s", e)
+            rows = []
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = f"{rows[-1][3]}:{rows[-1][0]}"
+        return {
+            'items': [self._blocked_entry(*row[1:]) for row in rows],
+            'next_cursor': next_cursor,
+        }
+
+    def blocked_ips_etag(self):
+        """ETag de la liste des blocages, calculé sans requête SQL
+
+        Change à chaque blocage ou déblocage (version du backend d'état) et
+        à chaque expiration (nombre de blocages actifs).
+        """
+        return f'W/"{self.state.blocklist_version()}-{self.state.blocked_count()}"'
+
+    @staticmethod
+    def _blocked_entry(ip_address, reason, block_time, unblock_time, offense_level=1):
+        """Représentation compacte d'un blocage pour l'API paginée et les événements"""
+        return {
+            'ip_address': ip_address,
+            'reason': reason,
+            'block_time': block_time,
+            'unblock_time': unblock_time,
+            'offense_level': offense_level,
+        }
+
+    def close(self):
+        """Écrit les tentatives en attente et l'instantané, libère les connexions à la base de données"""
+        if self._closed:
+            return
+        self._closed = True
+        self.save_snapshot()
+        self.attempt_writer.stop()
+        self.db.close()
+
     def cleanup_old_records(self):
-        """Nettoie les anciennes entrées de la base de données"""
+        """Nettoie les anciennes entrées de la base de données, par lots bornés
+
+        Les tentatives expirées sont supprimées par plages d'identifiants de
+        `cleanup_batch_size` lignes, chacune dans sa propre transaction, avec une
+        pause entre les lots : le verrou d'écriture n'est jamais tenu longtemps
+        et les insertions des connexions en cours passent entre deux lots.
+        """
+        started = time.perf_counter()
+        removed = 0
+        batches = 0
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                # Supprime les tentatives de connexion vieilles de 7 jours
-                old_attempts = datetime.now() - timedelta(days=7)
-                conn.execute('DELETE FROM login_attempts WHERE attempt_time < ?', (old_attempts,))
-                
+            now = int(time.time())
+            old_attempts = now - self.retention_days * 24 * 3600
+
+            with self.db.connection() as conn:
+                # Les identifiants croissent avec le temps : la plage à purger
+                # va du premier identifiant au dernier antérieur à la limite
+                first_id = conn.execute('SELECT MIN(id) FROM login_attempts').fetchone()[0]
+                row = conn.execute(
+                    'SELECT id FROM login_attempts WHERE attempt_time < ? ORDER BY attempt_time DESC LIMIT 1',
+                    (old_attempts,)
+                ).fetchone()
+                last_id = row[0] if row else None
+
+            # Une tentative n'est supprimée qu'une fois comptée dans les agrégats
+            if last_id is not None and self.rollups.last_attempt_id < last_id:
+                self.rollups.run()
+                last_id = min(last_id, self.rollups.last_attempt_id)
+
+            if first_id is not None and last_id is not None:
+                lower = first_id
+                while lower <= last_id:
+                    upper = min(lower + self.cleanup_batch_size, last_id + 1)
+                    with self.db.connection() as conn:
+                        cursor = conn.execute(
+                            'DELETE FROM login_attempts WHERE id >= ? AND id < ? AND attempt_time < ?',
+                            (lower, upper, old_attempts)
+                        )
+                    removed += cursor.rowcount
+                    batches += 1
+                    self.stats.remove_attempts(cursor.rowcount)
+                    lower = upper
+                    if lower <= last_id:
+                        time.sleep(self.cleanup_pause)
+
+            with self.db.connection() as conn:
                 # Supprime les IPs débloquées
-                conn.execute('DELETE FROM blocked_ips WHERE unblock_time < ?', (datetime.now(),))
-                
-                conn.commit()
+                conn.execute('DELETE FROM blocked_ips WHERE unblock_time < ?', (now,))
+                # ... et les antécédents entièrement oubliés
+                conn.execute(
+                    'DELETE FROM ip_offenses WHERE blocked_until + offense_level * ? <= ?',
+                    (self.offenses.decay, now)
+                )
+
+                # Rend au système les pages libérées (bases en auto_vacuum incrémental)
+                if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+                    conn.execute(f'PRAGMA incremental_vacuum({int(self.vacuum_pages)})').fetchall()
+
+            self.state.purge(self.time_window)
+            self.offenses.purge(now)
+            self.prefix_failures.purge(self.time_window)
+            self.accounts.purge()
+            self.tarpit.purge()
+
+            duration_ms = (time.perf_counter() - started) * 1000
+            self.cleanup_stats.update({
+                'runs': self.cleanup_stats['runs'] + 1,
+                'last_run': now,
+                'last_duration_ms': round(duration_ms, 3),
+                'last_rows_removed': removed,
+                'last_batches': batches,
+                'total_rows_removed': self.cleanup_stats['total_rows_removed'] + removed,
+            })
             
-            logger.info("Nettoyage des anciens enregistrements effectué")
+            logger.info("Nettoyage des anciens enregistrements effectué: %d lignes en %d lots (%.0f ms)", removed, batches, duration_ms)
         except Exception as e:
-            logger.error(f"Erreur nettoyage: {str(e)}")
+            logger.error("Erreur nettoyage: %s", e)
@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import deque
+
+
+class SlidingWindowCounter:
+    """Compteur d'événements en fenêtre glissante, indexé par clé (IP, utilisateur...)
+
+    Chaque clé possède un tampon circulaire borné contenant les horodatages
+    (epoch, en secondes) de ses derniers événements. Le comptage purge les
+    horodatages sortis de la fenêtre puis renvoie la taille du tampon : le coût
+    est O(1) amorti et ne dépend pas de l'historique stocké en base.
+    Le résultat sature à `capacity`, qui doit rester supérieure au seuil de blocage.
+
+    Avec `max_keys`, le nombre de clés est borné : au-delà, la clé utilisée
+    le moins récemment est oubliée (clés contrôlées par le client, ex. noms
+    d'utilisateur). `evictions` compte les clés ainsi retirées.
+    """
+
+    def __init__(self, capacity=64, max_keys=None):
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self.evictions = 0
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def _prune(self, window, threshold):
+        while window and window[0] <= threshold:
+            window.popleft()
+
+    def hit(self, key, window_seconds, timestamp=None):
+        """Ajoute un événement pour la clé et renvoie le nombre d'événements dans la fenêtre"""
+        now = time.time() if timestamp is None else timestamp
+        with self._lock:
+            if self.max_keys is None:
+                window = self._windows.get(key)
+            else:
+                # Réinsertion : l'ordre du dict devient l'ordre d'utilisation
+                window = self._windows.pop(key, None)
+                if window is not None:
+                    self._windows[key] = window
+                elif len(self._windows) >= self.max_keys:
+                    del self._windows[next(iter(self._windows))]
+                    self.evictions += 1
+            if window is None:
+                window = self._windows[key] = deque(maxlen=self.capacity)
+            window.append(now)
+            self._prune(window, now - window_seconds)
+            return len(window)
+
+    def count(self, key, window_seconds, now=None):
+        """Renvoie le nombre d'événements de la clé sur les `window_seconds` dernières secondes"""
+        now = time.time() if now is None else now
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None:
+                return 0
+            self._prune(window, now - window_seconds)
+            if not window:
+                del self._windows[key]
+                return 0
+            return len(window)
+
+    def last(self, key):
+        """Horodatage du dernier événement de la clé, ou None"""
+        with self._lock:
+            window = self._windows.get(key)
+            return window[-1] if window else None
+
+    def dump(self):
+        """Copie des fenêtres : liste de couples (clé, horodatages), pour les instantanés"""
+        with self._lock:
+            return [(key, list(window)) for key, window in self._windows.items()]
+
+    def restore(self, key, stamps):
+        """Recharge la fenêtre d'une clé"""
+        with self._lock:
+            window = self._windows[key] = deque(maxlen=self.capacity)
+            window.extend(stamps)
+
+    def reset(self, key):
+        """Oublie tous les événements d'une clé"""
+        with self._lock:
+            self._windows.pop(key, None)
+
+    def purge(self, window_seconds, now=None):
+        """Supprime les clés dont tous les événements sont expirés, renvoie le nombre de clés retirées"""
+        now = time.time() if now is None else now
+        threshold = now - window_seconds
+        with self._lock:
+            stale = [key for key, window in self._windows.items() if not window or window[-1] <= threshold]
+            for key in stale:
+                del self._windows[key]
+            return len(stale)
+
+    def __len__(self):
+        return len(self._windows)
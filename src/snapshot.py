@@ -0,0 +1,187 @@
+import mmap
+import os
+import struct
+import zlib
+from dataclasses import dataclass, field
+
+# Format binaire (petit-boutiste) :
+#   en-tête   : magic, version, date de création, dernier id de login_attempts, nombre de sections
+#   sections  : étiquette (4 octets), longueur, contenu
+#   fin       : CRC32 de tout ce qui précède
+MAGIC = b'BLKSNAP1'
+# Version 2 : longueur des chaînes sur 32 bits (noms d'utilisateur arbitrairement longs)
+VERSION = 2
+_HEADER = struct.Struct('<8sHdqI')
+_SECTION = struct.Struct('<4sQ')
+_CRC = struct.Struct('<I')
+
+_KEY_INT = 0
+_KEY_STR = 1
+
+
+class SnapshotError(ValueError):
+    """Instantané illisible (tronqué, corrompu ou d'une autre version)"""
+
+
+@dataclass
+class Snapshot:
+    """Contenu d'un instantané de l'état en mémoire
+
+    `last_attempt_id` est le plus grand identifiant de login_attempts couvert :
+    au redémarrage, seules les tentatives suivantes sont rejouées.
+    """
+    last_attempt_id: int
+    created_at: float = 0.0
+    ip_windows: list = field(default_factory=list)        # (clé packée, horodatages)
+    account_windows: list = field(default_factory=list)   # (nom d'utilisateur, horodatages)
+    stats: dict = None                                    # SecurityStatsAggregator.dump()
+
+
+def _pack_str(value):
+    data = value.encode('utf-8')
+    return struct.pack('<I', len(data)) + data
+
+
+def _pack_windows(windows):
+    parts = [struct.pack('<I', len(windows))]
+    for key, stamps in windows:
+        if isinstance(key, int):
+            parts.append(struct.pack('<B', _KEY_INT) + key.to_bytes(16, 'big'))
+        else:
+            parts.append(struct.pack('<B', _KEY_STR) + _pack_str(str(key)))
+        parts.append(struct.pack(f'<H{len(stamps)}d', len(stamps), *stamps))
+    return b''.join(parts)
+
+
+def _pack_stats(stats):
+    parts = [struct.pack('<QqI', stats['total_attempts'], stats['expired_before'], len(stats['minutes']))]
+    parts.extend(struct.pack('<qI', minute, count) for minute, count in stats['minutes'])
+    parts.append(struct.pack('<I', len(stats['hours'])))
+    for hour, counts in stats['hours']:
+        parts.append(struct.pack('<qI', hour, len(counts)))
+        for key, count in counts.items():
+            parts.append(_pack_str(key) + struct.pack('<I', count))
+    return b''.join(parts)
+
+
+def write_snapshot(path, snapshot):
+    """Écrit un instantané de façon atomique (fichier temporaire, fsync, rename), renvoie sa taille"""
+    sections = [(b'IPWN', _pack_windows(snapshot.ip_windows)),
+                (b'ACCT', _pack_windows(snapshot.account_windows))]
+    if snapshot.stats is not None:
+        sections.append((b'STAT', _pack_stats(snapshot.stats)))
+
+    body = [_HEADER.pack(MAGIC, VERSION, snapshot.created_at, snapshot.last_attempt_id, len(sections))]
+    for tag, payload in sections:
+        body.append(_SECTION.pack(tag, len(payload)))
+        body.append(payload)
+    data = b''.join(body)
+    data += _CRC.pack(zlib.crc32(data))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    temporary = f"{path}.tmp"
+    with open(temporary, 'wb') as target:
+        target.write(data)
+        target.flush()
+        os.fsync(target.fileno())
+    os.replace(temporary, path)
+    # Le renommage lui-même doit survivre à une coupure
+    if hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    return len(data)
+
+
+class _Reader:
+    def __init__(self, buffer, offset=0, end=None):
+        self.buffer = buffer
+        self.offset = offset
+        self.end = len(buffer) if end is None else end
+
+    def unpack(self, fmt):
+        size = struct.calcsize(fmt)
+        if self.offset + size > self.end:
+            raise SnapshotError("Instantané tronqué")
+        values = struct.unpack_from(fmt, self.buffer, self.offset)
+        self.offset += size
+        return values
+
+    def read_bytes(self, size):
+        if self.offset + size > self.end:
+            raise SnapshotError("Instantané tronqué")
+        data = bytes(self.buffer[self.offset:self.offset + size])
+        self.offset += size
+        return data
+
+    def read_text(self):
+        (length,) = self.unpack('<I')
+        return self.read_bytes(length).decode('utf-8')
+
+
+def _read_windows(reader):
+    (count,) = reader.unpack('<I')
+    windows = []
+    for _ in range(count):
+        (kind,) = reader.unpack('<B')
+        key = int.from_bytes(reader.read_bytes(16), 'big') if kind == _KEY_INT else reader.read_text()
+        (length,) = reader.unpack('<H')
+        windows.append((key, reader.unpack(f'<{length}d')))
+    return windows
+
+
+def _read_stats(reader):
+    total, expired_before, minute_count = reader.unpack('<QqI')
+    minutes = [reader.unpack('<qI') for _ in range(minute_count)]
+    (hour_count,) = reader.unpack('<I')
+    hours = []
+    for _ in range(hour_count):
+        hour, count = reader.unpack('<qI')
+        counts = {}
+        for _ in range(count):
+            key = reader.read_text()
+            counts[key] = reader.unpack('<I')[0]
+        hours.append((hour, counts))
+    return {'total_attempts': total, 'expired_before': expired_before, 'minutes': minutes, 'hours': hours}
+
+
+def read_snapshot(path):
+    """Charge un instantané via mmap (lève SnapshotError s'il est invalide)"""
+    with open(path, 'rb') as source:
+        size = os.fstat(source.fileno()).st_size
+        if size < _HEADER.size + _CRC.size:
+            raise SnapshotError("Instantané tronqué")
+        with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                return _parse(view, size)
+            finally:
+                view.release()
+
+
+def _parse(view, size):
+    (crc,) = _CRC.unpack_from(view, size - _CRC.size)
+    with view[:size - _CRC.size] as body:
+        if zlib.crc32(body) != crc:
+            raise SnapshotError("Somme de contrôle invalide")
+
+    magic, version, created_at, last_attempt_id, section_count = _HEADER.unpack_from(view, 0)
+    if magic != MAGIC or version != VERSION:
+        raise SnapshotError(f"Format d'instantané inconnu: {magic!r} v{version}")
+
+    snapshot = Snapshot(last_attempt_id=last_attempt_id, created_at=created_at)
+    reader = _Reader(view, _HEADER.size, size - _CRC.size)
+    for _ in range(section_count):
+        tag, length = reader.unpack(_SECTION.format)
+        section = _Reader(view, reader.offset, reader.offset + length)
+        if tag == b'IPWN':
+            snapshot.ip_windows = _read_windows(section)
+        elif tag == b'ACCT':
+            snapshot.account_windows = _read_windows(section)
+        elif tag == b'STAT':
+            snapshot.stats = _read_stats(section)
+        # Les sections inconnues (versions ultérieures) sont ignorées
+        reader.offset += length
+    return snapshot
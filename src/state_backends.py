@@ -0,0 +1,335 @@
+import time
+import uuid
+
+from blocklist import BlocklistIndex, is_prefix
+from ip_state import IPStateTable
+
+
+class StateBackend:
+    """Interface des backends d'état (compteurs d'échecs et liste de blocage)
+
+    `shared` indique un état partagé entre processus et conservé hors du
+    processus : il n'est alors pas reconstruit depuis SQLite au démarrage.
+    """
+
+    shared = False
+
+    def record_failure(self, ip_address, window_seconds, timestamp=None):
+        """Ajoute un échec et renvoie atomiquement le nombre d'échecs dans la fenêtre"""
+        raise NotImplementedError
+
+    def count_failures(self, ip_address, window_seconds, now=None):
+        """Renvoie le nombre d'échecs de l'IP dans la fenêtre"""
+        raise NotImplementedError
+
+    def reset_failures(self, ip_address):
+        """Oublie les échecs d'une IP"""
+        raise NotImplementedError
+
+    def block(self, ip_address, unblock_time):
+        """Bloque une IP jusqu'à `unblock_time` (epoch)"""
+        raise NotImplementedError
+
+    def unblock(self, ip_address):
+        """Débloque une IP"""
+        raise NotImplementedError
+
+    def block_many(self, items):
+        """Bloque plusieurs clés : liste de couples (clé, heure de déblocage)
+
+        Le blocage en cours d'une clé qui se termine plus tard n'est pas raccourci.
+        """
+        raise NotImplementedError
+
+    def unblock_many(self, keys):
+        """Débloque plusieurs clés et oublie leurs échecs"""
+        for ip_address in keys:
+            self.unblock(ip_address)
+            self.reset_failures(ip_address)
+
+    def get_unblock_time(self, ip_address, now=None):
+        """Renvoie l'heure de déblocage d'une IP bloquée, ou None"""
+        raise NotImplementedError
+
+    def is_blocked(self, ip_address, now=None):
+        return self.get_unblock_time(ip_address, now) is not None
+
+    def blocked_count(self, now=None):
+        """Nombre d'IPs actuellement bloquées"""
+        raise NotImplementedError
+
+    def blocklist_version(self):
+        """Jeton changeant à chaque blocage ou déblocage (sert aux ETag)"""
+        raise NotImplementedError
+
+    def purge(self, window_seconds, now=None):
+        """Libère l'état expiré"""
+
+    def get_stats(self):
+        """Compteurs de l'état en mémoire pour la surveillance"""
+        return {}
+
+    def dump_failures(self):
+        """Fenêtres d'échecs à inclure dans un instantané (vide pour un état partagé)"""
+        return []
+
+    def restore_failures(self, key, stamps):
+        """Recharge une fenêtre d'échecs issue d'un instantané"""
+
+
+class LocalStateBackend(StateBackend):
+    """État en mémoire du processus (un seul worker)
+
+    Les fenêtres d'échecs par IP occupent au plus `max_memory` octets
+    (estimation) : voir IPStateTable pour la politique d'éviction.
+    """
+
+    def __init__(self, max_memory=64 * 1024 * 1024):
+        self.failed_attempts = IPStateTable(max_bytes=max_memory)
+        self.blocklist = BlocklistIndex()
+        # Le préfixe distingue les processus : deux workers ne produisent pas le même jeton
+        self._instance = uuid.uuid4().hex[:8]
+        self._version = 0
+
+    def record_failure(self, ip_address, window_seconds, timestamp=None):
+        return self.failed_attempts.hit(ip_address, window_seconds, timestamp)
+
+    def count_failures(self, ip_address, window_seconds, now=None):
+        return self.failed_attempts.count(ip_address, window_seconds, now)
+
+    def reset_failures(self, ip_address):
+        self.failed_attempts.reset(ip_address)
+
+    def block(self, ip_address, unblock_time):
+        self.blocklist.add(ip_address, unblock_time)
+        self._version += 1
+
+    def unblock(self, ip_address):
+        self.blocklist.remove(ip_address)
+        self._version += 1
+
+    def block_many(self, items):
+        for ip_address, unblock_time in items:
+            self.blocklist.add(ip_address, unblock_time, keep_longer=True)
+        self._version += 1
+
+    def unblock_many(self, keys):
+        for ip_address in keys:
+            self.blocklist.remove(ip_address)
+            self.failed_attempts.reset(ip_address)
+        self._version += 1
+
+    def get_unblock_time(self, ip_address, now=None):
+        return self.blocklist.get_unblock_time(ip_address, now)
+
+    def blocked_count(self, now=None):
+        self.blocklist.expire(now)
+        return len(self.blocklist)
+
+    def blocklist_version(self):
+        return f"{self._instance}.{self._version}"
+
+    def purge(self, window_seconds, now=None):
+        self.failed_attempts.purge(window_seconds, now)
+        self.blocklist.expire(now)
+
+    def get_stats(self):
+        return self.failed_attempts.get_stats()
+
+    def dump_failures(self):
+        return self.failed_attempts.dump()
+
+    def restore_failures(self, key, stamps):
+        self.failed_attempts.restore(key, stamps)
+
+
+class RedisStateBackend(StateBackend):
+    """État partagé dans Redis (ou un serveur compatible) entre plusieurs workers
+
+    - échecs : un ensemble trié par IP, horodatages en score ; l'ajout, la purge
+      de la fenêtre et le comptage sont exécutés dans une même transaction
+      MULTI/EXEC, donc atomiques pour tous les processus ;
+    - blocages : une clé par IP expirant à l'heure de déblocage, plus un
+      ensemble trié global pour compter les IPs bloquées ;
+    - préfixes CIDR : un hash partagé et un numéro de version ; chaque processus
+      en garde une copie locale (arbre de Patricia), rechargée quand la version
+      change. La version est lue dans le même aller-retour que la clé de l'IP.
+    """
+
+    shared = True
+
+    def __init__(self, client, key_prefix='blockage:', capacity=64):
+        self.client = client
+        self.key_prefix = key_prefix
+        self.capacity = capacity
+        self._prefixes = BlocklistIndex()
+        self._prefix_version = None
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        """Crée le backend à partir d'une URL redis://"""
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("Le backend Redis nécessite le paquet 'redis' (pip install redis)") from e
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def _failures_key(self, ip_address):
+        return f"{self.key_prefix}fail:{ip_address}"
+
+    def _block_key(self, ip_address):
+        return f"{self.key_prefix}block:{ip_address}"
+
+    @property
+    def _blocked_key(self):
+        return f"{self.key_prefix}blocked"
+
+    @property
+    def _prefixes_key(self):
+        return f"{self.key_prefix}prefixes"
+
+    @property
+    def _prefix_version_key(self):
+        return f"{self.key_prefix}prefixes:version"
+
+    @property
+    def _blocklist_version_key(self):
+        return f"{self.key_prefix}blocked:version"
+
+    def _reload_prefixes(self, version, now):
+        """Recharge la copie locale des préfixes bloqués"""
+        prefixes = BlocklistIndex()
+        for key, unblock_time in self.client.hgetall(self._prefixes_key).items():
+            key = key.decode() if isinstance(key, bytes) else key
+            if float(unblock_time) > now:
+                prefixes.add(key, float(unblock_time))
+        self._prefixes = prefixes
+        self._prefix_version = version
+
+    def record_failure(self, ip_address, window_seconds, timestamp=None):
+        now = time.time() if timestamp is None else timestamp
+        key = self._failures_key(ip_address)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.zremrangebyscore(key, '-inf', now - window_seconds)
+        pipe.zadd(key, {f"{now}:{uuid.uuid4().hex[:8]}": now})
+        # Conserve au plus `capacity` échecs par IP, comme le tampon local
+        pipe.zremrangebyrank(key, 0, -(self.capacity + 1))
+        pipe.zcard(key)
+        pipe.expire(key, int(window_seconds) + 1)
+        return int(pipe.execute()[3])
+
+    def count_failures(self, ip_address, window_seconds, now=None):
+        now = time.time() if now is None else now
+        return int(self.client.zcount(self._failures_key(ip_address), f"({now - window_seconds}", '+inf'))
+
+    def reset_failures(self, ip_address):
+        self.client.delete(self._failures_key(ip_address))
+
+    def block(self, ip_address, unblock_time):
+        ttl = max(1, int(unblock_time - time.time()))
+        pipe = self.client.pipeline(transaction=True)
+        pipe.set(self._block_key(ip_address), unblock_time, ex=ttl)
+        pipe.zadd(self._blocked_key, {ip_address: unblock_time})
+        pipe.incr(self._blocklist_version_key)
+        if is_prefix(ip_address):
+            pipe.hset(self._prefixes_key, ip_address, unblock_time)
+            pipe.incr(self._prefix_version_key)
+        pipe.execute()
+
+    def unblock(self, ip_address):
+        pipe = self.client.pipeline(transaction=True)
+        pipe.delete(self._block_key(ip_address))
+        pipe.zrem(self._blocked_key, ip_address)
+        pipe.incr(self._blocklist_version_key)
+        if is_prefix(ip_address):
+            pipe.hdel(self._prefixes_key, ip_address)
+            pipe.incr(self._prefix_version_key)
+        pipe.execute()
+
+    def block_many(self, items):
+        """Deux allers-retours pour tout le lot : lecture des blocages en cours, puis MULTI/EXEC"""
+        now = time.time()
+        items = list(items)
+        reader = self.client.pipeline(transaction=False)
+        for ip_address, _ in items:
+            reader.get(self._block_key(ip_address))
+        pipe = self.client.pipeline(transaction=True)
+        prefixes = False
+        for (ip_address, unblock_time), current in zip(items, reader.execute()):
+            # Un blocage en cours plus long (escalade) n'est pas raccourci
+            if current is not None and float(current) >= unblock_time:
+                continue
+            pipe.set(self._block_key(ip_address), unblock_time, ex=max(1, int(unblock_time - now)))
+            pipe.zadd(self._blocked_key, {ip_address: unblock_time})
+            if is_prefix(ip_address):
+                pipe.hset(self._prefixes_key, ip_address, unblock_time)
+                prefixes = True
+        pipe.incr(self._blocklist_version_key)
+        if prefixes:
+            pipe.incr(self._prefix_version_key)
+        pipe.execute()
+
+    def unblock_many(self, keys):
+        pipe = self.client.pipeline(transaction=True)
+        prefixes = False
+        for ip_address in keys:
+            pipe.delete(self._block_key(ip_address), self._failures_key(ip_address))
+            pipe.zrem(self._blocked_key, ip_address)
+            if is_prefix(ip_address):
+                pipe.hdel(self._prefixes_key, ip_address)
+                prefixes = True
+        pipe.incr(self._blocklist_version_key)
+        if prefixes:
+            pipe.incr(self._prefix_version_key)
+        pipe.execute()
+
+    def get_unblock_time(self, ip_address, now=None):
+        now = time.time() if now is None else now
+        pipe = self.client.pipeline(transaction=False)
+        pipe.get(self._block_key(ip_address))
+        pipe.get(self._prefix_version_key)
+        value, version = pipe.execute()
+
+        if value is not None and float(value) > now:
+            return float(value)
+        if version is None:
+            return None
+        if version != self._prefix_version:
+            self._reload_prefixes(version, now)
+        return self._prefixes.get_unblock_time(ip_address, now)
+
+    def blocked_count(self, now=None):
+        now = time.time() if now is None else now
+        pipe = self.client.pipeline(transaction=True)
+        pipe.zremrangebyscore(self._blocked_key, '-inf', now)
+        pipe.zcard(self._blocked_key)
+        return int(pipe.execute()[1])
+
+    def blocklist_version(self):
+        version = self.client.get(self._blocklist_version_key)
+        return (version.decode() if isinstance(version, bytes) else str(version)) if version is not None else '0'
+
+    def purge(self, window_seconds, now=None):
+        now = time.time() if now is None else now
+        expired = [
+            key for key, unblock_time in self.client.hgetall(self._prefixes_key).items()
+            if float(unblock_time) <= now
+        ]
+        if expired:
+            pipe = self.client.pipeline(transaction=True)
+            for key in expired:
+                pipe.hdel(self._prefixes_key, key)
+            pipe.incr(self._prefix_version_key)
+            pipe.execute()
+
+
+def create_state_backend(url=None, max_memory=64 * 1024 * 1024):
+    """Crée le backend d'état à partir d'une URL (None ou 'memory://' : état local)
+
+    `max_memory` borne l'état par IP du backend local (octets).
+    """
+    if not url or url.startswith('memory://'):
+        return LocalStateBackend(max_memory)
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisStateBackend.from_url(url)
+    raise ValueError(f"Backend d'état inconnu: {url}")
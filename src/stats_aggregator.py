@@ -0,0 +1,156 @@
+import heapq
+import threading
+import time
+
+MINUTES_PER_DAY = 24 * 60
+HOURS_PER_DAY = 24
+
+
+class SpaceSaving:
+    """Résumé Space-Saving des éléments les plus fréquents d'un flux
+
+    Mémoire bornée à `capacity` compteurs : un élément inconnu remplace le
+    compteur minimal et en hérite (surestimation bornée par ce minimum).
+    """
+
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        self.counts = {}
+
+    def add(self, key, count=1):
+        if key in self.counts:
+            self.counts[key] += count
+        elif len(self.counts) < self.capacity:
+            self.counts[key] = count
+        else:
+            victim = min(self.counts, key=self.counts.get)
+            self.counts[key] = self.counts.pop(victim) + count
+
+    def clear(self):
+        self.counts.clear()
+
+
+class SecurityStatsAggregator:
+    """Agrégats de sécurité maintenus au fil de l'eau
+
+    - compteur total des tentatives enregistrées ;
+    - 1440 compartiments d'une minute pour les échecs des dernières 24h,
+      avec une somme glissante mise à jour à chaque changement de minute ;
+    - un résumé Space-Saving par heure pour les IPs les plus en échec,
+      fusionnés à la lecture (fenêtre de 24h à l'heure près).
+
+    La lecture coûte O(24 x capacité) quel que soit l'historique stocké.
+    """
+
+    def __init__(self, top_capacity=64):
+        self.total_attempts = 0
+        self._minute_ids = [-1] * MINUTES_PER_DAY
+        self._minute_counts = [0] * MINUTES_PER_DAY
+        self._failures_24h = 0
+        self._expired_before = 0
+        self._hour_ids = [-1] * HOURS_PER_DAY
+        self._hour_summaries = [SpaceSaving(top_capacity) for _ in range(HOURS_PER_DAY)]
+        self._lock = threading.Lock()
+
+    def _minute_slot(self, minute):
+        """Renvoie l'index du compartiment de la minute, en recyclant un compartiment périmé"""
+        index = minute % MINUTES_PER_DAY
+        if self._minute_ids[index] != minute:
+            self._failures_24h -= self._minute_counts[index]
+            self._minute_ids[index] = minute
+            self._minute_counts[index] = 0
+        return index
+
+    def _expire(self, now):
+        """Retire de la somme glissante les minutes sorties de la fenêtre de 24h"""
+        oldest = int(now // 60) - MINUTES_PER_DAY + 1
+        # Seules les minutes non encore examinées sont parcourues (coût amorti O(1))
+        for minute in range(max(self._expired_before, oldest - MINUTES_PER_DAY), oldest):
+            index = minute % MINUTES_PER_DAY
+            if self._minute_ids[index] == minute:
+                self._failures_24h -= self._minute_counts[index]
+                self._minute_ids[index] = -1
+                self._minute_counts[index] = 0
+        self._expired_before = max(self._expired_before, oldest)
+
+    def record(self, ip_address, success, timestamp=None):
+        """Comptabilise une tentative de connexion"""
+        now = time.time() if timestamp is None else timestamp
+        with self._lock:
+            self.total_attempts += 1
+            if success:
+                return
+
+            minute = int(now // 60)
+            if minute < self._expired_before or minute < self._minute_ids[minute % MINUTES_PER_DAY]:
+                # Tentative plus ancienne que le contenu du compartiment : hors fenêtre
+                return
+            index = self._minute_slot(minute)
+            self._minute_counts[index] += 1
+            self._failures_24h += 1
+
+            hour = int(now // 3600)
+            slot = hour % HOURS_PER_DAY
+            if self._hour_ids[slot] != hour:
+                self._hour_ids[slot] = hour
+                self._hour_summaries[slot].clear()
+            self._hour_summaries[slot].add(ip_address)
+
+    def dump(self):
+        """État des agrégats sous forme de structures simples, pour les instantanés"""
+        with self._lock:
+            return {
+                'total_attempts': self.total_attempts,
+                'expired_before': self._expired_before,
+                'minutes': [(minute, count) for minute, count in zip(self._minute_ids, self._minute_counts)
+                            if minute >= 0 and count],
+                'hours': [(hour, dict(summary.counts)) for hour, summary in zip(self._hour_ids, self._hour_summaries)
+                          if hour >= 0 and summary.counts],
+            }
+
+    def restore(self, state):
+        """Recharge les agrégats produits par `dump`"""
+        with self._lock:
+            self.total_attempts = state['total_attempts']
+            self._expired_before = state['expired_before']
+            self._minute_ids = [-1] * MINUTES_PER_DAY
+            self._minute_counts = [0] * MINUTES_PER_DAY
+            for minute, count in state['minutes']:
+                index = minute % MINUTES_PER_DAY
+                self._minute_ids[index] = minute
+                self._minute_counts[index] = count
+            self._failures_24h = sum(self._minute_counts)
+            for summary in self._hour_summaries:
+                summary.clear()
+            self._hour_ids = [-1] * HOURS_PER_DAY
+            for hour, counts in state['hours']:
+                slot = hour % HOURS_PER_DAY
+                self._hour_ids[slot] = hour
+                self._hour_summaries[slot].counts.update(counts)
+
+    def remove_attempts(self, count):
+        """Retire du total des tentatives supprimées de la base"""
+        with self._lock:
+            self.total_attempts = max(0, self.total_attempts - count)
+
+    def failures_24h(self, now=None):
+        """Nombre d'échecs sur les dernières 24h"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._expire(now)
+            return self._failures_24h
+
+    def top_suspicious(self, limit=5, now=None):
+        """Renvoie les `limit` IPs ayant le plus d'échecs sur les dernières 24h"""
+        now = time.time() if now is None else now
+        oldest_hour = int(now // 3600) - HOURS_PER_DAY + 1
+        merged = {}
+        with self._lock:
+            for hour, summary in zip(self._hour_ids, self._hour_summaries):
+                if hour < oldest_hour:
+                    continue
+                for ip_address, count in summary.counts.items():
+                    merged[ip_address] = merged.get(ip_address, 0) + count
+
+        top = heapq.nlargest(limit, merged.items(), key=lambda item: item[1])
+        return [{'ip': ip_address, 'attempts': count} for ip_address, count in top]
@@ -0,0 +1,21 @@
+import threading
+
+
+class StripedLock:
+    """Ensemble de verrous répartis par clé (lock striping)
+
+    Chaque clé (IP) est associée à l'un des `stripes` verrous selon son hash :
+    les opérations sur une même IP restent sérialisées, celles sur des IPs
+    différentes tombent le plus souvent sur des verrous distincts et
+    s'exécutent en parallèle.
+    """
+
+    def __init__(self, stripes=64):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def for_key(self, key):
+        """Renvoie le verrou protégeant la clé"""
+        return self._locks[hash(key) % len(self._locks)]
+
+    def __len__(self):
+        return len(self._locks)
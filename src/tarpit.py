@@ -0,0 +1,81 @@
+import threading
+import time
+
+from metrics import REGISTRY
+
+TARPIT_DELAYS = REGISTRY.counter(
+    'blockage_tarpit_delays_total',
+    'Tentatives retardées par le mode tarpit',
+    ('mode',)
+)
+
+
+class Tarpit:
+    """Délais progressifs entre deux tentatives, alternative au blocage immédiat
+
+    Après chaque échec, une clé (IP ou compte) doit attendre un délai qui
+    double à chaque échec récent au-delà de `free_failures` : 0,5 s, 1 s,
+    2 s... jusqu'à `max_delay`. Une faute de frappe isolée ne coûte rien,
+    un attaquant est ralenti de façon exponentielle.
+
+    Seul l'instant de la prochaine tentative autorisée est conservé (un
+    float par clé, au plus `max_keys` clés) : aucun thread n'est immobilisé.
+    Le mode threadé répond 429 avec Retry-After aux tentatives anticipées ;
+    le mode asynchrone diffère la réponse sur la boucle (asyncio.sleep).
+    """
+
+    def __init__(self, enabled=False, base_delay=0.5, max_delay=30.0, free_failures=1,
+                 block_attempts=20, max_keys=100000):
+        self.enabled = enabled
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.free_failures = free_failures
+        # Seuil de blocage franc quand le tarpit est actif (remplace max_attempts)
+        self.block_attempts = block_attempts
+        self.max_keys = max_keys
+        self._not_before = {}
+        self._lock = threading.Lock()
+
+    def delay_for(self, failures):
+        """Délai imposé après `failures` échecs récents"""
+        if not self.enabled or failures <= self.free_failures:
+            return 0.0
+        return min(self.max_delay, self.base_delay * 2 ** (failures - self.free_failures - 1))
+
+    def penalize(self, key, failures, now=None):
+        """Enregistre un échec de la clé, renvoie le délai avant sa prochaine tentative"""
+        delay = self.delay_for(failures)
+        if not delay:
+            return 0.0
+        now = time.time() if now is None else now
+        with self._lock:
+            # Réinsertion : les clés les plus anciennes sont évincées en premier
+            self._not_before.pop(key, None)
+            if len(self._not_before) >= self.max_keys:
+                del self._not_before[next(iter(self._not_before))]
+            self._not_before[key] = now + delay
+        return delay
+
+    def wait(self, key, now=None):
+        """Secondes restantes avant que la clé puisse retenter (0 si autorisée)"""
+        not_before = self._not_before.get(key)
+        if not_before is None:
+            return 0.0
+        now = time.time() if now is None else now
+        return max(0.0, not_before - now)
+
+    def reset(self, key):
+        with self._lock:
+            self._not_before.pop(key, None)
+
+    def purge(self, now=None):
+        """Supprime les clés dont le délai est écoulé, renvoie leur nombre"""
+        now = time.time() if now is None else now
+        with self._lock:
+            expired = [key for key, not_before in self._not_before.items() if not_before <= now]
+            for key in expired:
+                del self._not_before[key]
+            return len(expired)
+
+    def __len__(self):
+        return len(self._not_before)